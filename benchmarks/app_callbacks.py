@@ -0,0 +1,131 @@
+"""Time the Dash callbacks and HTTP routes of ``src/app.py``.
+
+Runs in its own interpreter, since the app loads its data when imported;
+point it at a panel with the PROCESSED_DATA_PATH environment variable.
+Prints one JSON object of timing samples in seconds::
+
+    PROCESSED_DATA_PATH=data/synthetic/processed/synthetic_msa_data.csv python -m benchmarks.app_callbacks
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Prop = Tuple[str, str]
+
+
+def _outputs(key: str) -> List[Dict[str, str]]:
+    """The outputs encoded in a callback_map key, as the renderer sends them."""
+    if not key.startswith(".."):
+        component, prop = key.split(".", 1)
+        return [{"id": component, "property": prop}]
+    outputs = []
+    for output in key.strip(".").split("..."):
+        component, prop = output.split(".", 1)
+        outputs.append({"id": component, "property": prop})
+    return outputs
+
+
+def _payload(app, callback: str, inputs: Dict[Prop, Any], state: Dict[Prop, Any],
+             changed: Prop) -> Dict[str, Any]:
+    """The request body of one callback invocation."""
+    key, spec = next(
+        (key, spec) for key, spec in app.callback_map.items()
+        if getattr(spec.get("callback"), "__name__", None) == callback
+    )
+    outputs = _outputs(key)
+    return {
+        "output": key,
+        "outputs": outputs if key.startswith("..") else outputs[0],
+        "inputs": [dict(item, value=inputs.get((item["id"], item["property"])))
+                   for item in spec["inputs"]],
+        "state": [dict(item, value=state.get((item["id"], item["property"])))
+                  for item in spec["state"]],
+        "changedPropIds": [f"{changed[0]}.{changed[1]}"],
+    }
+
+
+def _time(call, repeat: int) -> List[float]:
+    """Seconds taken by each of ``repeat`` calls; fails on a non-2xx/304 response."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = call()
+        samples.append(time.perf_counter() - start)
+        if response.status_code not in (200, 204, 304):
+            raise RuntimeError(f"Request failed with status {response.status_code}: "
+                               f"{response.get_data(as_text=True)[:200]}")
+    return samples
+
+
+def run(repeat: int = 5) -> Dict[str, List[float]]:
+    """Import the app and time each callback and route ``repeat`` times."""
+    start = time.perf_counter()
+    import src.app as dashboard
+    results = {"app.import": [time.perf_counter() - start]}
+
+    app, data = dashboard.app, dashboard.dataset.current
+    loader = data.loader
+    client = app.server.test_client()
+
+    def callback(name, inputs, changed, state=None):
+        body = _payload(app, name, inputs, state or {}, changed)
+        return lambda: client.post("/_dash-update-component", json=body)
+
+    results["route.layout"] = _time(lambda: client.get("/_dash-layout"), repeat)
+    figure_url = f"/api/map-figure/{data.map_payload.version}"
+    results["route.map_figure"] = _time(
+        lambda: client.get(figure_url, headers={"Accept-Encoding": "gzip"}), repeat)
+    results["route.map_figure.not_modified"] = _time(
+        lambda: client.get(figure_url, headers={"If-None-Match": data.map_payload.etag}), repeat)
+
+    query = str(loader.second_latest_data["RegionName"].iloc[min(1, len(loader.second_latest_data) - 1)])
+    search = {("search-button", "n_clicks"): 1, ("search-results", "page_current"): 0,
+              ("search-results", "page_size"): 10}
+    results["callback.update_search_results.new"] = _time(callback(
+        "update_search_results", search, ("search-button", "n_clicks"),
+        {("search-input", "value"): query.split(",")[0]}), repeat)
+    results["callback.update_search_results.page"] = _time(callback(
+        "update_search_results", {**search, ("search-results", "page_current"): 1},
+        ("search-results", "page_current"), {("search-input", "value"): query[:3]}), repeat)
+
+    dates = len(loader.available_dates)
+    positions = [("latest", "Metro_market_temp_index", max(dates - 2, 0)),
+                 ("history", "Metro_zhvi", dates // 2)]
+    if len(data.forecast_dates):
+        positions.append(("forecast", "Metro_zhvi", dates + len(data.forecast_dates) - 1))
+    for label, metric, position in positions:
+        results[f"callback.update_map.{label}"] = _time(callback(
+            "update_map", {("map-metric", "value"): metric, ("map-date", "value"): position},
+            ("map-date", "value")), repeat)
+
+    results["callback.map_click_to_search"] = _time(callback(
+        "map_click_to_search", {("main-map", "clickData"): {"points": [{"hovertext": query}]}},
+        ("main-map", "clickData")), repeat)
+    # An empty query is rejected before a job is queued, so no model is called
+    results["callback.submit_visualization.empty"] = _time(callback(
+        "submit_visualization", {("submit-query", "n_clicks"): 1}, ("submit-query", "n_clicks"),
+        {("query-input", "value"): ""}), repeat)
+
+    # A finished job with a small figure, as a worker would have stored it
+    store = dashboard.job_queue.store
+    job = store.create("visualization")
+    figure = {"data": [{"type": "bar", "x": list(range(50)), "y": list(range(50))}], "layout": {}}
+    store.finish(job, result={"figure": figure, "code": "fig = px.bar()", "explanation": "Benchmark."})
+    results["route.job_status"] = _time(lambda: client.get(f"/api/jobs/{job['id']}"), repeat)
+    results["callback.show_visualization"] = _time(callback(
+        "show_visualization", {("viz-job-done", "data"): job["id"]}, ("viz-job-done", "data")), repeat)
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point printing the samples as JSON."""
+    parser = argparse.ArgumentParser(description="Time the dashboard's callbacks and routes.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Benchmark suite over synthetic Zillow-shaped data.
+
+Generates wide files and the processed panel at the requested scale, then
+times ingest, the partitioned store, loading, lookups, rankings, snapshots,
+the map figure, answering common questions without the model and the app's
+callbacks. Results are written as JSON; pass ``--baseline`` to compare
+with an earlier run and exit non-zero on regressions::
+
+    python -m benchmarks.run --output benchmarks/results.json
+    python -m benchmarks.run --levels metro county zip --baseline benchmarks/results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from src.data import ingest
+from src.data.cache import PROJECT_ROOT
+from src.data.data_loader import DataLoader
+from src.data.partitioned import PartitionedStore, write_level
+from src.data.rankings import RankingEngine
+from src.data.snapshots import SnapshotEngine
+from src.utils.intents import route
+from src.utils.map_payload import MapPayload
+from src.utils.visualization import create_map_visualization
+
+# Bump when benchmarks are renamed or change what they measure
+RESULTS_FORMAT = 1
+
+# A benchmark regresses when its median grows by more than this share
+REGRESSION_TOLERANCE = 0.25
+
+# Medians below this many seconds are too noisy to compare
+MIN_COMPARED_SECONDS = 0.001
+
+
+def measure(func: Callable[[], Any], repeat: int,
+            setup: Optional[Callable[[], Any]] = None) -> List[float]:
+    """Seconds taken by ``repeat`` calls of ``func``, each after an untimed ``setup``."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    """Statistics of timing samples, in seconds."""
+    values = np.asarray(samples, dtype="float64")
+    return {
+        "n": len(values),
+        "first": round(float(values[0]), 6),
+        "min": round(float(values.min()), 6),
+        "median": round(float(np.median(values)), 6),
+        "mean": round(float(values.mean()), 6),
+        "max": round(float(values.max()), 6),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    """Commit of the working tree, if it is a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_ingest(workdir: str, levels: Sequence[str], counts: Dict[str, int],
+                 years: float, repeat: int) -> Dict[str, List[float]]:
+    """Build the long panel from generated wide files of each geography."""
+    results = {}
+    for level in levels:
+        source = os.path.join(workdir, "zillow", level)
+        synthetic.write_wide_files(source, level, counts[level], years)
+        output = os.path.join(workdir, "ingested", f"{level}.csv")
+        results[f"ingest.{level}"] = measure(
+            lambda: ingest.write_panel(ingest.build_panel(source, None), output), repeat)
+    return results
+
+
+def bench_store(workdir: str, levels: Sequence[str], repeat: int) -> Dict[str, List[float]]:
+    """Partition each ingested level and time lookups that read only what they need."""
+    results = {}
+    root = os.path.join(workdir, "dataset")
+    for level in levels:
+        panel = pd.read_csv(os.path.join(workdir, "ingested", f"{level}.csv"))
+        results[f"store.{level}.write"] = measure(lambda: write_level(panel, root, level), 1)
+        del panel
+        store = PartitionedStore(root, level)
+        names = store.regions["RegionName"].astype(str)
+        picks = names.iloc[np.linspace(0, len(names) - 1, 10).astype(int)]
+        results[f"store.{level}.search_metro"] = [
+            sample for query in picks for sample in measure(lambda: store.search_metro(query), repeat)
+        ]
+        results[f"store.{level}.latest"] = measure(lambda: [store.latest(query) for query in picks], 1)
+
+        def reset_store():
+            store.snapshots.clear()
+            store.rankings = RankingEngine()
+
+        results[f"store.{level}.rank_markets.states"] = measure(
+            lambda: store.rank_markets("Metro_zhvi", states=["TX", "CA"]), repeat, reset_store)
+        results[f"store.{level}.rank_markets.all"] = measure(
+            lambda: store.rank_markets("Metro_zhvi"), repeat, reset_store)
+        results[f"store.{level}.get_snapshot.state"] = measure(
+            lambda: store.get_snapshot(states=["TX"]), repeat, reset_store)
+    return results
+
+
+def bench_loader(panel_path: str, cache_dir: str, repeat: int) -> Dict[str, List[float]]:
+    """Load the panel and time the loader's lookups."""
+    results = {
+        "load_data.csv": measure(lambda: DataLoader(panel_path, cache_dir=None).load_data(), repeat),
+    }
+    DataLoader(panel_path, cache_dir=cache_dir).load_data()
+    results["load_data.snapshot"] = measure(
+        lambda: DataLoader(panel_path, cache_dir=cache_dir).load_data(), repeat)
+
+    loader = DataLoader(panel_path, cache_dir=cache_dir)
+    loader.load_data()
+    names = loader.second_latest_data["RegionName"].astype(str)
+    picks = names.iloc[np.linspace(0, len(names) - 1, 10).astype(int)]
+    # Full names with state, then the bare city part, which matches several metros
+    queries = list(picks) + [name.split(",")[0][:5] for name in picks]
+    results["search_metro"] = [
+        sample for query in queries for sample in measure(lambda: loader.search_metro(query), repeat)
+    ]
+    results["search_page"] = measure(
+        lambda: loader.search_page(queries[-1], 1, 10, [{"column_id": "Date", "direction": "asc"}]),
+        repeat)
+
+    metrics = ["Metro_zhvi", "Metro_market_temp_index", "Metro_invt_fs"]
+
+    def reset_rankings():
+        loader.rankings = RankingEngine()
+
+    results["rank_markets.cold"] = measure(
+        lambda: [loader.rank_markets(metric) for metric in metrics], repeat, reset_rankings)
+    results["rank_markets.warm"] = measure(
+        lambda: [loader.rank_markets(metric, states=["TX", "CA"]) for metric in metrics], repeat)
+
+    dates = loader.available_dates
+    history = dates[np.linspace(0, len(dates) - 1, 12).astype(int)]
+
+    def reset_snapshots():
+        loader.snapshots = SnapshotEngine(loader.data, loader.region_index)
+
+    results["get_snapshot.cold"] = measure(
+        lambda: [loader.get_snapshot(date) for date in history], repeat, reset_snapshots)
+    results["get_snapshot.warm"] = measure(
+        lambda: [loader.get_snapshot(date) for date in history], repeat)
+    results["history"] = measure(lambda: [loader.history(query) for query in picks], repeat)
+
+    def reset_derived():
+        loader.derived = type(loader.derived)(loader.data, loader.region_index)
+
+    results["derived.all_columns"] = measure(
+        lambda: [loader.derived.column(name) for name in loader.derived.names], repeat, reset_derived)
+
+    def reset_profile():
+        loader._profile = None
+
+    results["profile"] = measure(lambda: loader.profile, repeat, reset_profile)
+    results["map.figure"] = measure(
+        lambda: create_map_visualization(loader.second_latest_data), repeat)
+    results["map.payload"] = measure(
+        lambda: MapPayload(loader.second_latest_data, loader.data_version), repeat)
+
+    # The README's example questions, answered without the model
+    city = picks.iloc[1].split(",")[0]
+    questions = ["Show me the hottest real estate markets right now",
+                 f"Compare home prices in {city} over the last 5 years",
+                 "Which cities have the highest price growth rate?",
+                 "Show inventory levels across major cities"]
+    results["intents.route"] = measure(lambda: [route(question, loader) for question in questions], repeat)
+    return results
+
+
+def bench_app(panel_path: str, repeat: int) -> Dict[str, List[float]]:
+    """Time the app's callbacks in a fresh interpreter loading the synthetic panel."""
+    env = dict(os.environ, PROCESSED_DATA_PATH=os.path.abspath(panel_path), SANDBOX_POOL_SIZE="0")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.app_callbacks", "--repeat", str(repeat)],
+        check=True, capture_output=True, text=True, cwd=PROJECT_ROOT, env=env,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Benchmarks whose median grew by more than ``tolerance`` over the baseline."""
+    regressions = []
+    for name, stats in results["benchmarks"].items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None or before["median"] < MIN_COMPARED_SECONDS:
+            continue
+        if stats["median"] > before["median"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {before['median'] * 1000:.1f} ms -> {stats['median'] * 1000:.1f} ms "
+                f"({stats['median'] / before['median'] - 1:+.0%})"
+            )
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point for the benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="benchmarks/results.json",
+                        help="JSON file to write the results to.")
+    parser.add_argument("--baseline", default=None,
+                        help="Earlier results to compare with; regressions exit non-zero.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="Allowed growth of a median over the baseline.")
+    parser.add_argument("--levels", nargs="+", choices=sorted(synthetic.LEVEL_SIZES),
+                        default=["metro"], help="Geographies to time ingest for.")
+    parser.add_argument("--metros", type=int, default=synthetic.LEVEL_SIZES["metro"])
+    parser.add_argument("--counties", type=int, default=synthetic.LEVEL_SIZES["county"])
+    parser.add_argument("--zips", type=int, default=synthetic.LEVEL_SIZES["zip"])
+    parser.add_argument("--years", type=float, default=25, help="Months of history, in years.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs of each benchmark.")
+    parser.add_argument("--ingest-repeat", type=int, default=1, help="Timed runs of each ingest.")
+    parser.add_argument("--skip-app", action="store_true", help="Do not time the app's callbacks.")
+    parser.add_argument("--workdir", default=None,
+                        help="Directory for generated data; a temporary one by default.")
+    args = parser.parse_args(argv)
+
+    counts = {"metro": args.metros, "county": args.counties, "zip": args.zips}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        panel_path = synthetic.panel_path(workdir)
+        ingest.write_panel(synthetic.make_panel(args.metros, args.years), panel_path)
+
+        samples = bench_ingest(workdir, args.levels, counts, args.years, args.ingest_repeat)
+        samples.update(bench_store(workdir, args.levels, args.repeat))
+        samples.update(bench_loader(panel_path, os.path.join(workdir, "cache"), args.repeat))
+        if not args.skip_app:
+            samples.update(bench_app(panel_path, args.repeat))
+        rows = len(pd.read_csv(panel_path, usecols=["RegionID"]))
+
+    results = {
+        "format": RESULTS_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "scale": {
+            "years": args.years,
+            "panel_rows": rows,
+            "ingest_regions": {level: counts[level] for level in args.levels},
+        },
+        "benchmarks": {name: summarize(values) for name, values in samples.items()},
+    }
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w") as handle:
+        json.dump(results, handle, indent=2)
+
+    width = max(len(name) for name in results["benchmarks"])
+    for name, stats in results["benchmarks"].items():
+        print(f"{name:<{width}}  median {stats['median'] * 1000:10.2f} ms  "
+              f"max {stats['max'] * 1000:10.2f} ms")
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        if baseline.get("format") != RESULTS_FORMAT:
+            sys.exit(f"Baseline {args.baseline} has results format {baseline.get('format')}, "
+                     f"expected {RESULTS_FORMAT}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit("Regressions over the baseline:\n" + "\n".join(regressions))
+        print(f"No regressions over {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Synthetic Zillow-shaped data for benchmarks.
+
+Writes wide Zillow files (one CSV per metric, one column per month) for
+metros, counties or ZIP codes, and the processed long metro panel::
+
+    python -m benchmarks.synthetic --output data/synthetic --metros 900 --years 25
+"""
+
+import argparse
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.data import ingest
+
+# Number of regions of each geography at full scale
+LEVEL_SIZES = {"metro": 900, "county": 3000, "zip": 30000}
+
+# File prefix and RegionType of each geography
+LEVEL_PREFIXES = {"metro": "Metro", "county": "County", "zip": "Zip"}
+LEVEL_TYPES = {"metro": "msa", "county": "county", "zip": "zip"}
+
+# Last month of every synthetic panel
+END_DATE = "2024-10-31"
+
+STATES = [
+    "AK", "AL", "AR", "AZ", "CA", "CO", "CT", "DC", "DE", "FL", "GA", "HI", "IA",
+    "ID", "IL", "IN", "KS", "KY", "LA", "MA", "MD", "ME", "MI", "MN", "MO", "MS",
+    "MT", "NC", "ND", "NE", "NH", "NJ", "NM", "NV", "NY", "OH", "OK", "OR", "PA",
+    "PR", "RI", "SC", "SD", "TN", "TX", "UT", "VA", "VT", "WA", "WI", "WV", "WY",
+]
+
+_NAME_STEMS = [
+    "Spring", "Oak", "Lake", "River", "Cedar", "Maple", "Green", "Fair", "Clear",
+    "Rock", "Pine", "Elm", "Mill", "Bay", "Glen", "Ash", "Fox", "Stone", "Wood", "Sun",
+]
+_NAME_ENDINGS = ["field", "ville", "ton", "burg", "port", "dale", "wood", "view",
+                 "ford", "haven", "land", "mont"]
+
+# Panel metric: (first month, kind, typical latest value, spread across
+# regions, share of regions reporting it). Kinds are "level" for prices
+# that trend, "count" for counts that scale with region size (the typical
+# value is the national total) and "ratio" for bounded rates and indexes.
+METRICS = {
+    "zhvi": ("2000-01-31", "level", 250000, 0.5, 0.96),
+    "zori": ("2015-01-31", "level", 1500, 0.35, 0.7),
+    "zordi": ("2020-06-30", "ratio", 80, 25, 0.9),
+    "median_sale_price": ("2018-08-31", "level", 260000, 0.5, 0.77),
+    "mlp": ("2018-03-31", "level", 300000, 0.5, 0.99),
+    "new_con_median_sale_price": ("2018-01-31", "level", 380000, 0.4, 0.16),
+    "total_transaction_value": ("2018-08-31", "count", 2e11, 1.0, 0.77),
+    "market_temp_index": ("2018-01-31", "ratio", 52, 15, 0.99),
+    "invt_fs": ("2018-03-31", "count", 1.2e6, 1.0, 0.99),
+    "mean_doz_pending": ("2018-03-31", "ratio", 43, 12, 0.78),
+    "mean_sale_to_list": ("2018-03-31", "ratio", 0.98, 0.02, 0.67),
+    "new_listings": ("2018-03-31", "count", 4e5, 1.0, 0.99),
+    "new_con_sales_count_raw": ("2018-01-31", "count", 4e4, 1.0, 0.34),
+    "pct_sold_above_list": ("2018-03-31", "ratio", 0.26, 0.1, 0.67),
+    "perc_listings_price_cut": ("2018-03-31", "ratio", 0.16, 0.05, 0.99),
+    "sales_count_now": ("2008-02-29", "count", 4e5, 1.0, 0.1),
+}
+
+# Share of reported months left empty at random
+MISSING_SHARE = 0.02
+
+
+def month_ends(years: float, end: str = END_DATE) -> pd.DatetimeIndex:
+    """The last ``years`` years of month-end dates up to ``end``."""
+    return pd.date_range(end=end, periods=max(int(round(years * 12)), 1), freq=pd.offsets.MonthEnd())
+
+
+def _region_names(level: str, count: int) -> List[str]:
+    """Distinct place names, numbered once the stems run out."""
+    if level == "zip":
+        return [f"{10001 + i:05d}" for i in range(count)]
+    names = []
+    for i in range(count):
+        stem = _NAME_STEMS[i % len(_NAME_STEMS)]
+        ending = _NAME_ENDINGS[(i // len(_NAME_STEMS)) % len(_NAME_ENDINGS)]
+        cycle = i // (len(_NAME_STEMS) * len(_NAME_ENDINGS))
+        name = f"{stem}{ending}" + (f" {cycle + 1}" if cycle else "")
+        names.append(f"{name} County" if level == "county" else name)
+    return names
+
+
+def make_regions(level: str = "metro", count: Optional[int] = None, seed: int = 0) -> pd.DataFrame:
+    """Identifying columns of ``count`` regions, largest first.
+
+    The metro level starts with the United States row, as Zillow's files do.
+    """
+    count = LEVEL_SIZES[level] if count is None else count
+    rng = np.random.default_rng(seed)
+    states = rng.choice(STATES, size=count)
+    names = _region_names(level, count)
+    regions = pd.DataFrame({
+        "RegionID": np.arange(count) + {"metro": 100000, "county": 1000, "zip": 50000}[level],
+        "SizeRank": np.arange(count),
+        "RegionName": [name if level == "zip" else f"{name}, {state}"
+                       for name, state in zip(names, states)],
+        "RegionType": LEVEL_TYPES[level],
+        "StateName": states.astype(object),
+    })
+    if level == "metro" and count:
+        regions.loc[0, ["RegionName", "RegionType", "StateName"]] = ["United States", "country", np.nan]
+    return regions
+
+
+def _values(kind: str, typical: float, spread: float, sizes: np.ndarray,
+            months: int, rng: np.random.Generator) -> np.ndarray:
+    """Region x month matrix of one metric."""
+    count = len(sizes)
+    season = np.sin(np.arange(months) * 2 * np.pi / 12)
+    if kind == "level":
+        base = typical * np.exp(rng.normal(0, spread, (count, 1)))
+        growth = rng.normal(0.003, 0.006, (count, months)).cumsum(axis=1)
+        # Anchored so the latest month is near the typical value
+        values = base * np.exp(growth - growth[:, -1:]) * (1 + 0.01 * season)
+    elif kind == "count":
+        base = typical * sizes[:, None] * np.exp(rng.normal(0, spread / 2, (count, 1)))
+        values = np.round(base * (1 + 0.15 * season) * rng.lognormal(0, 0.1, (count, months)))
+    else:
+        base = rng.normal(typical, spread, (count, 1))
+        values = base + spread * 0.3 * season + rng.normal(0, spread * 0.1, (count, months))
+        if typical < 1:
+            # Shares and sale-to-list ratios are never negative
+            values = np.maximum(values, 0)
+    return values
+
+
+def make_wide(regions: pd.DataFrame, metric: str, dates: pd.DatetimeIndex,
+              seed: int = 0) -> pd.DataFrame:
+    """One metric in Zillow's wide layout: ID columns, then one column per month."""
+    first, kind, typical, spread, coverage = METRICS[metric]
+    rng = np.random.default_rng([seed, sorted(METRICS).index(metric)])
+    # Region sizes fall off with rank roughly as Zillow's metro counts do
+    sizes = 1 / (regions["SizeRank"].to_numpy() + 1) ** 1.3
+    values = _values(kind, typical, spread, sizes, len(dates), rng)
+    values[:, dates < pd.Timestamp(first)] = np.nan
+    values[rng.random(len(regions)) > coverage] = np.nan
+    values[rng.random(values.shape) < MISSING_SHARE] = np.nan
+    months = pd.DataFrame(values, columns=dates.strftime("%Y-%m-%d"), index=regions.index)
+    wide = pd.concat([regions[ingest.ID_COLUMNS], months], axis=1)
+    # Zillow files only list regions that report the metric at all
+    return wide[~np.isnan(values).all(axis=1)].reset_index(drop=True)
+
+
+def wide_file_name(level: str, metric: str) -> str:
+    """File name in Zillow's style, which ``ingest.metric_name`` maps back to the metric."""
+    return f"{LEVEL_PREFIXES[level]}_{metric}_uc_sfrcondo_sm_month.csv"
+
+
+def write_wide_files(directory: str, level: str = "metro", count: Optional[int] = None,
+                     years: float = 25, seed: int = 0,
+                     metrics: Optional[Sequence[str]] = None) -> Dict[str, str]:
+    """Write one wide file per metric into ``directory`` and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    regions = make_regions(level, count, seed)
+    dates = month_ends(years)
+    paths = {}
+    for metric in metrics or sorted(METRICS):
+        path = os.path.join(directory, wide_file_name(level, metric))
+        make_wide(regions, metric, dates, seed).to_csv(path, index=False)
+        paths[metric] = path
+    return paths
+
+
+def make_coordinates(regions: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    """Random coordinates within the contiguous United States, indexed by RegionID."""
+    rng = np.random.default_rng([seed, 1])
+    return pd.DataFrame({
+        "latitude": rng.uniform(25, 49, len(regions)),
+        "longitude": rng.uniform(-124, -67, len(regions)),
+    }, index=pd.Index(regions["RegionID"], name="RegionID"))
+
+
+def make_panel(count: Optional[int] = None, years: float = 25, seed: int = 0) -> pd.DataFrame:
+    """The processed long metro panel, as ``src.data.ingest`` would build it."""
+    regions = make_regions("metro", count, seed)
+    dates = month_ends(years)
+    frames = {f"Metro_{metric}": make_wide(regions, metric, dates, seed) for metric in sorted(METRICS)}
+    metrics = [ingest.melt_metric(frame, metric) for metric, frame in frames.items()]
+    return ingest.assemble_panel(
+        metrics, ingest.region_attributes(frames.values()), make_coordinates(regions, seed)
+    )
+
+
+def panel_path(directory: str) -> str:
+    """Path of the processed panel written under ``directory``.
+
+    Its name differs from the real panel's, so their snapshots never
+    replace each other.
+    """
+    return os.path.join(directory, "processed", "synthetic_msa_data.csv")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point writing wide files and the processed panel."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="data/synthetic",
+                        help="Directory to write into.")
+    parser.add_argument("--levels", nargs="+", choices=sorted(LEVEL_SIZES), default=["metro"],
+                        help="Geographies to write wide files for.")
+    parser.add_argument("--metros", type=int, default=LEVEL_SIZES["metro"])
+    parser.add_argument("--counties", type=int, default=LEVEL_SIZES["county"])
+    parser.add_argument("--zips", type=int, default=LEVEL_SIZES["zip"])
+    parser.add_argument("--years", type=float, default=25, help="Months of history, in years.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    counts = {"metro": args.metros, "county": args.counties, "zip": args.zips}
+    for level in args.levels:
+        directory = os.path.join(args.output, "zillow", level)
+        write_wide_files(directory, level, counts[level], args.years, args.seed)
+        print(f"Wrote {len(METRICS)} wide {level} files for {counts[level]:,} regions to {directory}")
+    panel = make_panel(args.metros, args.years, args.seed)
+    path = panel_path(args.output)
+    ingest.write_panel(panel, path)
+    print(f"Wrote {len(panel):,} panel rows to {path}")
+
+
+if __name__ == "__main__":
+    main()
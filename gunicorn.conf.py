@@ -0,0 +1,51 @@
+"""Gunicorn settings for the dashboard.
+
+The master imports the app, and with it the panel, before forking, then
+builds the loader's lazy structures and freezes the garbage collector's view
+of them. Workers share those pages instead of each loading a private copy,
+so per-worker memory stays nearly flat as workers are added::
+
+    gunicorn -c gunicorn.conf.py src.app:server
+
+Set GUNICORN_PRELOAD=0 to have every worker load its own copy instead.
+"""
+
+import gc
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8050")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+# Visualization jobs run in background threads; callbacks themselves are quick
+timeout = 120
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    """Prepare the preloaded data for sharing, once, in the master."""
+    if not preload_app:
+        return
+    import src.app as dashboard
+    from src.utils import intents
+    from src.utils.visualization import close_sandbox
+
+    # The master serves nothing, so its code workers would only sit idle;
+    # each web worker starts its own spawner over the shared data instead
+    close_sandbox()
+    dashboard.dataset.current.loader.warm()
+    intents.warm()
+    # Move everything allocated so far out of the collector's generations, so
+    # collections in the workers never write to the shared objects' pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Start the code execution workers of a web worker while it has one thread."""
+    if not preload_app:
+        return
+    import src.app as dashboard
+    from src.utils.visualization import get_sandbox
+
+    loader = dashboard.dataset.current.loader
+    get_sandbox(loader.data, loader.second_latest_data, loader)
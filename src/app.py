@@ -1,47 +1,326 @@
 """Main application file for the Real Estate Analytics Dashboard."""
 
+import json
 import os
 import sys
+import time
+from typing import Dict, Optional, Tuple
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import dash
-from dash import Dash, Input, Output, State, html, dcc, callback_context
+from dash import Dash, Input, Output, Patch, State, html, dcc, callback_context
 import plotly.express as px
+import plotly.io as pio
+import numpy as np
 import pandas as pd
+from flask import Response, g, has_request_context, jsonify, redirect, request
 
+from src.config import PROCESSED_DATA_PATH
+from src.data import cache, forecast, views
 from src.data.data_loader import DataLoader
+from src.data.versions import DatasetHandle
 from src.layouts.dashboard import create_dashboard_layout
-from src.utils.visualization import generate_custom_visualization
+from src.utils.jobs import JobQueue
+from src.utils import metrics
+from src.utils.map_payload import MapPayload
+from src.utils.table import table_columns, table_records
+from src.utils.visualization import (
+    answer_directly, close_sandbox, generate_custom_visualization, get_sandbox, map_customdata,
+    viz_cache,
+)
+
+# Generated code edits views of the shared frames; on pandas 2 this makes
+# those edits copy instead of writing through to the frames
+views.enable_copy_on_write()
 
 # Initialize the Dash app
 app = Dash(__name__, suppress_callback_exceptions=True)
 
-# Initialize data loader and load data
-data_loader = DataLoader("data/processed/geocoded_msa_data.csv")
-data = data_loader.load_data()
+# WSGI entry point: gunicorn -c gunicorn.conf.py src.app:server
+server = app.server
+
+
+class DashboardData:
+    """One version of the data and everything the app builds from it.
+
+    Built in full before it serves a request: the loader's indexes and map
+    matrices, the serialized map figure, the page layout and the code
+    execution workers.
+    """
+
+    def __init__(self, key: str, previous: Optional["DashboardData"] = None):
+        """Load the processed data as it is on disk now.
+
+        After an incremental ingest the rows it added are merged into
+        ``previous``'s panel instead of reloading the whole file.
+        """
+        self.key = key
+        self.loader = DataLoader(PROCESSED_DATA_PATH)
+        if previous is None or not self.loader.load_update(previous.loader):
+            self.loader.load_data()
+        self.loader.warm(derived=False)
+
+        # The map figure is serialized once per data version and served separately
+        self.map_payload = MapPayload(self.loader.second_latest_data, self.loader.data_version)
+
+        # The map slider runs through the panel months, then any forecast months
+        self.forecasts = self.loader.forecasts
+        self.forecast_dates = (
+            self.forecasts.dates[self.forecasts.dates > self.loader.available_dates[-1]]
+            if self.forecasts is not None else pd.DatetimeIndex([])
+        )
+        self.layout = create_dashboard_layout(
+            self.loader.second_latest_data,
+            app.get_relative_path(f"/api/map-figure/{self.map_payload.version}"),
+            self.loader.available_dates,
+            self.forecast_dates)
+
+        # Columns of the snapshot metric matrices holding the map's markers, in order
+        self.map_positions = self.loader.region_index.positions(
+            self.loader.second_latest_data['RegionID'].to_numpy())
+        self._color_ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        self._forecast_matrices: Dict[str, np.ndarray] = {}
+
+        # Start the code execution workers of this version; on a reload the
+        # spawner loads it from disk, so the watcher thread never forks
+        get_sandbox(self.loader.data, self.loader.second_latest_data, self.loader)
+
+    def color_range(self, metric: str) -> Tuple[Optional[float], Optional[float]]:
+        """Color scale bounds of a metric over every month, ignoring outliers."""
+        if metric not in self._color_ranges:
+            values = self.loader.snapshots.metric_matrix(metric)[:, self.map_positions]
+            values = values[~np.isnan(values)]
+            if len(values) == 0:
+                self._color_ranges[metric] = (None, None)
+            else:
+                low, high = np.percentile(values, [2, 98])
+                self._color_ranges[metric] = (float(low), float(high))
+        return self._color_ranges[metric]
+
+    def forecast_matrix(self, metric: str) -> np.ndarray:
+        """Forecasts of a metric for the map's markers, one row per forecast month."""
+        if metric not in self._forecast_matrices:
+            rows = self.forecasts.dates.get_indexer(self.forecast_dates)
+            region_ids = self.loader.second_latest_data['RegionID'].to_numpy()
+            self._forecast_matrices[metric] = self.forecasts.matrix(metric, region_ids)[rows]
+        return self._forecast_matrices[metric]
+
+
+def _data_fingerprint() -> str:
+    """Version of the processed data on disk, and whether its forecasts are built."""
+    try:
+        version = cache.fingerprint([PROCESSED_DATA_PATH])
+    except FileNotFoundError:
+        return "missing"
+    paths = forecast.forecast_paths(PROCESSED_DATA_PATH, version)
+    return f"{version}:{int(all(os.path.exists(path) for path in paths.values()))}"
+
+
+def _retire(data: DashboardData) -> None:
+    """Free what a replaced version holds outside this process's heap."""
+    close_sandbox(data.loader.data)
+    # A reload that only adds forecasts keeps the data version and its entries
+    if data.loader.data_version != dataset.current.loader.data_version:
+        viz_cache.retire(data.loader.data_version)
+
+
+# The current data version; a new one is built in the background and swapped
+# in when the processed data changes, while requests and jobs that started
+# on the old version finish on it
+dataset = DatasetHandle(DashboardData, _data_fingerprint, _retire)
+
+# Visualization requests run here instead of in the request thread
+job_queue = JobQueue()
+
+
+def _data() -> DashboardData:
+    """The data version leased by the current request, or the latest one."""
+    lease = g.get("dataset") if has_request_context() else None
+    return lease.value if lease is not None else dataset.current
+
+
+@app.server.before_request
+def _lease_data_version():
+    dataset.watch()
+    g.dataset = dataset.acquire()
+
+
+@app.server.teardown_request
+def _release_data_version(exc):
+    lease = g.pop("dataset", None)
+    if lease is not None:
+        lease.release()
+
+
+def _serve_layout():
+    """The page layout of the data version serving this request."""
+    return _data().layout
+
+
+app.layout = _serve_layout
+
+
+# Latency and response size of every request, labelled with the Dash
+# callback for callback requests; nothing is hooked in when metrics are off
+def _callback_name(output) -> str:
+    """Name of the server callback that updates ``output``.
+
+    ``output`` comes from the request body, so anything that is not a
+    registered output gets one label instead of a label per value.
+    """
+    entry = app.callback_map.get(output) if isinstance(output, str) else None
+    return getattr(entry and entry.get("callback"), "__name__", "unknown")
+
+
+if metrics.registry.enabled:
+    @app.server.before_request
+    def _start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.server.after_request
+    def _record_request_metrics(response):
+        if "request_start" not in g:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        body = request.get_json(silent=True) if request.path.endswith("/_dash-update-component") else None
+        callback = _callback_name(body.get("output", "")) if isinstance(body, dict) else ""
+        metrics.request_seconds.observe(time.perf_counter() - g.request_start,
+                                        endpoint=endpoint, callback=callback)
+        if response.content_length is not None:
+            metrics.response_bytes.observe(response.content_length, endpoint=endpoint, callback=callback)
+        return response
+
+
+def _caches():
+    """The lookup caches whose hits and misses are reported."""
+    loader = dataset.current.loader
+    return {
+        "snapshots": loader.snapshots.cache,
+        "rankings": loader.rankings.cache,
+        "visualizations": viz_cache,
+    }
+
 
-# Set the app layout
-app.layout = create_dashboard_layout(
-    data_loader.second_latest_data)
+metrics.registry.collector(
+    "cache_hits_total", "Lookups answered from a cache.", "counter",
+    lambda: [({"cache": name}, cache.hits) for name, cache in _caches().items()])
+metrics.registry.collector(
+    "cache_misses_total", "Lookups a cache could not answer.", "counter",
+    lambda: [({"cache": name}, cache.misses) for name, cache in _caches().items()])
+metrics.registry.collector(
+    "data_versions_live", "Data versions in memory: the current one and any still leased.",
+    "gauge", lambda: [({}, len(dataset.live_versions()))])
+
+
+@app.server.route("/metrics")
+def metrics_endpoint():
+    """Metrics of this process in the Prometheus text format."""
+    if not metrics.registry.enabled:
+        return Response("Metrics are disabled\n", status=404, mimetype="text/plain")
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.server.route("/api/map-figure/<version>")
+def map_figure(version):
+    """The main map figure; old versions redirect to the current one."""
+    payload = _data().map_payload
+    if version != payload.version:
+        return redirect(app.get_relative_path(f"/api/map-figure/{payload.version}"))
+    return payload.response(request)
+
+
+app.clientside_callback(
+    """
+    function(url) {
+        if (!url) {
+            return window.dash_clientside.no_update;
+        }
+        return fetch(url).then(response => response.json());
+    }
+    """,
+    Output('main-map', 'figure'),
+    Input('map-figure-url', 'data')
+)
 
 # --------------------- Callbacks --------------------- #
 
-# 1. Callback for Search Functionality
+# 1. Callback for Search Functionality (server-side paging, sorting, filtering)
 @app.callback(
     [Output('search-results', 'data'),
-     Output('search-results', 'columns')],
-    [Input('search-button', 'n_clicks')],
+     Output('search-results', 'columns'),
+     Output('search-results', 'page_count'),
+     Output('search-results', 'page_current')],
+    [Input('search-button', 'n_clicks'),
+     Input('search-results', 'page_current'),
+     Input('search-results', 'page_size'),
+     Input('search-results', 'sort_by'),
+     Input('search-results', 'filter_query')],
     [State('search-input', 'value')],
     prevent_initial_call=True
 )
-def update_search_results(n_clicks, search_value):
+def update_search_results(n_clicks, page_current, page_size, sort_by, filter_query, search_value):
     if not search_value or n_clicks == 0:
-        return [], []
-    
-    filtered_data = data_loader.search_metro(search_value)
-    columns = [{"name": col, "id": col} for col in filtered_data.columns]
-    
-    return filtered_data.to_dict('records'), columns
+        return [], [], 1, 0
+
+    # A new search, filter, sort or page size starts again from the first page
+    trigger = callback_context.triggered_prop_ids
+    new_search = 'search-button.n_clicks' in trigger
+    if set(trigger) != {'search-results.page_current'}:
+        page_current = 0
+
+    page, _, page_count = _data().loader.search_page(
+        search_value, page_current, page_size, sort_by, filter_query
+    )
+    # The page actually shown, when the requested one is past the last
+    page_current = min(max(int(page_current or 0), 0), page_count - 1)
+    columns = table_columns(page) if new_search else dash.no_update
+    return table_records(page), columns, page_count, page_current
+
+# Map controls recolor the loaded figure in place
+@app.callback(
+    [Output('main-map', 'figure', allow_duplicate=True),
+     Output('map-date-label', 'children')],
+    [Input('map-metric', 'value'),
+     Input('map-date', 'value')],
+    prevent_initial_call=True
+)
+def update_map(metric, date_position):
+    """Send only what changed about the map as a partial update.
+
+    A new metric only recolors the markers; a new month also replaces the
+    hover values.
+    """
+    data = _data()
+    snapshots = data.loader.snapshots
+    forecast_dates, map_positions = data.forecast_dates, data.map_positions
+    date_position = min(max(int(date_position), 0), len(snapshots.dates) + len(forecast_dates) - 1)
+    columns = [metric] if callback_context.triggered_id == 'map-metric' else snapshots.metrics
+    if date_position < len(snapshots.dates):
+        date = pd.Timestamp(snapshots.dates[date_position])
+        label = f"{date:%B %Y}"
+        values = {
+            col: snapshots.metric_matrix(col)[date_position, map_positions]
+            for col in columns
+        }
+    else:
+        # Past the panel only forecast metrics have values
+        position = date_position - len(snapshots.dates)
+        label = f"{forecast_dates[position]:%B %Y} (forecast)"
+        values = {
+            col: data.forecast_matrix(col)[position] if col in data.forecasts.metrics
+            else np.full(len(map_positions), np.nan)
+            for col in columns
+        }
+
+    patched = Patch()
+    patched['data'][0]['marker']['color'] = np.round(values[metric].astype('float64'), 4)
+    if len(columns) > 1:
+        patched['data'][0]['customdata'] = map_customdata(values)
+    cmin, cmax = data.color_range(metric)
+    patched['layout']['coloraxis']['cmin'] = cmin
+    patched['layout']['coloraxis']['cmax'] = cmax
+    patched['layout']['coloraxis']['colorbar']['title']['text'] = metric
+    return patched, label
 
 # 2. Callback for Map Click-to-Search
 @app.callback(
@@ -54,82 +333,162 @@ def map_click_to_search(click_data):
         return click_data['points'][0]['hovertext']
     return ""
 
-# 3. Combined callback for visualization and status
+# 3. Visualization requests run as background jobs
+def _visualization_result(fig, code, explanation, usage):
+    """A visualization in the JSON-serializable form job results are stored in."""
+    if fig is not None and not isinstance(fig, dict):
+        fig = json.loads(pio.to_json(fig, validate=False))
+    return {"figure": fig, "code": code, "explanation": explanation, "usage": usage}
+
+
+def _run_visualization_job(query, lease, progress):
+    """Generate a visualization and return it in JSON-serializable form.
+
+    The job runs on the data version leased when it was submitted. The
+    result carries the token counts and latency of each model call.
+    """
+    usage = []
+    with lease as data:
+        fig, code, explanation = generate_custom_visualization(
+            query,
+            data.loader.data,
+            data.loader.second_latest_data,
+            data.loader,
+            progress=progress,
+            usage=usage,
+            # submit_visualization already tried it
+            fast_path=False
+        )
+    return _visualization_result(fig, code, explanation, usage)
+
+
+@app.server.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    """Status of a background job; polled by the browser while it runs."""
+    job = job_queue.store.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
 @app.callback(
-    [Output("custom-visualization", "figure"),
-     Output("query-response", "children"),
+    [Output("viz-job", "data"),
      Output("agent-status", "children"),
-     Output("agent-interval", "disabled")],
-    [Input("submit-query", "n_clicks"),
-     Input("agent-interval", "n_intervals")],
+     Output("agent-interval", "disabled"),
+     Output("viz-job-done", "data", allow_duplicate=True)],
+    [Input("submit-query", "n_clicks")],
     [State("query-input", "value")],
     prevent_initial_call=True
 )
-def handle_visualization_and_status(n_clicks, n_intervals, query):
-    """Combined callback for visualization generation and status updates."""
-    ctx = callback_context
-    triggered_id = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
-
-    if triggered_id == "agent-interval":
-        # Handle interval updates - cycle through messages
-        messages = [
-            {"icon": "🤖", "text": "Analyzing your request...", "color": "#007bff"},
-            {"icon": "📊", "text": "Generating visualization code...", "color": "#28a745"},
-            {"icon": "✨", "text": "Creating the perfect visualization...", "color": "#17a2b8"}
-        ]
-        current_msg = messages[n_intervals % len(messages)]
-        
-        status_div = html.Div([
-            html.H4(f"{current_msg['icon']} Working on it...", style={"color": current_msg['color']}),
-            html.P(current_msg['text'])
-        ])
-        
-        # Return current figure and response (unchanged) with new status
-        return dash.no_update, dash.no_update, status_div, False
-
-    elif triggered_id == "submit-query":
-        if not query or n_clicks == 0:
-            return px.scatter(), "Enter a query to generate a visualization.", "", True
-
-        try:
-            # Generate visualization
-            fig, code, explanation = generate_custom_visualization(
-                query,
-                data_loader.data,
-                data_loader.second_latest_data
-            )
-            
-            if fig is None:
-                return (px.scatter(), 
-                       html.Div([
-                           html.H4("Error", style={'color': 'red'}),
-                           html.P(f"Failed to generate visualization: {code}")
-                       ]), 
-                       "", 
-                       True)
-            
-            return (fig,
-                   html.Div([
-                       html.H4("✅ Analysis Complete", style={'color': '#28a745', 'marginBottom': '20px'}),
-                       html.H4("Visualization Explanation"),
-                       html.P(explanation),
-                       html.H4("Generated Python Code"),
-                       dcc.Markdown(f"```python\n{code}\n```")
-                   ]),
-                   "",  # Clear status when complete
-                   True)  # Disable interval
-        
-        except Exception as e:
-            return (px.scatter(),
-                   html.Div([
-                       html.H4("Error", style={'color': 'red'}),
-                       html.P(f"An error occurred: {str(e)}")
-                   ]),
-                   "",
-                   True)
-    
-    # Initial load - return defaults
-    return px.scatter(), "", "", True
+def submit_visualization(n_clicks, query):
+    """Queue a visualization job and start polling its status.
+
+    Common questions are answered in the request itself; their finished job
+    is handed straight to ``show_visualization`` without polling.
+    """
+    if not query or n_clicks == 0:
+        return None, "Enter a query to generate a visualization.", True, dash.no_update
+    answer = answer_directly(query, _data().loader)
+    if answer is not None:
+        job = job_queue.store.create("visualization")
+        job_queue.store.finish(job, result=_visualization_result(*answer, usage=[]))
+        return None, "", True, job["id"]
+    job_id = job_queue.submit("visualization", _run_visualization_job, query, dataset.acquire())
+    status_div = html.Div([
+        html.H4("🤖 Working on it...", style={"color": "#007bff"}),
+        html.P("Queued...")
+    ])
+    return ({"id": job_id, "url": app.get_relative_path(f"/api/jobs/{job_id}")},
+            status_div,
+            False,
+            dash.no_update)
+
+
+# Poll the status endpoint from the browser so no Dash callback runs per tick
+app.clientside_callback(
+    """
+    function(n_intervals, job) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (!job) {
+            return [noUpdate, noUpdate];
+        }
+        const stages = {
+            queued: ["🤖", "Queued...", "#6c757d"],
+            generating_code: ["📊", "Generating visualization code...", "#007bff"],
+            executing: ["⚙️", "Running the generated code...", "#28a745"],
+            explaining: ["✨", "Writing the explanation...", "#17a2b8"]
+        };
+        return fetch(job.url, {cache: "no-store"})
+            .then(response => response.json())
+            .then(status => {
+                if (!status.status || status.status === "done" || status.status === "error") {
+                    return [noUpdate, job.id];
+                }
+                const [icon, text, color] = stages[status.stage] || stages.queued;
+                const elapsed = Math.round(Date.now() / 1000 - status.created);
+                return [[
+                    {type: "H4", namespace: "dash_html_components",
+                     props: {children: icon + " Working on it...", style: {color: color}}},
+                    {type: "P", namespace: "dash_html_components",
+                     props: {children: text + " (" + elapsed + "s)"}}
+                ], noUpdate];
+            })
+            .catch(() => [noUpdate, noUpdate]);
+    }
+    """,
+    [Output("agent-status", "children", allow_duplicate=True),
+     Output("viz-job-done", "data")],
+    [Input("agent-interval", "n_intervals")],
+    [State("viz-job", "data")],
+    prevent_initial_call=True
+)
+
+
+@app.callback(
+    [Output("custom-visualization", "figure"),
+     Output("query-response", "children"),
+     Output("agent-status", "children", allow_duplicate=True),
+     Output("agent-interval", "disabled", allow_duplicate=True),
+     Output("viz-job", "data", allow_duplicate=True)],
+    [Input("viz-job-done", "data")],
+    prevent_initial_call=True
+)
+def show_visualization(job_id):
+    """Render the result of a finished visualization job."""
+    job = job_queue.store.status(job_id)
+    result = job_queue.store.result(job_id)
+    if job is None or job["status"] == "error" or result is None:
+        error = job["error"] if job else "Job not found"
+        return (px.scatter(),
+               html.Div([
+                   html.H4("Error", style={'color': 'red'}),
+                   html.P(f"An error occurred: {error}")
+               ]),
+               "",
+               True,
+               None)
+
+    if result["figure"] is None:
+        return (px.scatter(),
+               html.Div([
+                   html.H4("Error", style={'color': 'red'}),
+                   html.P(f"Failed to generate visualization: {result['explanation']}")
+               ]),
+               "",
+               True,
+               None)
+
+    return (result["figure"],
+           html.Div([
+               html.H4("✅ Analysis Complete", style={'color': '#28a745', 'marginBottom': '20px'}),
+               html.H4("Visualization Explanation"),
+               html.P(result["explanation"]),
+               html.H4("Generated Python Code"),
+               dcc.Markdown(f"```python\n{result['code']}\n```")
+           ]),
+           "",  # Clear status when complete
+           True,  # Disable interval
+           None)
 
 # Run the app
 if __name__ == '__main__':
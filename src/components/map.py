@@ -1,18 +1,68 @@
 """Map visualization component for the dashboard."""
 
 from dash import html, dcc
-import plotly.express as px
-from src.utils.visualization import create_map_visualization
+from src.config import DEFAULT_MAP_CENTER, DEFAULT_MAP_ZOOM, MAP_STYLE
+
+def create_map_tab(map_url, metrics, dates, forecast_dates=(), metric='Metro_market_temp_index'):
+    """Create the map visualization tab.
+
+    The figure is fetched from ``map_url`` after the page loads rather than
+    being embedded in the layout. The metric dropdown and the month slider
+    over ``dates``, followed by any ``forecast_dates``, recolor it in place.
+    """
+    default = max(len(dates) - 2, 0)
+    dates = list(dates) + list(forecast_dates)
+
+    # Label the slider once per year, or every fifth year for long histories
+    years = sorted({date.year for date in dates})
+    step = 1 if len(years) <= 25 else 5
+    marks = {}
+    for position, date in enumerate(dates):
+        if date.year % step == 0 and date.year not in marks.values():
+            marks[position] = date.year
+    marks = {position: str(year) for position, year in marks.items()}
 
-def create_map_tab(data):
-    """Create the map visualization tab."""
     return dcc.Tab(
         label='Map Visualization',
         children=[
             html.H2("Map Visualization", style={'textAlign': 'center'}),
+            html.Div([
+                dcc.Dropdown(
+                    id='map-metric',
+                    options=[{'label': col, 'value': col} for col in metrics],
+                    value=metric,
+                    clearable=False,
+                    style={'width': '400px'}
+                ),
+                html.Div(
+                    f"{dates[default]:%B %Y}" if dates else "",
+                    id='map-date-label',
+                    style={'margin': '10px'}
+                ),
+            ], style={'display': 'flex', 'alignItems': 'center', 'margin': '10px'}),
+            dcc.Slider(
+                id='map-date',
+                min=0,
+                max=max(len(dates) - 1, 0),
+                step=1,
+                value=default,
+                marks=marks,
+                updatemode='drag'
+            ),
             dcc.Graph(
-                figure=create_map_visualization(data),
+                figure={
+                    'data': [],
+                    'layout': {
+                        'title': {'text': "Interactive Map of Metro Metrics"},
+                        'mapbox': {
+                            'style': MAP_STYLE,
+                            'zoom': DEFAULT_MAP_ZOOM,
+                            'center': DEFAULT_MAP_CENTER,
+                        },
+                    },
+                },
                 id='main-map'
-            )
+            ),
+            dcc.Store(id='map-figure-url', data=map_url)
         ]
-    )
\ No newline at end of file
+    )
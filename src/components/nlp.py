@@ -1,5 +1,6 @@
 # src/components/nlp.py
 from dash import html, dcc
+from src.config import JOB_POLL_INTERVAL_MS
 
 def create_nlp_tab():
     """Create the NLP-powered visualization tab."""
@@ -29,9 +30,12 @@ def create_nlp_tab():
                 ]
             ),
             dcc.Store(id='is-generating', data=False),
+            # Running background job, and the id of the job once it finishes
+            dcc.Store(id='viz-job', data=None),
+            dcc.Store(id='viz-job-done', data=None),
             dcc.Interval(
                 id='agent-interval',
-                interval=1000,  # every second
+                interval=JOB_POLL_INTERVAL_MS,
                 n_intervals=0,
                 disabled=True
             )
@@ -24,7 +24,14 @@ def create_search_tab():
                 id='search-results',
                 style_table={'overflowX': 'auto'},
                 style_cell={'textAlign': 'left', 'whiteSpace': 'normal'},
-                page_size=10
+                page_current=0,
+                page_size=10,
+                page_action='custom',
+                sort_action='custom',
+                sort_mode='multi',
+                sort_by=[],
+                filter_action='custom',
+                filter_query=''
             )
         ]
     )
\ No newline at end of file
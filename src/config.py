@@ -10,6 +10,73 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4"  # or your preferred model
 
+# Data Paths; the processed panel can be pointed elsewhere, e.g. at
+# synthetic benchmark data
+ZILLOW_DATA_DIR = "data/zillow"
+PROCESSED_DATA_PATH = os.getenv("PROCESSED_DATA_PATH", "data/processed/geocoded_msa_data.csv")
+COORDINATES_PATH = "data/processed/msa_coordinates.csv"
+INGEST_MANIFEST_PATH = "data/processed/ingest_manifest.json"
+SNAPSHOT_CACHE_DIR = "data/processed/cache"
+
+# Seconds between checks of the processed data for a new version, which is
+# then loaded and swapped in while the app keeps serving; 0 turns it off
+DATA_RELOAD_INTERVAL_SECONDS = float(os.getenv("DATA_RELOAD_INTERVAL_SECONDS", "30"))
+
+# Parquet store of every geography level, partitioned by level and state
+PARTITIONED_DATA_DIR = "data/processed/dataset"
+
+# Months up to a store cross-section's date that are scanned for each
+# metric's latest value; older values count as missing
+STORE_SNAPSHOT_WINDOW_MONTHS = 12
+
+# Levels of the partitioned store offered to generated code alongside the
+# metro panel, e.g. "county,zip"; empty serves the metro panel only
+DATA_LEVELS = [level.strip() for level in os.getenv("DATA_LEVELS", "").split(",") if level.strip()]
+
+# Number of point-in-time cross-sections kept in memory
+SNAPSHOT_CACHE_SIZE = 24
+
+# Number of per-metric sort orders kept for rankings
+RANKING_CACHE_SIZE = 256
+
+# Generated visualizations cached on disk, per data version
+VIZ_CACHE_DIR = "data/processed/cache/visualizations"
+VIZ_CACHE_TTL_SECONDS = 7 * 24 * 3600
+VIZ_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Batch forecasts: metrics, months ahead, interval width and where the
+# forecast tables of each data version are kept
+FORECAST_METRICS = ["Metro_zhvi", "Metro_zori", "Metro_median_sale_price"]
+FORECAST_HORIZON = 12
+FORECAST_INTERVAL_WIDTH = 0.8
+FORECAST_CACHE_DIR = "data/processed/cache/forecasts"
+
+# Token counts and latency of every model call, one JSON object per line
+LLM_USAGE_LOG = "data/processed/cache/llm_usage.jsonl"
+# Size at which the usage log is rotated; one previous file is kept beside it
+LLM_USAGE_LOG_MAX_BYTES = 10 * 2 ** 20
+
+# Background visualization jobs: worker threads, status files and how long
+# finished jobs are kept
+JOB_WORKERS = 2
+JOB_DIR = "data/processed/cache/jobs"
+JOB_RETENTION_SECONDS = 24 * 3600
+JOB_POLL_INTERVAL_MS = 500
+
+# Pre-forked processes that run generated code (0 runs it in-process), and
+# the wall-clock and extra address-space limits of each run
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+SANDBOX_TIMEOUT_SECONDS = 60
+SANDBOX_MEMORY_LIMIT_MB = 2048
+
+# Latency, size, cache and token metrics served on /metrics; METRICS_ENABLED=0
+# turns recording off
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# Seconds from interpreter start to the first Dash response that
+# `python -m src.utils.startup` accepts
+STARTUP_BUDGET_SECONDS = 5.0
+
 # Map Configuration
 DEFAULT_MAP_CENTER = {"lat": 37.0902, "lon": -95.7129}
 DEFAULT_MAP_ZOOM = 4
@@ -43,4 +110,32 @@ METRIC_DEFINITIONS = {
     "Metro_zordi": "The Zillow Renter Demand Index.",
     "Metro_zori": "The Zillow Observed Rent Index.",
     "Date": "The date of the data."
-}
\ No newline at end of file
+}
+# Everyday phrases for each metric, matched (plurals included) by the
+# intent router that answers common questions without the model. The
+# longest matching phrase wins; the first phrase labels charts.
+METRIC_SYNONYMS = {
+    "Metro_market_temp_index": ["market temperature", "market temp", "temperature", "market heat"],
+    "Metro_invt_fs": ["for-sale inventory", "inventory", "inventory level", "homes for sale",
+                      "active listing", "housing supply"],
+    "Metro_mean_doz_pending": ["days to pending", "days pending", "days on market", "time on market"],
+    "Metro_mean_sale_to_list": ["sale-to-list ratio", "sale-to-list", "sale to list",
+                                "sale to list ratio"],
+    "Metro_median_sale_price": ["median sale price", "sale price", "sales price", "selling price"],
+    "Metro_mlp": ["median list price", "list price", "listing price", "asking price"],
+    "Metro_new_con_median_sale_price": ["new construction sale price", "new construction price",
+                                        "new home price"],
+    "Metro_new_con_sales_count_raw": ["new construction sales", "new construction sale",
+                                      "new home sale"],
+    "Metro_new_listings": ["new listings", "new listing"],
+    "Metro_pct_sold_above_list": ["share sold above list", "sold above list", "sold above asking",
+                                  "above list", "above asking"],
+    "Metro_perc_listings_price_cut": ["share of listings with a price cut", "price cut",
+                                      "price reduction"],
+    "Metro_sales_count_now": ["home sales", "home sale", "sales count", "homes sold", "sales volume"],
+    "Metro_total_transaction_value": ["total transaction value", "transaction value", "dollar volume"],
+    "Metro_zhvi": ["home value (ZHVI)", "price", "home price", "home value", "house price",
+                   "housing price", "house value", "property value", "home value index"],
+    "Metro_zordi": ["renter demand (ZORDI)", "renter demand", "rental demand", "rent demand"],
+    "Metro_zori": ["rent (ZORI)", "rent", "rental price", "rent price", "rent index", "rental rate"],
+}
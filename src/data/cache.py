@@ -0,0 +1,169 @@
+"""Columnar snapshots of the preprocessed panel.
+
+``DataLoader`` writes its preprocessed frames as uncompressed Feather (Arrow
+IPC) files named after a fingerprint of the source CSV. Later loads
+memory-map the snapshot instead of parsing and sorting the CSV again, and
+numeric columns are used in place from the mapping, so every process that
+loads the same snapshot shares one copy of them in the page cache.
+
+Compare cold starts with and without a snapshot::
+
+    python -m src.data.cache --report
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from src.config import PROCESSED_DATA_PATH, SNAPSHOT_CACHE_DIR
+from src.utils.memory import format_bytes
+
+logger = logging.getLogger(__name__)
+
+# Bump when preprocessing changes so existing snapshots are rebuilt
+SNAPSHOT_FORMAT_VERSION = 3
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def fingerprint(paths: Iterable[str]) -> str:
+    """Fingerprint source files by path, size and modification time."""
+    digest = hashlib.sha1(f"v{SNAPSHOT_FORMAT_VERSION}".encode())
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def snapshot_paths(cache_dir: str, source_path: str, version: str,
+                   names: Sequence[str]) -> Dict[str, str]:
+    """Return the snapshot file for each named frame of a source version."""
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return {
+        name: os.path.join(cache_dir, f"{stem}-{version}.{name}.feather")
+        for name in names
+    }
+
+
+def _mappable_table(frame: pd.DataFrame) -> pa.Table:
+    """Arrow table of a frame whose numeric columns convert back without copying.
+
+    pandas' NaN would become Arrow nulls, and a column with nulls has to be
+    copied to fill them back in; float columns keep NaN as a value instead.
+    """
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    for position, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type) and table.column(position).null_count:
+            values = np.asarray(frame[field.name].to_numpy(), dtype=field.type.to_pandas_dtype())
+            table = table.set_column(position, field, pa.array(values, type=field.type))
+    return table
+
+
+def write_snapshot(frames: Dict[str, pd.DataFrame], paths: Dict[str, str]) -> None:
+    """Write each frame to its snapshot path, replacing files atomically."""
+    for name, frame in frames.items():
+        path = paths[name]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Every app worker may build the snapshot of a new version at once
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # Uncompressed and in a single record batch, so columns can be used
+        # straight from the memory map without decoding or concatenating
+        feather.write_feather(_mappable_table(frame), tmp_path, compression="uncompressed",
+                              chunksize=max(len(frame), 1))
+        os.replace(tmp_path, path)
+
+
+def read_snapshot(paths: Dict[str, str]) -> Optional[Dict[str, pd.DataFrame]]:
+    """Memory-map every snapshot file, or return None if any is missing or unreadable."""
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    try:
+        return {
+            name: feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+            for name, path in paths.items()
+        }
+    except (OSError, pa.ArrowException) as e:
+        # A truncated or foreign file; the caller rebuilds it from the source
+        logger.warning("Ignoring unreadable snapshot %s: %s", sorted(paths.values()), e)
+        return None
+
+
+def remove_stale_snapshots(cache_dir: str, source_path: str, version: str) -> None:
+    """Delete snapshots of the source file that belong to other versions."""
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    for path in glob.glob(os.path.join(cache_dir, f"{stem}-*.feather")):
+        if not os.path.basename(path).startswith(f"{stem}-{version}."):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_MEASURE_SCRIPT = """
+import json, sys, time
+from src.data.data_loader import DataLoader
+from src.utils.memory import current_rss_bytes, peak_rss_bytes
+baseline = current_rss_bytes()
+start = time.perf_counter()
+loader = DataLoader(sys.argv[1], cache_dir=sys.argv[2] or None)
+loader.load_data()
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "rss_bytes": current_rss_bytes() - baseline,
+    "peak_rss_bytes": peak_rss_bytes(),
+}))
+"""
+
+
+def _measure_cold_start(data_path: str, cache_dir: Optional[str]) -> Dict[str, float]:
+    """Load the data in a fresh interpreter and report time and memory."""
+    cache_dir = os.path.abspath(cache_dir) if cache_dir else ""
+    output = subprocess.run(
+        [sys.executable, "-c", _MEASURE_SCRIPT, os.path.abspath(data_path), cache_dir],
+        check=True, capture_output=True, text=True, cwd=PROJECT_ROOT,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point for building and comparing snapshots."""
+    parser = argparse.ArgumentParser(description="Columnar snapshot cache for DataLoader.")
+    parser.add_argument("--data", default=PROCESSED_DATA_PATH,
+                        help="Processed panel CSV to snapshot.")
+    parser.add_argument("--cache-dir", default=SNAPSHOT_CACHE_DIR,
+                        help="Directory holding the snapshot files.")
+    parser.add_argument("--report", action="store_true",
+                        help="Compare cold starts from CSV and from the snapshot.")
+    args = parser.parse_args(argv)
+
+    if not args.report:
+        from src.data.data_loader import DataLoader
+        loader = DataLoader(args.data, cache_dir=args.cache_dir)
+        loader.load_data()
+        print(f"Snapshot for {args.data} is at version {loader.data_version}")
+        return
+
+    csv = _measure_cold_start(args.data, None)
+    _measure_cold_start(args.data, args.cache_dir)  # make sure the snapshot exists
+    snapshot = _measure_cold_start(args.data, args.cache_dir)
+    print(f"{'source':<10} {'load time':>12} {'RSS growth':>12} {'peak RSS':>12}")
+    for label, result in (("csv", csv), ("snapshot", snapshot)):
+        print(f"{label:<10} {result['seconds'] * 1000:>9.1f} ms "
+              f"{format_bytes(result['rss_bytes']):>12} "
+              f"{format_bytes(result['peak_rss_bytes']):>12}")
+
+
+if __name__ == "__main__":
+    main()
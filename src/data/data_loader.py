@@ -1,49 +1,387 @@
 """Data loading and processing utilities."""
 
+import logging
+import os
+
+import numpy as np
 import pandas as pd
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Sequence, Tuple, Union
+
+from src.config import DATA_LEVELS, INGEST_MANIFEST_PATH, PARTITIONED_DATA_DIR, SNAPSHOT_CACHE_DIR
+from src.data import cache, forecast, ingest, schema, views
+from src.data.derived import DerivedMetrics
+from src.data.forecast import ForecastTable
+from src.data.name_index import NameIndex
+from src.data.profile import build_profile
+from src.data.rankings import RankingEngine, region_states
+from src.data.region_index import RegionIndex
+from src.data.snapshots import SnapshotEngine
+from src.utils import metrics
+from src.utils.metrics import timed
+from src.utils.table import filter_frame, page_frame, sort_frame
+
+logger = logging.getLogger(__name__)
+
+Region = Union[int, str]
 
 class DataLoader:
-    def __init__(self, data_path: str):
-        """Initialize the DataLoader with a path to the data file."""
+    def __init__(self, data_path: str, cache_dir: Optional[str] = SNAPSHOT_CACHE_DIR):
+        """Initialize the DataLoader with a path to the data file.
+
+        Preprocessed frames are snapshotted to ``cache_dir``; pass None to
+        always parse the CSV.
+        """
         self.data_path = data_path
+        self.cache_dir = cache_dir
+        self.data_version = None
         self.data = None
         self.second_latest_data = None
+        self.name_index = None
+        self.region_index = None
+        self.snapshots = None
+        self.rankings = None
+        self.derived = None
+        self._profile = None
+        self._forecasts = None
+        self._stores = None
     
+    @timed(metrics.loader_seconds, method="load_data")
     def load_data(self) -> pd.DataFrame:
-        """Load and preprocess the dataset."""
+        """Load and preprocess the dataset, preferring a columnar snapshot."""
         try:
-            self.data = pd.read_csv(self.data_path)
-            self._preprocess_data()
-            return self.data
+            self.data_version = cache.fingerprint([self.data_path])
         except FileNotFoundError:
             raise FileNotFoundError(f"Dataset not found at {self.data_path}")
+
+        if self.cache_dir and self._load_snapshot():
+            self._build_indexes()
+            return self.data
+
+        self.data = pd.read_csv(self.data_path)
+        self._preprocess_data()
+        if self.cache_dir:
+            self._write_snapshot()
+        return self.data
+
+    @timed(metrics.loader_seconds, method="load_update")
+    def load_update(self, previous: "DataLoader",
+                    manifest_path: str = INGEST_MANIFEST_PATH) -> bool:
+        """Load the data as ``previous`` plus the rows of the last incremental ingest.
+
+        Only possible when the ingest manifest records an update from
+        ``previous``'s data version to the version on disk now; returns
+        False without loading anything otherwise, and ``load_data`` has to
+        be used. Only the regions in the update are re-sorted, then the
+        indexes and ``second_latest_data`` are rebuilt from row offsets.
+        ``previous`` is left as it was, since requests may still read it.
+        """
+        manifest = ingest.load_manifest(manifest_path) or {}
+        update = manifest.get("update")
+        try:
+            version = cache.fingerprint([self.data_path])
+        except FileNotFoundError:
+            return False
+        if (previous.data is None or not update or update["base"] != previous.data_version
+                or update["version"] != version
+                or os.path.abspath(manifest["output"]) != os.path.abspath(self.data_path)):
+            return False
+        try:
+            rows = schema.apply_schema(pd.read_csv(update["rows"]))
+        except OSError:
+            return False
+        if rows.empty:
+            return False
+
+        # New rows get labels after the stored ones, as if the CSV were re-read
+        start = int(previous.data.index.max()) + 1 if len(previous.data) else 0
+        rows.index = pd.RangeIndex(start, start + len(rows))
+        touched = previous.data['RegionID'].isin(rows['RegionID'].unique()).to_numpy()
+        updated = pd.concat([rows, previous.data[touched]])
+        updated = updated[~updated.duplicated(['RegionID', 'Date'], keep='first')]
+        updated = updated.sort_values(['RegionID', 'Date'], ascending=[True, False])
+        self.data = schema.apply_schema(
+            pd.concat([previous.data[~touched], updated]).sort_values('RegionID', kind='mergesort')
+        )
+        self.data_version = version
+        self._build_indexes()
+        self.second_latest_data = self._nth_latest_data(1)
+        if self.cache_dir:
+            self._write_snapshot()
+        return True
+
+    def _snapshot_paths(self) -> Dict[str, str]:
+        """Snapshot file locations for the current data version."""
+        return cache.snapshot_paths(
+            self.cache_dir, self.data_path, self.data_version,
+            ['data', 'second_latest'],
+        )
+
+    def _load_snapshot(self) -> bool:
+        """Memory-map the snapshot of the current version if it exists."""
+        frames = cache.read_snapshot(self._snapshot_paths())
+        if frames is None:
+            return False
+        self.data = frames['data']
+        self.second_latest_data = frames['second_latest']
+        return True
+
+    def _write_snapshot(self):
+        """Snapshot the preprocessed frames; failures only cost the speed-up."""
+        try:
+            cache.write_snapshot(
+                {'data': self.data, 'second_latest': self.second_latest_data},
+                self._snapshot_paths(),
+            )
+            cache.remove_stale_snapshots(self.cache_dir, self.data_path, self.data_version)
+        except OSError as e:
+            logger.warning("Could not write data snapshot: %s", e)
     
     def _preprocess_data(self):
         """Preprocess the loaded data."""
+        self.data = schema.apply_schema(self.data)
+
         # Sort data by RegionID and Date in descending order
         self.data = self.data.sort_values(['RegionID', 'Date'], ascending=[True, False])
         
+        self._build_indexes()
+
         # Select the second most recent data point for each region
-        self.second_latest_data = self.data.groupby('RegionID').nth(1).reset_index()
-    
-    def get_hottest_markets(self, n: int = 10) -> pd.DataFrame:
+        self.second_latest_data = self._nth_latest_data(1)
+
+    def _build_indexes(self):
+        """Index the contiguous, date-sorted row range and name of each region."""
+        self.region_index = RegionIndex(self.data)
+        regions = self.data.iloc[self.region_index.starts]
+        self.name_index = NameIndex(
+            self.region_index.region_ids,
+            regions['RegionName'].astype(str).to_numpy(),
+            regions['StateName'].astype(object).to_numpy(),
+        )
+        self.snapshots = SnapshotEngine(self.data, self.region_index)
+        self.rankings = RankingEngine()
+        self.derived = DerivedMetrics(self.data, self.region_index)
+        self._profile = None
+
+    def _nth_latest_data(self, n: int) -> pd.DataFrame:
+        """The n-th most recent row of every region (0 is the latest)."""
+        return self.data.iloc[self.region_index.nth_rows(n)].reset_index()
+
+    def memory_report(self) -> pd.DataFrame:
+        """Per-column dtype and memory usage of the loaded panel."""
+        return schema.memory_report(self.data)
+
+    @property
+    def available_dates(self) -> pd.DatetimeIndex:
+        """Every month present in the panel, oldest first."""
+        return pd.DatetimeIndex(self.snapshots.dates)
+
+    @timed(metrics.loader_seconds, method="get_snapshot")
+    def get_snapshot(self, date=None) -> pd.DataFrame:
+        """Cross-section of all metros as of a date.
+
+        Each metric holds its most recent non-null value on or before the
+        date. Without a date this is ``second_latest_data``.
+        """
+        if date is None:
+            return views.frame_view(self.second_latest_data)
+        return self.snapshots.snapshot(date)
+
+    @timed(metrics.loader_seconds, method="rank_markets")
+    def rank_markets(self, metric: str, n: int = 10, date=None,
+                     region: Optional[str] = None, states=None,
+                     ascending: bool = False) -> pd.DataFrame:
+        """Top n metros by any metric, highest first unless ``ascending``.
+
+        ``date`` selects the cross-section (``second_latest_data`` when
+        omitted), ``region`` is a key of ``REGIONS`` and ``states`` a state
+        code or list of codes; both narrow the ranking. ``metric`` may also
+        be a derived column such as ``Metro_zhvi_yoy``, taken from each
+        metro's row in the cross-section.
+        """
+        if date is None:
+            key, frame = 'second_latest', self.second_latest_data
+        else:
+            key, frame = self.snapshots.lookup(date)
+        if metric not in frame and metric in self.derived.names:
+            if date is None:
+                rows = self.region_index.nth_rows(1)
+            else:
+                rows = self.snapshots.as_of_rows(key) if key is not None else np.empty(0, dtype=int)
+                rows = rows[rows >= 0]
+            frame = self.derived.attach(frame, [metric], rows)
+        return self.rankings.top(
+            key, frame, metric, n, ascending, region_states(region, states)
+        )
+
+    def get_hottest_markets(self, n: int = 10, date=None) -> pd.DataFrame:
         """Get the n hottest markets based on market temperature index."""
-        return self.second_latest_data.nlargest(n, 'Metro_market_temp_index')
+        return self.rank_markets('Metro_market_temp_index', n, date)
     
-    def get_coldest_markets(self, n: int = 10) -> pd.DataFrame:
+    def get_coldest_markets(self, n: int = 10, date=None) -> pd.DataFrame:
         """Get the n coldest markets based on market temperature index."""
-        return self.second_latest_data.nsmallest(n, 'Metro_market_temp_index')
+        return self.rank_markets('Metro_market_temp_index', n, date, ascending=True)
     
+    @timed(metrics.loader_seconds, method="search_metro")
     def search_metro(self, query: str) -> pd.DataFrame:
-        """Search for a metro area in the dataset."""
-        return self.data[
-            self.data['RegionName'].str.contains(query, case=False, na=False)
-        ].sort_values(by='Date', ascending=False)
+        """Search for a metro area in the dataset, newest rows first."""
+        region_ids = self.name_index.search(query)
+        results = self.data.iloc[self.region_index.rows(region_ids)]
+        if len(region_ids) > 1:
+            # Each region's rows are already date-sorted; only interleave them
+            results = results.sort_values(by='Date', ascending=False, kind='stable')
+        return results
+
+    @timed(metrics.loader_seconds, method="search_page")
+    def search_page(self, query: str, page_current: int = 0, page_size: int = 10,
+                    sort_by: Optional[Sequence[Dict[str, str]]] = None,
+                    filter_query: Optional[str] = None) -> Tuple[pd.DataFrame, int, int]:
+        """One page of ``search_metro`` results after DataTable filtering and sorting.
+
+        Returns the page rows, the number of matching rows and the page count.
+        """
+        results = filter_frame(self.search_metro(query), filter_query)
+        results = sort_frame(results, sort_by)
+        page, page_count = page_frame(results, page_current, page_size)
+        return page, len(results), page_count
+
+    def resolve_region(self, region: Region) -> Optional[int]:
+        """Resolve a RegionID or metro name to a RegionID.
+
+        When several metros match a name, the one with the most recent data
+        wins, then the largest by SizeRank.
+        """
+        if not isinstance(region, str):
+            return int(region) if self.region_index.position(region) is not None else None
+        positions = self.region_index.positions(self.name_index.search(region))
+        if len(positions) == 0:
+            return None
+        rows = self.region_index.starts[positions]
+        dates = self.data['Date'].to_numpy()[rows]
+        size_ranks = self.data['SizeRank'].to_numpy()[rows]
+        best = np.lexsort((size_ranks, -dates.astype('int64')))[0]
+        return int(self.region_index.region_ids[positions[best]])
+
+    def _row(self, row: Optional[int]) -> Optional[pd.Series]:
+        """A single panel row, or None when the lookup found nothing."""
+        return None if row is None else self.data.iloc[row]
+
+    def latest(self, region: Region) -> Optional[pd.Series]:
+        """The most recent row of a region, given its RegionID or name."""
+        return self.nth_latest(region, 0)
+
+    def second_latest(self, region: Region) -> Optional[pd.Series]:
+        """The second most recent row of a region, given its RegionID or name."""
+        return self.nth_latest(region, 1)
+
+    def nth_latest(self, region: Region, n: int) -> Optional[pd.Series]:
+        """The n-th most recent row of a region (0 is the latest)."""
+        region_id = self.resolve_region(region)
+        return None if region_id is None else self._row(self.region_index.nth_row(region_id, n))
+
+    @timed(metrics.loader_seconds, method="as_of")
+    def as_of(self, region: Region, date) -> Optional[pd.Series]:
+        """The most recent row of a region on or before ``date``."""
+        region_id = self.resolve_region(region)
+        return None if region_id is None else self._row(self.region_index.as_of_row(region_id, date))
+
+    @timed(metrics.loader_seconds, method="history")
+    def history(self, region: Region, start=None, end=None) -> pd.DataFrame:
+        """Rows of a region between two dates (inclusive), newest first."""
+        region_id = self.resolve_region(region)
+        if region_id is None:
+            return self.data.iloc[0:0]
+        return self.data.iloc[self.region_index.range_rows(region_id, start, end)]
     
+    @property
+    def profile(self) -> str:
+        """Compact text summary of the loaded panel for model prompts.
+
+        Built on first use after each load or update.
+        """
+        if self._profile is None:
+            self._profile = build_profile(self.data, self.region_index)
+        return self._profile
+
+    @timed(metrics.loader_seconds, method="warm")
+    def warm(self, derived: bool = True) -> None:
+        """Build now what is otherwise built on first use.
+
+        Call it in a process about to fork, such as a preloading gunicorn
+        master, so every worker shares one copy of the map's metric matrices,
+        the latest snapshot, the default rankings, the profile and, with
+        ``derived``, every derived column, instead of each worker building its
+        own.
+        """
+        for metric in self.snapshots.metrics:
+            self.snapshots.valid_rows(metric)
+            self.snapshots.metric_matrix(metric)
+            # The orders ``rank_markets`` uses when no date is given
+            for ascending in (False, True):
+                self.rankings.order('second_latest', self.second_latest_data, metric, ascending)
+        if len(self.available_dates):
+            self.snapshots.lookup(self.available_dates[-1])
+        if derived:
+            for name in self.derived.names:
+                self.derived.column(name)
+        # Both properties keep what they build on first access
+        self.profile
+        self.forecasts
+
+    def with_derived(self, columns: Sequence[str]) -> pd.DataFrame:
+        """``data`` with derived columns such as ``Metro_zhvi_yoy`` added.
+
+        Every Metro_* column has ``_mom`` and ``_yoy`` percent changes,
+        ``_roll3`` and ``_roll12`` trailing means and ``_yoy_accel``; each is
+        computed once per data version on first use.
+        """
+        return self.derived.attach(views.frame_view(self.data), columns)
+
+    @property
+    def forecasts(self) -> Optional[ForecastTable]:
+        """Precomputed forecasts of the loaded data version, if they were built.
+
+        Build them with ``python -m src.data.forecast``.
+        """
+        if self._forecasts is None or self._forecasts[0] != self.data_version:
+            table = forecast.read_forecasts(self.data_path, self.data_version) if self.data_version else None
+            if table is None:
+                return None
+            self._forecasts = (self.data_version, ForecastTable(table))
+        return self._forecasts[1]
+
+    @property
+    def stores(self) -> Dict[str, Any]:
+        """``PartitionedStore`` of each of ``DATA_LEVELS``, opened on first use.
+
+        Levels that were never written to the store are left out. Write
+        them with ``python -m src.data.partitioned``.
+        """
+        if self._stores is None:
+            from src.data.partitioned import PartitionedStore
+
+            stores = {}
+            for level in DATA_LEVELS:
+                try:
+                    stores[level] = PartitionedStore(PARTITIONED_DATA_DIR, level)
+                except FileNotFoundError as e:
+                    logger.warning("Skipping %s data: %s", level, e)
+            self._stores = stores
+        return self._stores
+
+    @timed(metrics.loader_seconds, method="forecast")
+    def forecast(self, region: Region, metric: str = 'Metro_zhvi') -> pd.DataFrame:
+        """Precomputed monthly forecast of a region with its interval, oldest first.
+
+        Columns are Date, forecast, lower and upper; the frame is empty when
+        no forecast exists for the region and metric.
+        """
+        region_id = self.resolve_region(region)
+        forecasts = self.forecasts
+        if region_id is None or forecasts is None:
+            return pd.DataFrame(columns=['Date', 'forecast', 'lower', 'upper'])
+        return forecasts.lookup(metric, region_id)[['Date', 'forecast', 'lower', 'upper']]
+
     def get_latest_metrics(self, metro_name: str) -> Dict[str, Any]:
         """Get the latest metrics for a specific metro area."""
-        metro_data = self.search_metro(metro_name)
-        if metro_data.empty:
-            return {}
-        return metro_data.iloc[0].to_dict()
\ No newline at end of file
+        latest = self.latest(metro_name)
+        return {} if latest is None else latest.to_dict()
@@ -0,0 +1,138 @@
+"""Growth rates, rolling means and acceleration of every panel metric."""
+
+import re
+import threading
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from src.data.region_index import RegionIndex
+from src.data.schema import metric_columns
+
+# Suffix of each derived column and what it holds
+DERIVED_KINDS = {
+    "mom": "percent change from the previous month",
+    "yoy": "percent change from the same month a year earlier",
+    "roll3": "mean of the last 3 months",
+    "roll12": "mean of the last 12 months",
+    "yoy_accel": "change in the yoy percent change from the previous month, in percentage points",
+}
+
+# Longest lag or window in months
+MAX_LAG = 12
+
+
+def _month_ordinals(dates: pd.Series) -> np.ndarray:
+    """Months since year 0 of each date."""
+    dates = pd.DatetimeIndex(dates)
+    return dates.year.to_numpy().astype("int64") * 12 + dates.month.to_numpy() - 1
+
+
+class DerivedMetrics:
+    """Derived columns of a panel sorted by RegionID ascending, Date descending.
+
+    Each row gets one key, its region's position then months before the
+    newest month, so keys ascend through the frame and the row ``k``
+    months earlier in the same region is at key + k. Lags are exact-match
+    binary searches and rolling windows are ranges between two searches,
+    so gaps in a region's history never pair the wrong months. Columns are
+    computed on first use and kept as float32 arrays aligned with the rows.
+    """
+
+    def __init__(self, frame: pd.DataFrame, region_index: RegionIndex):
+        """Prepare lag lookups over a frame indexed by ``region_index``."""
+        self.frame = frame
+        self.metrics: List[str] = metric_columns(frame)
+        self.names: List[str] = [f"{metric}_{kind}" for metric in self.metrics for kind in DERIVED_KINDS]
+        self._pattern = re.compile(
+            r"(%s)_(%s)\b" % ("|".join(map(re.escape, self.metrics)) or "(?!)",
+                              "|".join(sorted(DERIVED_KINDS, key=len, reverse=True)))
+        )
+        months = _month_ordinals(frame["Date"]) if len(frame) else np.empty(0, dtype="int64")
+        newest = int(months.max()) if len(months) else 0
+        # The stride leaves room for the longest lag, so no key reaches into
+        # the next region
+        stride = (newest - int(months.min()) + 1 + MAX_LAG + 1) if len(months) else 1
+        region_positions = np.repeat(
+            np.arange(len(region_index)), region_index.stops - region_index.starts
+        )
+        self._keys = region_positions * stride + (newest - months)
+        self._lags: Dict[int, np.ndarray] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _lag_rows(self, months: int) -> np.ndarray:
+        """Row of the same region ``months`` earlier, or -1 when that month is missing."""
+        if months not in self._lags:
+            target = self._keys + months
+            rows = np.searchsorted(self._keys, target)
+            found = rows < len(self._keys)
+            found[found] = self._keys[rows[found]] == target[found]
+            self._lags[months] = np.where(found, rows, -1)
+        return self._lags[months]
+
+    def _pct_change(self, values: np.ndarray, months: int) -> np.ndarray:
+        """Percent change of ``values`` from ``months`` earlier."""
+        rows = self._lag_rows(months)
+        previous = np.where(rows >= 0, values[np.maximum(rows, 0)], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (values / previous - 1) * 100
+        return np.where(np.isfinite(change), change, np.nan)
+
+    def _rolling_mean(self, values: np.ndarray, months: int) -> np.ndarray:
+        """Mean over the last ``months`` months, NaN unless every month has a value."""
+        # Rows from here up to the key ``months`` ahead cover months (m - months, m]
+        stops = np.searchsorted(self._keys, self._keys + months, side="left")
+        present = ~np.isnan(values)
+        sums = np.r_[0.0, np.cumsum(np.where(present, values, 0.0))]
+        counts = np.r_[0, np.cumsum(present)]
+        starts = np.arange(len(values))
+        count = counts[stops] - counts[starts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = (sums[stops] - sums[starts]) / count
+        return np.where(count == months, mean, np.nan)
+
+    def _compute(self, metric: str, kind: str) -> np.ndarray:
+        """Compute one derived column in float64."""
+        values = self.frame[metric].to_numpy(dtype="float64")
+        if kind == "mom":
+            return self._pct_change(values, 1)
+        if kind == "yoy":
+            return self._pct_change(values, 12)
+        if kind == "roll3":
+            return self._rolling_mean(values, 3)
+        if kind == "roll12":
+            return self._rolling_mean(values, 12)
+        yoy = self.column(f"{metric}_yoy").astype("float64")
+        rows = self._lag_rows(1)
+        return yoy - np.where(rows >= 0, yoy[np.maximum(rows, 0)], np.nan)
+
+    def column(self, name: str) -> np.ndarray:
+        """Values of a derived column such as ``Metro_zhvi_yoy``, aligned with the rows."""
+        if name not in self._columns:
+            match = self._pattern.fullmatch(name)
+            if match is None:
+                raise ValueError(f"Unknown derived metric: {name}")
+            values = self._compute(match.group(1), match.group(2)).astype("float32")
+            with self._lock:
+                self._columns[name] = values
+        return self._columns[name]
+
+    def referenced(self, code: str) -> List[str]:
+        """Derived column names mentioned in a piece of code."""
+        return sorted({match.group(0) for match in self._pattern.finditer(code)})
+
+    def attach(self, frame: pd.DataFrame, names: Iterable[str], rows=None) -> pd.DataFrame:
+        """A view of ``frame`` with the named derived columns added.
+
+        ``rows`` maps the frame's rows to rows of the indexed panel; it
+        defaults to the panel itself.
+        """
+        names = list(names)
+        if not names:
+            return frame
+        return frame.assign(**{
+            name: self.column(name) if rows is None else self.column(name)[rows]
+            for name in names
+        })
@@ -0,0 +1,280 @@
+"""Batch forecasts of key metrics for every metro.
+
+Fits one model per RegionID and metric across a process pool and stores the
+forecasts with their intervals next to the data snapshot, keyed by the data
+version. Run from the repository root after each ingest::
+
+    python -m src.data.forecast --model prophet
+
+The model is trained on history up to the second latest month, as the latest
+Zillow month is often incomplete.
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config import (
+    FORECAST_CACHE_DIR,
+    FORECAST_HORIZON,
+    FORECAST_INTERVAL_WIDTH,
+    FORECAST_METRICS,
+    PROCESSED_DATA_PATH,
+    SNAPSHOT_CACHE_DIR,
+)
+from src.data import cache
+from src.utils.timing import StageTimer
+
+logger = logging.getLogger(__name__)
+
+FORECAST_COLUMNS = ["metric", "RegionID", "Date", "forecast", "lower", "upper", "model"]
+
+# Shortest history a model is fitted to, in months
+MIN_HISTORY = 24
+
+# Months of history the linear trend is fitted to
+LINEAR_WINDOW = 36
+
+# Series handed to each pool task, to amortize process round trips
+CHUNK_SIZE = 25
+
+Series = Tuple[str, int, np.ndarray, np.ndarray]
+
+
+def _z_score(width: float) -> float:
+    """Two-sided normal quantile for an interval of the given width."""
+    from statistics import NormalDist
+    return NormalDist().inv_cdf(0.5 + width / 2)
+
+
+def _future_dates(last: np.datetime64, horizon: int) -> np.ndarray:
+    """Month-end dates of the ``horizon`` months after ``last``."""
+    start = pd.Timestamp(last) + pd.offsets.MonthEnd(1)
+    return pd.date_range(start, periods=horizon, freq=pd.offsets.MonthEnd()).to_numpy()
+
+
+def _months_before(dates: np.ndarray, last: np.datetime64) -> np.ndarray:
+    """Whole calendar months from each of ``dates`` to ``last``."""
+    months = pd.DatetimeIndex(dates).to_period("M").asi8
+    return (pd.Timestamp(last).to_period("M").ordinal - months).astype("float64")
+
+
+def fit_linear(dates: np.ndarray, values: np.ndarray, horizon: int,
+               width: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Linear trend over the last ``LINEAR_WINDOW`` months with a residual interval."""
+    dates, values = dates[-LINEAR_WINDOW:], values[-LINEAR_WINDOW:]
+    # Months before the last date, so gaps left by missing values keep their width
+    months = -_months_before(dates, dates[-1])
+    slope, intercept = np.polyfit(months, values, 1)
+    residual = np.std(values - (slope * months + intercept), ddof=2)
+    future = np.arange(1, horizon + 1, dtype="float64")
+    forecast = slope * future + intercept
+    # Widen the interval with the distance from the fitted window
+    spread = _z_score(width) * residual * np.sqrt(1 + (future - months.mean()) ** 2 / np.sum((months - months.mean()) ** 2))
+    return forecast, forecast - spread, forecast + spread
+
+
+def fit_prophet(dates: np.ndarray, values: np.ndarray, horizon: int,
+                width: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Prophet with yearly seasonality on monthly data."""
+    from prophet import Prophet
+
+    # Prophet and its Stan backend log every fit at INFO level; the backend
+    # resets its level when first used, so it is disabled instead
+    logging.getLogger("prophet").setLevel(logging.ERROR)
+    logging.getLogger("cmdstanpy").disabled = True
+    model = Prophet(
+        yearly_seasonality=True,
+        weekly_seasonality=False,
+        daily_seasonality=False,
+        interval_width=width,
+    )
+    model.fit(pd.DataFrame({"ds": dates, "y": values}))
+    future = pd.DataFrame({"ds": _future_dates(dates[-1], horizon)})
+    prediction = model.predict(future)
+    return (
+        prediction["yhat"].to_numpy(),
+        prediction["yhat_lower"].to_numpy(),
+        prediction["yhat_upper"].to_numpy(),
+    )
+
+
+MODELS = {"linear": fit_linear, "prophet": fit_prophet}
+
+
+def _forecast_chunk(chunk: List[Series], model: str, horizon: int,
+                    width: float) -> pd.DataFrame:
+    """Fit every series of a chunk; runs in a pool process."""
+    fit = MODELS[model]
+    frames = []
+    for metric, region_id, dates, values in chunk:
+        try:
+            forecast, lower, upper = fit(dates, values, horizon, width)
+        except Exception as e:
+            logger.warning("Could not forecast %s for region %s: %s", metric, region_id, e)
+            continue
+        frames.append(pd.DataFrame({
+            "metric": metric,
+            "RegionID": region_id,
+            "Date": _future_dates(dates[-1], horizon),
+            "forecast": forecast,
+            "lower": lower,
+            "upper": upper,
+            "model": model,
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=FORECAST_COLUMNS)
+
+
+def training_series(data: pd.DataFrame, region_index, metrics: Sequence[str],
+                    cutoff) -> List[Series]:
+    """Oldest-first history of each region and metric up to ``cutoff``.
+
+    Reads each region's contiguous, newest-first block of rows; series
+    shorter than ``MIN_HISTORY`` months are skipped.
+    """
+    dates = data["Date"].to_numpy()
+    cutoff = np.datetime64(pd.Timestamp(cutoff))
+    series = []
+    for metric in metrics:
+        if metric not in data:
+            continue
+        values = data[metric].to_numpy()
+        for region_id, start, stop in zip(region_index.region_ids, region_index.starts, region_index.stops):
+            block_dates, block_values = dates[start:stop][::-1], values[start:stop][::-1]
+            keep = (block_dates <= cutoff) & ~np.isnan(block_values)
+            if keep.sum() >= MIN_HISTORY:
+                series.append((metric, int(region_id), block_dates[keep],
+                               block_values[keep].astype("float64")))
+    return series
+
+
+def build_forecasts(data: pd.DataFrame, region_index, metrics: Sequence[str] = FORECAST_METRICS,
+                    model: str = "prophet", horizon: int = FORECAST_HORIZON,
+                    width: float = FORECAST_INTERVAL_WIDTH,
+                    workers: Optional[int] = None) -> pd.DataFrame:
+    """Forecast every region and metric of a loaded panel across a process pool."""
+    if model not in MODELS:
+        raise ValueError(f"Unknown forecast model: {model}")
+    dates = np.unique(data["Date"].to_numpy())
+    cutoff = dates[-2] if len(dates) > 1 else dates[-1]
+    series = training_series(data, region_index, metrics, cutoff)
+    chunks = [series[i:i + CHUNK_SIZE] for i in range(0, len(series), CHUNK_SIZE)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        frames = [_forecast_chunk(chunk, model, horizon, width) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            frames = list(executor.map(
+                _forecast_chunk, chunks,
+                [model] * len(chunks), [horizon] * len(chunks), [width] * len(chunks),
+            ))
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=FORECAST_COLUMNS)
+    table = pd.concat(frames, ignore_index=True)
+    table["metric"] = table["metric"].astype("category")
+    table["RegionID"] = table["RegionID"].astype("int32")
+    for col in ("forecast", "lower", "upper"):
+        table[col] = table[col].astype("float64")
+    return table.sort_values(["metric", "RegionID", "Date"], kind="stable").reset_index(drop=True)
+
+
+def forecast_paths(data_path: str, version: str,
+                   cache_dir: str = FORECAST_CACHE_DIR) -> Dict[str, str]:
+    """Location of the forecast table of a data version."""
+    return cache.snapshot_paths(cache_dir, data_path, version, ["forecasts"])
+
+
+def write_forecasts(table: pd.DataFrame, data_path: str, version: str,
+                    cache_dir: str = FORECAST_CACHE_DIR) -> None:
+    """Store a forecast table and remove those of other data versions."""
+    cache.write_snapshot({"forecasts": table}, forecast_paths(data_path, version, cache_dir))
+    cache.remove_stale_snapshots(cache_dir, data_path, version)
+
+
+def read_forecasts(data_path: str, version: str,
+                   cache_dir: str = FORECAST_CACHE_DIR) -> Optional[pd.DataFrame]:
+    """The forecast table of a data version, or None if it was not built."""
+    frames = cache.read_snapshot(forecast_paths(data_path, version, cache_dir))
+    return frames["forecasts"] if frames else None
+
+
+class ForecastTable:
+    """Row ranges of each metric and region in a sorted forecast table."""
+
+    def __init__(self, table: pd.DataFrame):
+        """Index a table sorted by metric, RegionID and Date."""
+        self.table = table
+        metrics = table["metric"].astype(str).to_numpy()
+        region_ids = table["RegionID"].to_numpy()
+        starts = np.flatnonzero(np.r_[
+            True, (metrics[1:] != metrics[:-1]) | (region_ids[1:] != region_ids[:-1])
+        ]) if len(table) else np.empty(0, dtype=np.intp)
+        stops = np.r_[starts[1:], len(table)].astype(np.intp)
+        self._ranges = {
+            (metrics[start], int(region_ids[start])): (int(start), int(stop))
+            for start, stop in zip(starts, stops)
+        }
+        self.metrics: List[str] = sorted(set(metrics))
+        self.dates = pd.DatetimeIndex(np.unique(table["Date"].to_numpy()))
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def lookup(self, metric: str, region_id: int) -> pd.DataFrame:
+        """Forecast rows of one region and metric, oldest first."""
+        start, stop = self._ranges.get((metric, int(region_id)), (0, 0))
+        return self.table.iloc[start:stop]
+
+    def matrix(self, metric: str, region_ids: Sequence[int]) -> np.ndarray:
+        """Forecast values per forecast date (rows) and region (columns); NaN where missing."""
+        result = np.full((len(self.dates), len(region_ids)), np.nan)
+        dates = self.table["Date"].to_numpy()
+        values = self.table["forecast"].to_numpy()
+        for column, region_id in enumerate(region_ids):
+            start, stop = self._ranges.get((metric, int(region_id)), (0, 0))
+            if stop > start:
+                result[self.dates.get_indexer(dates[start:stop]), column] = values[start:stop]
+        return result
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point for the batch forecasting job."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=PROCESSED_DATA_PATH,
+                        help="Processed panel CSV to forecast.")
+    parser.add_argument("--model", choices=sorted(MODELS), default="prophet",
+                        help="Model fitted to each series.")
+    parser.add_argument("--metrics", nargs="+", default=FORECAST_METRICS,
+                        help="Metric columns to forecast.")
+    parser.add_argument("--horizon", type=int, default=FORECAST_HORIZON,
+                        help="Months to forecast.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Pool processes; defaults to the number of CPUs.")
+    args = parser.parse_args(argv)
+
+    from src.data.data_loader import DataLoader
+
+    timer = StageTimer()
+    with timer.stage("load"):
+        loader = DataLoader(args.data, cache_dir=SNAPSHOT_CACHE_DIR)
+        loader.load_data()
+    with timer.stage("fit"):
+        table = build_forecasts(loader.data, loader.region_index, args.metrics,
+                                args.model, args.horizon, workers=args.workers)
+    with timer.stage("write"):
+        write_forecasts(table, args.data, loader.data_version)
+    series = table.groupby(["metric", "RegionID"], observed=True).ngroups if len(table) else 0
+    print(f"Forecast {series:,} series x {args.horizon} months with {args.model} "
+          f"for data version {loader.data_version}")
+    print(timer.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Build the long-format panel dataset from the wide Zillow metro files.
+
+Run from the repository root::
+
+    python -m src.data.ingest --source data/zillow --output data/processed/geocoded_msa_data.csv
+
+Pass ``--incremental`` to only ingest the date columns that are missing from
+the ingest manifest written by the previous run.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.config import (
+    COORDINATES_PATH,
+    INGEST_MANIFEST_PATH,
+    PROCESSED_DATA_PATH,
+    ZILLOW_DATA_DIR,
+)
+from src.data import cache
+from src.utils.timing import StageTimer
+
+ID_COLUMNS = ["RegionID", "SizeRank", "RegionName", "RegionType", "StateName"]
+KEY_COLUMNS = ["RegionID", "Date"]
+COORDINATE_COLUMNS = ["latitude", "longitude"]
+DATE_COLUMN_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+logger = logging.getLogger(__name__)
+
+
+def metric_name(path: str) -> str:
+    """Map a Zillow file name to its panel column, e.g. ``Metro_invt_fs``."""
+    return os.path.basename(path).split("_uc_")[0]
+
+
+def list_source_files(source_dir: str) -> Dict[str, str]:
+    """Return the wide Zillow files in a directory keyed by metric name."""
+    paths = sorted(glob.glob(os.path.join(source_dir, "*.csv")))
+    if not paths:
+        raise FileNotFoundError(f"No Zillow CSV files found in {source_dir}")
+    return {metric_name(path): path for path in paths}
+
+
+def date_columns(frame: pd.DataFrame) -> List[str]:
+    """Return the monthly value columns of a wide Zillow frame."""
+    return [col for col in frame.columns if DATE_COLUMN_PATTERN.match(str(col))]
+
+
+def read_header(path: str) -> List[str]:
+    """Return the column names of a CSV file without parsing its rows."""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_wide_file(path: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Read a wide Zillow file, optionally restricted to some date columns."""
+    usecols = None if columns is None else ID_COLUMNS + list(columns)
+    return pd.read_csv(path, usecols=usecols)
+
+
+def melt_metric(frame: pd.DataFrame, metric: str,
+                dates: Optional[Sequence[str]] = None) -> pd.Series:
+    """Melt one wide metric frame into a Series indexed by (RegionID, Date).
+
+    Empty cells are dropped, so the result only holds observed values.
+    """
+    dates = list(dates) if dates is not None else date_columns(frame)
+    values = frame[dates].to_numpy(dtype="float64")
+    rows, cols = np.nonzero(~np.isnan(values))
+    index = pd.MultiIndex.from_arrays(
+        [frame["RegionID"].to_numpy()[rows], np.asarray(dates, dtype=object)[cols]],
+        names=["RegionID", "Date"],
+    )
+    return pd.Series(values[rows, cols], index=index, name=metric)
+
+
+def region_attributes(frames: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """Collect one row of identifying attributes per RegionID."""
+    regions = pd.concat([frame[ID_COLUMNS] for frame in frames], ignore_index=True)
+    return regions.drop_duplicates("RegionID").set_index("RegionID")
+
+
+def load_coordinates(path: Optional[str]) -> Optional[pd.DataFrame]:
+    """Load RegionID coordinates from any CSV with latitude/longitude columns."""
+    if not path or not os.path.exists(path):
+        return None
+    coordinates = pd.read_csv(path, usecols=["RegionID"] + COORDINATE_COLUMNS)
+    return coordinates.drop_duplicates("RegionID").set_index("RegionID")
+
+
+def coordinates_source(coordinates_path: Optional[str], output_path: str) -> Optional[str]:
+    """``coordinates_path``, or the previous build at ``output_path`` when that file is missing.
+
+    Keeps the geocoding of earlier builds when no coordinates file exists.
+    """
+    if coordinates_path and not os.path.exists(coordinates_path) and os.path.exists(output_path):
+        return output_path
+    return coordinates_path
+
+
+def assemble_panel(metrics: Sequence[pd.Series], regions: pd.DataFrame,
+                   coordinates: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Join melted metrics and region attributes into the long panel.
+
+    All metric series are aligned on their (RegionID, Date) index in a single
+    outer join, then the region attributes are attached by RegionID.
+    """
+    values = pd.concat(metrics, axis=1, join="outer", sort=True)
+    values = values[sorted(values.columns)].reset_index()
+    attributes = regions
+    if coordinates is not None:
+        attributes = attributes.join(coordinates, how="left")
+    else:
+        attributes = attributes.assign(latitude=np.nan, longitude=np.nan)
+    missing = int(attributes["latitude"].isna().sum())
+    if missing:
+        # Nothing else fails without coordinates; the map just loses markers
+        logger.warning("%d of %d regions have no coordinates and will not appear on the map; "
+                       "add them to %s", missing, len(attributes), COORDINATES_PATH)
+    panel = values.join(attributes, on="RegionID")
+    metric_columns = [col for col in values.columns if col not in ("RegionID", "Date")]
+    return panel[ID_COLUMNS + COORDINATE_COLUMNS + ["Date"] + metric_columns]
+
+
+def build_panel(source_dir: str = ZILLOW_DATA_DIR,
+                coordinates_path: Optional[str] = COORDINATES_PATH,
+                timer: Optional[StageTimer] = None) -> pd.DataFrame:
+    """Build the full RegionID x Date panel from every file in ``source_dir``."""
+    timer = timer or StageTimer()
+    files = list_source_files(source_dir)
+
+    with timer.stage("read"):
+        frames = {metric: read_wide_file(path) for metric, path in files.items()}
+        coordinates = load_coordinates(coordinates_path)
+
+    with timer.stage("melt"):
+        metrics = [melt_metric(frame, metric) for metric, frame in frames.items()]
+
+    with timer.stage("join"):
+        panel = assemble_panel(metrics, region_attributes(frames.values()), coordinates)
+
+    return panel
+
+
+def write_panel(panel: pd.DataFrame, output_path: str) -> None:
+    """Write the panel to CSV, creating the parent directory if needed.
+
+    The file is replaced atomically, so a running app never reads it half
+    written.
+    """
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    panel.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, output_path)
+
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """Load the ingest manifest, or None when nothing has been ingested yet."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def write_manifest(path: str, files: Dict[str, str],
+                   dates: Dict[str, List[str]], output_path: str,
+                   update: Optional[Dict[str, str]] = None) -> None:
+    """Atomically record which date columns of each file are in the store.
+
+    ``update`` describes the last incremental ingest, for loaders holding
+    the version before it; see ``update_path``.
+    """
+    all_dates = sorted(set().union(*dates.values())) if dates else []
+    manifest = {
+        "output": output_path,
+        "files": {
+            metric: {"path": files[metric], "dates": sorted(dates[metric])}
+            for metric in sorted(dates)
+        },
+        "dates": all_dates,
+    }
+    if update is not None:
+        manifest["update"] = update
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as handle:
+        json.dump(manifest, handle, indent=2)
+    os.replace(tmp_path, path)
+
+
+def update_path(output_path: str) -> str:
+    """File holding the rows of the last incremental ingest into ``output_path``."""
+    return f"{os.path.splitext(output_path)[0]}.update.csv"
+
+
+def _file_dates(files: Dict[str, str]) -> Dict[str, List[str]]:
+    """Read the date columns present in each source file."""
+    return {
+        metric: [col for col in read_header(path) if DATE_COLUMN_PATTERN.match(col)]
+        for metric, path in files.items()
+    }
+
+
+def _pending_dates(files: Dict[str, str],
+                   manifest: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Find the date columns of each file that the manifest has not seen."""
+    pending = {}
+    for metric, dates in _file_dates(files).items():
+        seen = set(manifest["files"].get(metric, {}).get("dates", []))
+        new_dates = [col for col in dates if col not in seen]
+        if new_dates:
+            pending[metric] = new_dates
+    return pending
+
+
+def refresh_panel(source_dir: str = ZILLOW_DATA_DIR,
+                  output_path: str = PROCESSED_DATA_PATH,
+                  manifest_path: str = INGEST_MANIFEST_PATH,
+                  coordinates_path: Optional[str] = COORDINATES_PATH,
+                  timer: Optional[StageTimer] = None) -> pd.DataFrame:
+    """Ingest only the date columns that are new since the last run.
+
+    Rows for months the store has never seen are appended to the CSV. When a
+    lagging file catches up on a month that is already stored, the affected
+    rows are merged and the store is rewritten. A full build is done when
+    there is no manifest yet or a new metric file appears. Coordinates come
+    from ``coordinates_path``, or from the store itself when that file is
+    missing.
+
+    The manifest records the data version before and after an incremental
+    ingest, and the rows are kept in ``update_path(output_path)``, so a
+    loaded ``DataLoader`` can apply them with ``load_update`` instead of
+    reloading the store.
+
+    Returns the inserted or updated rows as they now appear in the store.
+    """
+    timer = timer or StageTimer()
+    files = list_source_files(source_dir)
+    manifest = load_manifest(manifest_path)
+    coordinates_path = coordinates_source(coordinates_path, output_path)
+
+    if (manifest is None or not os.path.exists(output_path)
+            or set(files) - set(manifest["files"])):
+        panel = build_panel(source_dir, coordinates_path, timer)
+        with timer.stage("write"):
+            write_panel(panel, output_path)
+            write_manifest(manifest_path, files, _file_dates(files), output_path)
+        return panel
+
+    with timer.stage("detect"):
+        pending = _pending_dates(files, manifest)
+    if not pending:
+        return pd.DataFrame(columns=read_header(output_path))
+
+    with timer.stage("read"):
+        frames = {metric: read_wide_file(files[metric], dates)
+                  for metric, dates in pending.items()}
+        coordinates = load_coordinates(coordinates_path)
+
+    with timer.stage("melt"):
+        metrics = [melt_metric(frame, metric, pending[metric])
+                   for metric, frame in frames.items()]
+
+    with timer.stage("join"):
+        delta = assemble_panel(metrics, region_attributes(frames.values()), coordinates)
+        header = read_header(output_path)
+        delta = delta.reindex(columns=header)
+
+    stored_dates = set(manifest["dates"])
+    with timer.stage("write"):
+        base_version = cache.fingerprint([output_path])
+        if stored_dates.isdisjoint(delta["Date"].unique()):
+            delta.to_csv(output_path, mode="a", header=False, index=False)
+        else:
+            store = pd.read_csv(output_path).set_index(KEY_COLUMNS)
+            changes = delta.set_index(KEY_COLUMNS)
+            store = changes.combine_first(store)
+            write_panel(store.reset_index()[header], output_path)
+            delta = store.loc[changes.index].reset_index()[header]
+
+        ingested = {
+            metric: info["dates"] for metric, info in manifest["files"].items()
+        }
+        for metric, dates in pending.items():
+            ingested[metric] = ingested.get(metric, []) + dates
+        rows_path = update_path(output_path)
+        tmp_path = f"{rows_path}.tmp"
+        delta.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, rows_path)
+        update = {
+            "base": base_version,
+            "version": cache.fingerprint([output_path]),
+            "rows": rows_path,
+        }
+        write_manifest(manifest_path, files, ingested, output_path, update)
+
+    return delta
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point for building the processed dataset."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=ZILLOW_DATA_DIR,
+                        help="Directory holding the wide Zillow CSV files.")
+    parser.add_argument("--output", default=PROCESSED_DATA_PATH,
+                        help="Path of the processed panel CSV to write.")
+    parser.add_argument("--coordinates", default=None,
+                        help="CSV with RegionID, latitude and longitude columns. "
+                             "Defaults to the coordinates file or the existing output.")
+    parser.add_argument("--manifest", default=INGEST_MANIFEST_PATH,
+                        help="Path of the manifest of ingested date columns.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only ingest date columns missing from the manifest.")
+    args = parser.parse_args(argv)
+
+    coordinates_path = coordinates_source(args.coordinates or COORDINATES_PATH, args.output)
+
+    timer = StageTimer()
+    if args.incremental:
+        rows = refresh_panel(args.source, args.output, args.manifest, coordinates_path, timer)
+        print(f"Ingested {len(rows):,} new or updated rows into {args.output}")
+    else:
+        panel = build_panel(args.source, coordinates_path, timer)
+        with timer.stage("write"):
+            write_panel(panel, args.output)
+            files = list_source_files(args.source)
+            write_manifest(args.manifest, files, _file_dates(files), args.output)
+        print(f"Wrote {len(panel):,} rows x {panel.shape[1]} columns to {args.output}")
+    print(timer.report())
+
+
+if __name__ == "__main__":
+    main()
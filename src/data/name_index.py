@@ -0,0 +1,107 @@
+"""Case-folded name index over the unique regions of the panel."""
+
+import bisect
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+NGRAM_SIZE = 3
+_STATE_SUFFIX = re.compile(r"^(?P<name>.*?)[\s,]+(?P<state>[A-Za-z]{2})$")
+
+
+def _ngrams(text: str) -> Set[str]:
+    """All character n-grams of a string."""
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class NameIndex:
+    """Prefix and substring lookup of region names, resolving to RegionIDs.
+
+    The index is built once over the unique regions, so lookups cost the same
+    whether the panel holds a few hundred metros or tens of thousands of ZIPs
+    worth of rows.
+    """
+
+    def __init__(self, region_ids: Sequence[int], names: Sequence[str],
+                 states: Sequence[Optional[str]]):
+        """Build the index from parallel sequences of region attributes."""
+        self.region_ids = np.asarray(region_ids)
+        self.names = [str(name) for name in names]
+        self.states = [str(state).upper() if isinstance(state, str) else "" for state in states]
+        self._folded = [name.casefold() for name in self.names]
+        self._known_states = {state for state in self.states if state}
+
+        # Sorted suffixes starting at each word give prefix lookup on any word
+        prefixes: List[Tuple[str, int]] = []
+        grams: Dict[str, Set[int]] = defaultdict(set)
+        for position, name in enumerate(self._folded):
+            for match in re.finditer(r"\w+", name):
+                prefixes.append((name[match.start():], position))
+            for gram in _ngrams(name):
+                grams[gram].add(position)
+        prefixes.sort()
+        self._prefix_keys = [key for key, _ in prefixes]
+        self._prefix_positions = [position for _, position in prefixes]
+        self._grams = dict(grams)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _substring_positions(self, text: str) -> List[int]:
+        """Positions of names containing ``text`` (already case-folded)."""
+        if len(text) < NGRAM_SIZE:
+            candidates = range(len(self._folded))
+        else:
+            postings = sorted((self._grams.get(gram, set()) for gram in _ngrams(text)), key=len)
+            candidates = sorted(set.intersection(*postings)) if postings else []
+        return [position for position in candidates if text in self._folded[position]]
+
+    def _prefix_positions_for(self, text: str) -> List[int]:
+        """Positions of names with a word starting with ``text``."""
+        start = bisect.bisect_left(self._prefix_keys, text)
+        positions = []
+        for key, position in zip(self._prefix_keys[start:], self._prefix_positions[start:]):
+            if not key.startswith(text):
+                break
+            positions.append(position)
+        return list(dict.fromkeys(positions))
+
+    def _split_state(self, text: str) -> Tuple[str, Optional[str]]:
+        """Split a trailing state code off a query, e.g. ``fayetteville, ar``."""
+        match = _STATE_SUFFIX.match(text)
+        if match and match.group("state").upper() in self._known_states:
+            return match.group("name").strip(), match.group("state").upper()
+        return text, None
+
+    def _positions(self, query: str) -> List[int]:
+        """Positions of names matching a free-text query."""
+        text = " ".join(query.casefold().split())
+        if not text:
+            return []
+        positions = self._substring_positions(text)
+        if positions:
+            return positions
+        # "Fayetteville AR" is not a substring of "Fayetteville, AR"; retry
+        # with the state code split off and used to disambiguate
+        name, state = self._split_state(text)
+        if state is None or not name:
+            return []
+        return [position for position in self._substring_positions(name)
+                if self.states[position] == state]
+
+    def search(self, query: str) -> np.ndarray:
+        """RegionIDs whose name contains the query, ignoring case.
+
+        A trailing two-letter state code narrows the match to that state, so
+        "Fayetteville AR" and "Fayetteville, AR" both resolve to Arkansas.
+        """
+        return self.region_ids[self._positions(query)]
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Region names with a word starting with ``prefix``, for autocomplete."""
+        text = " ".join(prefix.casefold().split())
+        if not text:
+            return []
+        return [self.names[position] for position in self._prefix_positions_for(text)[:limit]]
@@ -0,0 +1,377 @@
+"""Partitioned columnar store of the panel, by geography level and state.
+
+Each geography is written as Parquet files under ``level=<level>/state=<code>``
+with a small table of its regions, so metro, county and ZIP panels can be
+served without holding any of them in memory: lookups read only the states
+and columns they need, and filters on RegionID and Date are pushed down to
+the Parquet row groups. Build a level from wide Zillow files or from an
+existing processed panel::
+
+    python -m src.data.partitioned --level zip --source data/zillow/zip
+    python -m src.data.partitioned --level metro --data data/processed/geocoded_msa_data.csv
+"""
+
+import argparse
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.config import PARTITIONED_DATA_DIR, SNAPSHOT_CACHE_SIZE, STORE_SNAPSHOT_WINDOW_MONTHS
+from src.data import cache, ingest, schema
+from src.data.name_index import NameIndex
+from src.data.rankings import RankingEngine, region_states
+from src.data.snapshots import STATIC_COLUMNS
+from src.utils import metrics
+from src.utils.lru import LRUCache
+from src.utils.memory import format_bytes
+from src.utils.metrics import timed
+
+# Zillow file prefix of each geography level
+LEVEL_PREFIXES = {"metro": "Metro", "county": "County", "zip": "Zip"}
+
+# Rows per Parquet row group; smaller groups let RegionID filters skip more
+# of a file, larger ones compress better
+ROW_GROUP_ROWS = 64 * 1024
+
+# Directory name pyarrow reads back as a missing partition value, used for
+# the United States row, which has no state
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+REGIONS_FILE = "_regions.parquet"
+MANIFEST_FILE = "_store.json"
+
+Region = Union[int, str]
+
+
+def level_path(root: str, level: str) -> str:
+    """Directory holding the partitions of one geography level."""
+    if level not in LEVEL_PREFIXES:
+        raise ValueError(f"Unknown level '{level}'. Choose from: {', '.join(LEVEL_PREFIXES)}")
+    return os.path.join(root, f"level={level}")
+
+
+def normalize_metrics(panel: pd.DataFrame, level: str) -> pd.DataFrame:
+    """Rename ``County_*``/``Zip_*`` metrics to the ``Metro_*`` names.
+
+    Every level then shares one set of metric names, so schema, rankings
+    and prompts work unchanged; RegionType tells the levels apart.
+    """
+    prefix = f"{LEVEL_PREFIXES[level]}_"
+    if prefix == "Metro_":
+        return panel
+    return panel.rename(columns={col: "Metro_" + col[len(prefix):]
+                                 for col in panel.columns if col.startswith(prefix)})
+
+
+def _partition_value(state: Any) -> str:
+    """Directory value of a state, with the null marker for missing ones."""
+    return state if isinstance(state, str) and state else NULL_PARTITION
+
+
+def _replace_directory(source: str, target: str) -> None:
+    """Move ``source`` to ``target``, removing what was there."""
+    retired = None
+    if os.path.exists(target):
+        retired = f"{target}.old"
+        shutil.rmtree(retired, ignore_errors=True)
+        os.replace(target, retired)
+    os.replace(source, target)
+    if retired:
+        shutil.rmtree(retired, ignore_errors=True)
+
+
+def write_level(panel: pd.DataFrame, root: str = PARTITIONED_DATA_DIR,
+                level: str = "metro", version: Optional[str] = None) -> Dict[str, Any]:
+    """Write a panel as the partitions of ``level`` and return its manifest.
+
+    Each state's rows go to one file, sorted by RegionID and newest month
+    first, so row-group statistics on RegionID are narrow. The level is
+    built in a temporary directory and swapped in whole; open stores keep
+    reading the files they opened, but should be reopened.
+    """
+    target = level_path(root, level)
+    panel = schema.apply_schema(normalize_metrics(panel, level))
+    panel = panel.sort_values(["RegionID", "Date"], ascending=[True, False], kind="stable")
+    panel = panel.astype({col: object for col in schema.CATEGORICAL_COLUMNS if col in panel})
+    table_schema = pa.Schema.from_pandas(panel, preserve_index=False)
+
+    tmp = os.path.join(root, f".level={level}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    states = panel["StateName"].map(_partition_value)
+    for state, rows in panel.groupby(states, sort=True):
+        directory = os.path.join(tmp, f"state={state}")
+        os.makedirs(directory)
+        pq.write_table(pa.Table.from_pandas(rows, schema=table_schema, preserve_index=False),
+                       os.path.join(directory, "part-0.parquet"),
+                       row_group_size=ROW_GROUP_ROWS, compression="zstd")
+
+    static = [col for col in STATIC_COLUMNS if col in panel]
+    newest = panel.drop_duplicates("RegionID")
+    regions = newest[static].assign(LatestDate=newest["Date"].to_numpy())
+    pq.write_table(pa.Table.from_pandas(regions, preserve_index=False),
+                   os.path.join(tmp, REGIONS_FILE))
+
+    manifest = {
+        "level": level,
+        "version": version,
+        "rows": int(len(panel)),
+        "regions": int(len(regions)),
+        "dates": [str(date.date()) for date in pd.DatetimeIndex(panel["Date"].unique()).sort_values()],
+        "metrics": schema.metric_columns(panel),
+        "states": sorted(states.unique().tolist()),
+    }
+    with open(os.path.join(tmp, MANIFEST_FILE), "w") as handle:
+        json.dump(manifest, handle, indent=2)
+    _replace_directory(tmp, target)
+    return manifest
+
+
+class PartitionedStore:
+    """Serve one geography level from its partitions without loading it.
+
+    Only the region table (one row per region) and the name index are kept
+    in memory. The lookup methods share the names and signatures of
+    ``DataLoader``'s, so either can back the same callers.
+    """
+
+    def __init__(self, root: str = PARTITIONED_DATA_DIR, level: str = "metro",
+                 cache_size: int = SNAPSHOT_CACHE_SIZE):
+        """Open the partitions of ``level`` under ``root``."""
+        self.level = level
+        self.path = level_path(root, level)
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No partitioned {level} data found in {self.path}")
+        with open(manifest_path) as handle:
+            self.manifest = json.load(handle)
+        # Partition values are always read as strings, so "__HIVE_DEFAULT_PARTITION__"
+        # comes back as a missing state rather than breaking type inference
+        partitioning = ds.HivePartitioning(pa.schema([("state", pa.string())]),
+                                           null_fallback=NULL_PARTITION)
+        self.dataset = ds.dataset(self.path, format="parquet", partitioning=partitioning)
+        self.columns = [name for name in self.dataset.schema.names if name != "state"]
+        self.metrics: List[str] = list(self.manifest["metrics"])
+        self.available_dates = pd.DatetimeIndex(pd.to_datetime(self.manifest["dates"]))
+        self._date_type = self.dataset.schema.field("Date").type
+
+        self.regions = schema.apply_schema(pd.read_parquet(os.path.join(self.path, REGIONS_FILE)))
+        self._region_rows = pd.Series(np.arange(len(self.regions)), index=self.regions["RegionID"])
+        self.name_index = NameIndex(self.regions["RegionID"].to_numpy(),
+                                    self.regions["RegionName"].astype(str),
+                                    self.regions["StateName"].astype(object))
+        self.snapshots = LRUCache(cache_size)
+        self.rankings = RankingEngine()
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    def _date(self, date) -> pa.Scalar:
+        """A date as a scalar comparable with the stored ``Date`` column."""
+        return pa.scalar(pd.Timestamp(date).to_datetime64(), type=self._date_type)
+
+    def _states_of(self, region_ids: Sequence[int]) -> List[Optional[str]]:
+        """States whose partitions hold the given regions."""
+        rows = self._region_rows.reindex(region_ids).dropna().astype(int)
+        return list(dict.fromkeys(self.regions["StateName"].astype(object).iloc[rows]))
+
+    def read(self, columns: Optional[Sequence[str]] = None, states: Optional[Sequence] = None,
+             condition: Optional[ds.Expression] = None) -> pd.DataFrame:
+        """Rows of the given states matching ``condition``, with only ``columns``.
+
+        States are pruned by directory before any file is opened; a state of
+        None selects the rows without one.
+        """
+        expression = condition
+        if states is not None:
+            codes = [state for state in states if isinstance(state, str)]
+            selected = ds.field("state").isin(pa.array(codes, type=pa.string()))
+            if len(codes) < len(states):
+                selected = selected | ds.field("state").is_null()
+            expression = selected if expression is None else expression & selected
+        table = self.dataset.to_table(columns=list(columns or self.columns), filter=expression)
+        return schema.apply_schema(table.to_pandas())
+
+    def resolve_region(self, region: Region) -> Optional[int]:
+        """Resolve a RegionID or name to a RegionID.
+
+        When several regions match a name, the one with the most recent data
+        wins, then the largest by SizeRank.
+        """
+        if not isinstance(region, str):
+            return int(region) if int(region) in self._region_rows.index else None
+        region_ids = self.name_index.search(region)
+        if len(region_ids) == 0:
+            return None
+        matches = self.regions.iloc[self._region_rows[region_ids].to_numpy()]
+        best = matches.sort_values(["LatestDate", "SizeRank"], ascending=[False, True], kind="stable")
+        return int(best["RegionID"].iloc[0])
+
+    def _region_rows_between(self, region_ids: Sequence[int], start=None, end=None) -> pd.DataFrame:
+        """Every row of the given regions between two dates, newest first."""
+        condition = ds.field("RegionID").isin([int(region_id) for region_id in region_ids])
+        if start is not None:
+            condition = condition & (ds.field("Date") >= self._date(start))
+        if end is not None:
+            condition = condition & (ds.field("Date") <= self._date(end))
+        rows = self.read(states=self._states_of(region_ids), condition=condition)
+        return rows.sort_values(["Date", "RegionID"], ascending=[False, True],
+                                kind="stable").reset_index(drop=True)
+
+    @timed(metrics.loader_seconds, method="store_search_metro")
+    def search_metro(self, query: str) -> pd.DataFrame:
+        """Rows of every region whose name matches ``query``, newest first."""
+        region_ids = self.name_index.search(query)
+        if len(region_ids) == 0:
+            return self.read(condition=ds.field("RegionID") == -1)
+        return self._region_rows_between(region_ids)
+
+    @timed(metrics.loader_seconds, method="store_history")
+    def history(self, region: Region, start=None, end=None) -> pd.DataFrame:
+        """Rows of a region between two dates (inclusive), newest first."""
+        region_id = self.resolve_region(region)
+        return self._region_rows_between([-1 if region_id is None else region_id], start, end)
+
+    def latest(self, region: Region) -> Optional[pd.Series]:
+        """The most recent row of a region, given its RegionID or name."""
+        region_id = self.resolve_region(region)
+        if region_id is None:
+            return None
+        latest = self.regions["LatestDate"].iloc[self._region_rows[region_id]]
+        rows = self._region_rows_between([region_id], start=latest)
+        return rows.iloc[0] if len(rows) else None
+
+    def get_latest_metrics(self, metro_name: str) -> Dict[str, Any]:
+        """The latest metrics of a region, by name."""
+        latest = self.latest(metro_name)
+        return {} if latest is None else latest.to_dict()
+
+    def effective_date(self, date=None) -> Optional[pd.Timestamp]:
+        """The last stored month on or before ``date``; the latest one when omitted."""
+        dates = self.available_dates
+        if date is None:
+            return dates[-1] if len(dates) else None
+        position = dates.searchsorted(pd.Timestamp(date), side="right")
+        return dates[position - 1] if position else None
+
+    def _as_of(self, date: pd.Timestamp, states: Optional[List[str]],
+               columns: Sequence[str]) -> pd.DataFrame:
+        """Cross-section of the given metrics as of an exact stored date.
+
+        Each metric keeps its most recent non-null value on or before the
+        date, as in ``SnapshotEngine``, but only the last
+        ``STORE_SNAPSHOT_WINDOW_MONTHS`` months are scanned, so a value older
+        than that counts as missing instead of every region's whole history
+        being read. A single metric is read without its missing rows, which
+        the filter drops inside the scan.
+        """
+        start = date - pd.DateOffset(months=STORE_SNAPSHOT_WINDOW_MONTHS)
+        condition = (ds.field("Date") <= self._date(date)) & (ds.field("Date") > self._date(start))
+        if len(columns) == 1:
+            condition = condition & ds.field(columns[0]).is_valid()
+        rows = self.read(["RegionID", "Date"] + list(columns), states, condition)
+        rows = rows.sort_values(["RegionID", "Date"], ascending=[True, False], kind="stable")
+        values = rows.groupby("RegionID", sort=True)[list(columns)].first()
+
+        static = self.regions.iloc[self._region_rows[values.index].to_numpy()]
+        frame = static[[col for col in STATIC_COLUMNS if col in static]].reset_index(drop=True)
+        frame["Date"] = np.full(len(frame), date.to_datetime64(), dtype="datetime64[ns]")
+        for col in columns:
+            frame[col] = values[col].to_numpy()
+        return frame
+
+    @timed(metrics.loader_seconds, method="store_get_snapshot")
+    def get_snapshot(self, date=None, states=None,
+                     columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Cross-section of regions as of ``date``, the latest month when omitted.
+
+        ``states`` narrows it to some states and ``columns`` to some metrics;
+        both limit what is read.
+        """
+        effective = self.effective_date(date)
+        columns = tuple(self.metrics if columns is None else columns)
+        states = region_states(None, states)
+        if effective is None:
+            return self.read(list(STATIC_COLUMNS) + ["Date"] + list(columns),
+                             condition=ds.field("RegionID") == -1)
+        key = (effective, None if states is None else tuple(sorted(states)), columns)
+        frame = self.snapshots.get_or_create(key, lambda: self._as_of(effective, states, columns))
+        return frame.copy(deep=False)
+
+    @timed(metrics.loader_seconds, method="store_rank_markets")
+    def rank_markets(self, metric: str, n: int = 10, date=None,
+                     region: Optional[str] = None, states=None,
+                     ascending: bool = False) -> pd.DataFrame:
+        """Top n regions by any metric, highest first unless ``ascending``.
+
+        ``date`` selects the cross-section (the second-latest month when
+        omitted, since the latest is often incomplete); ``region`` and
+        ``states`` narrow it, reading only those states' partitions.
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric '{metric}'")
+        if date is None and len(self.available_dates) > 1:
+            date = self.available_dates[-2]
+        selected = region_states(region, states)
+        effective = self.effective_date(date)
+        key = (effective, None if selected is None else tuple(sorted(selected)))
+        frame = self.get_snapshot(effective, selected, [metric])
+        return self.rankings.top(key, frame, metric, n, ascending)
+
+    def get_hottest_markets(self, n: int = 10, date=None) -> pd.DataFrame:
+        """Get the n hottest markets based on market temperature index."""
+        return self.rank_markets('Metro_market_temp_index', n, date)
+
+    def get_coldest_markets(self, n: int = 10, date=None) -> pd.DataFrame:
+        """Get the n coldest markets based on market temperature index."""
+        return self.rank_markets('Metro_market_temp_index', n, date, ascending=True)
+
+
+def store_report(root: str, level: str) -> pd.DataFrame:
+    """Files, rows and bytes on disk of each state partition of a level."""
+    records = []
+    for fragment in ds.dataset(level_path(root, level), format="parquet",
+                               partitioning="hive").get_fragments():
+        records.append({
+            "state": os.path.basename(os.path.dirname(fragment.path)).split("=", 1)[1],
+            "rows": fragment.metadata.num_rows,
+            "row_groups": fragment.metadata.num_row_groups,
+            "bytes": os.path.getsize(fragment.path),
+        })
+    return pd.DataFrame(records).sort_values("bytes", ascending=False, ignore_index=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point for writing one level of the store."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--level", choices=sorted(LEVEL_PREFIXES), default="metro")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--source", help="Directory holding the level's wide Zillow CSV files.")
+    source.add_argument("--data", help="Processed panel CSV to partition instead.")
+    parser.add_argument("--output", default=PARTITIONED_DATA_DIR,
+                        help="Root directory of the partitioned store.")
+    parser.add_argument("--coordinates", default=None,
+                        help="CSV with RegionID, latitude and longitude columns.")
+    args = parser.parse_args(argv)
+
+    if args.data:
+        panel = pd.read_csv(args.data)
+        version = cache.fingerprint([args.data])
+    else:
+        panel = ingest.build_panel(args.source, args.coordinates)
+        version = cache.fingerprint(ingest.list_source_files(args.source).values())
+    manifest = write_level(panel, args.output, args.level, version)
+    report = store_report(args.output, args.level)
+    print(f"Wrote {manifest['rows']:,} {args.level} rows of {manifest['regions']:,} regions "
+          f"to {len(report)} partitions ({format_bytes(report['bytes'].sum())}) "
+          f"under {level_path(args.output, args.level)}")
+
+
+if __name__ == "__main__":
+    main()
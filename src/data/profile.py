@@ -0,0 +1,101 @@
+"""Compact text profile of the loaded panel for model prompts.
+
+Print the profile of a processed CSV and its size::
+
+    python -m src.data.profile --data data/processed/geocoded_msa_data.csv
+"""
+
+import argparse
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.config import PROCESSED_DATA_PATH, SNAPSHOT_CACHE_DIR
+from src.data.region_index import RegionIndex
+from src.data.schema import metric_columns
+
+# Metros listed by SizeRank
+TOP_METROS = 15
+
+
+def _number(value: float) -> str:
+    """Short form of a metric value."""
+    if not np.isfinite(value):
+        return "n/a"
+    magnitude = abs(value)
+    if magnitude >= 1e9:
+        return f"{value / 1e9:.1f}B"
+    if magnitude >= 1e6:
+        return f"{value / 1e6:.1f}M"
+    if magnitude >= 100:
+        return f"{value:,.0f}"
+    return f"{value:.3g}"
+
+
+def _metric_lines(data: pd.DataFrame, region_index: RegionIndex) -> List[str]:
+    """One line per metric: months covered, metros with data and value range."""
+    dates = data["Date"].to_numpy()
+    region_positions = np.repeat(
+        np.arange(len(region_index)), region_index.stops - region_index.starts
+    )
+    lines = []
+    for metric in metric_columns(data):
+        values = data[metric].to_numpy(dtype="float64")
+        present = ~np.isnan(values)
+        if not present.any():
+            lines.append(f"- {metric}: no data")
+            continue
+        low, median, high = np.percentile(values[present], [0, 50, 100])
+        first, last = pd.Timestamp(dates[present].min()), pd.Timestamp(dates[present].max())
+        metros = len(np.unique(region_positions[present]))
+        lines.append(
+            f"- {metric}: {first:%Y-%m} to {last:%Y-%m} | {metros} metros | "
+            f"{_number(low)} / {_number(median)} / {_number(high)}"
+        )
+    return lines
+
+
+def build_profile(data: pd.DataFrame, region_index: RegionIndex) -> str:
+    """Summarize a panel sorted by RegionID ascending, Date descending.
+
+    Lists the month range, the months covered, metros with data and the
+    min / median / max of each metric, the largest metros and the states.
+    """
+    dates = np.unique(data["Date"].to_numpy())
+    if len(dates) == 0:
+        return "The dataset is empty."
+    analysis_date = dates[-2] if len(dates) > 1 else dates[-1]
+    latest_rows = data.iloc[region_index.starts]
+    largest = latest_rows.sort_values("SizeRank", kind="stable")["RegionName"].astype(str)
+    states = sorted(str(state) for state in data["StateName"].dropna().unique())
+    return "\n".join([
+        f"{len(data):,} monthly rows for {len(region_index)} metros, "
+        f"{pd.Timestamp(dates[0]):%Y-%m} to {pd.Timestamp(dates[-1]):%Y-%m}; "
+        f"second latest month (use for analysis): {pd.Timestamp(analysis_date):%Y-%m-%d}",
+        "Metrics (months covered | metros with data | min / median / max):",
+        *_metric_lines(data, region_index),
+        f"Largest metros by SizeRank: {'; '.join(largest.head(TOP_METROS))}",
+        f"States ({len(states)}): {', '.join(states)}",
+    ])
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point printing the profile of a processed CSV."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=PROCESSED_DATA_PATH,
+                        help="Processed panel CSV to profile.")
+    args = parser.parse_args(argv)
+
+    from src.data.data_loader import DataLoader
+
+    loader = DataLoader(args.data, cache_dir=SNAPSHOT_CACHE_DIR)
+    loader.load_data()
+    profile = loader.profile
+    print(profile)
+    print()
+    print(f"{len(profile):,} characters")
+
+
+if __name__ == "__main__":
+    main()
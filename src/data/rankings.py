@@ -0,0 +1,66 @@
+"""Top-N rankings of cross-sections by any metric."""
+
+from typing import Hashable, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.config import RANKING_CACHE_SIZE, REGIONS
+from src.utils.lru import LRUCache
+
+
+def region_states(region: Optional[str] = None,
+                  states: Optional[Union[str, Iterable[str]]] = None) -> Optional[List[str]]:
+    """Resolve a ``REGIONS`` name and/or state codes to a list of states."""
+    selected = None
+    if region is not None:
+        matches = [name for name in REGIONS if name.lower() == region.lower()]
+        if not matches:
+            raise ValueError(f"Unknown region '{region}'. Choose from: {', '.join(REGIONS)}")
+        selected = list(REGIONS[matches[0]])
+    if states is not None:
+        codes = [states] if isinstance(states, str) else list(states)
+        codes = [code.upper() for code in codes]
+        selected = codes if selected is None else [code for code in selected if code in codes]
+    return selected
+
+
+class RankingEngine:
+    """Serve top-N queries from cached per-metric sort orders.
+
+    The first query for a (cross-section, metric, direction) sorts once;
+    later queries only filter the stored order and slice it.
+    """
+
+    def __init__(self, cache_size: int = RANKING_CACHE_SIZE):
+        """Create an engine with an empty sort-order cache."""
+        self.cache = LRUCache(cache_size)
+
+    def order(self, key: Hashable, frame: pd.DataFrame, metric: str,
+              ascending: bool = False) -> np.ndarray:
+        """Row positions of ``frame`` sorted by ``metric``, missing values dropped.
+
+        ``key`` must identify the frame's contents, e.g. its snapshot date.
+        Ties keep row order, like ``nlargest``/``nsmallest``.
+        """
+        def build() -> np.ndarray:
+            values = frame[metric].to_numpy(dtype="float64", na_value=np.nan)
+            present = np.flatnonzero(~np.isnan(values))
+            ordered = values[present] if ascending else -values[present]
+            return present[np.argsort(ordered, kind="stable")]
+
+        return self.cache.get_or_create((key, metric, ascending), build)
+
+    def top(self, key: Hashable, frame: pd.DataFrame, metric: str, n: int = 10,
+            ascending: bool = False, states: Optional[List[str]] = None) -> pd.DataFrame:
+        """The first ``n`` rows of ``frame`` ranked by ``metric``, optionally by state."""
+        if metric not in frame:
+            raise ValueError(f"Unknown metric '{metric}'")
+        order = self.order(key, frame, metric, ascending)
+        if states is not None:
+            in_states = self.cache.get_or_create(
+                (key, "states", tuple(sorted(states))),
+                lambda: frame["StateName"].isin(states).to_numpy(),
+            )
+            order = order[in_states[order]]
+        return frame.iloc[order[:n]]
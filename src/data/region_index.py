@@ -0,0 +1,86 @@
+"""Offsets table over a panel stored contiguously by region."""
+
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def _date_key(date) -> np.int64:
+    """Integer sort key of a date, comparable with the indexed Date column."""
+    return np.int64(pd.Timestamp(date).value)
+
+
+class RegionIndex:
+    """Row ranges of each RegionID in a panel sorted by RegionID, newest first.
+
+    Every lookup returns row numbers into the indexed frame: the latest and
+    n-th latest rows are direct offsets, and as-of and date-range lookups are
+    binary searches inside a single region's rows.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        """Index a frame already sorted by RegionID ascending, Date descending."""
+        ids = frame["RegionID"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.empty(0, np.intp)
+        self.region_ids = ids[starts]
+        self.starts = starts
+        self.stops = np.r_[starts[1:], len(ids)].astype(starts.dtype)
+        # Negated dates ascend within each region, which suits searchsorted
+        dates = frame["Date"].to_numpy().astype("datetime64[ns]").astype("int64")
+        self._negated_dates = -dates
+
+    def __len__(self) -> int:
+        return len(self.region_ids)
+
+    def positions(self, region_ids: Sequence[int]) -> np.ndarray:
+        """Positions of the given RegionIDs in the offsets table; unknown IDs are dropped."""
+        region_ids = np.atleast_1d(np.asarray(region_ids))
+        positions = np.searchsorted(self.region_ids, region_ids)
+        found = positions < len(self.region_ids)
+        found[found] = self.region_ids[positions[found]] == region_ids[found]
+        return positions[found]
+
+    def position(self, region_id: int) -> Optional[int]:
+        """Position of a single RegionID, or None when it is not indexed."""
+        positions = self.positions([region_id])
+        return int(positions[0]) if len(positions) else None
+
+    def rows(self, region_ids: Sequence[int]) -> np.ndarray:
+        """Row numbers of every observation of the given regions."""
+        positions = self.positions(region_ids)
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([np.arange(self.starts[p], self.stops[p]) for p in positions])
+
+    def nth_row(self, region_id: int, n: int = 0) -> Optional[int]:
+        """Row of the n-th most recent observation (0 is the latest)."""
+        position = self.position(region_id)
+        if position is None or self.starts[position] + n >= self.stops[position]:
+            return None
+        return int(self.starts[position] + n)
+
+    def nth_rows(self, n: int = 0) -> np.ndarray:
+        """Row of the n-th most recent observation of every region that has one."""
+        rows = self.starts + n
+        return rows[rows < self.stops]
+
+    def as_of_row(self, region_id: int, date) -> Optional[int]:
+        """Row of the most recent observation on or before ``date``."""
+        position = self.position(region_id)
+        if position is None:
+            return None
+        start, stop = self.starts[position], self.stops[position]
+        offset = np.searchsorted(self._negated_dates[start:stop], -_date_key(date), side="left")
+        return int(start + offset) if start + offset < stop else None
+
+    def range_rows(self, region_id: int, start_date=None, end_date=None) -> slice:
+        """Slice of rows between two dates (inclusive), newest first."""
+        position = self.position(region_id)
+        if position is None:
+            return slice(0, 0)
+        start, stop = int(self.starts[position]), int(self.stops[position])
+        block = self._negated_dates[start:stop]
+        first = 0 if end_date is None else np.searchsorted(block, -_date_key(end_date), side="left")
+        last = len(block) if start_date is None else np.searchsorted(block, -_date_key(start_date), side="right")
+        return slice(start + int(first), start + int(last))
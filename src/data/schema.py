@@ -0,0 +1,103 @@
+"""Compact in-memory column layout for the panel.
+
+Print the per-column memory of a processed CSV before and after the layout
+is applied::
+
+    python -m src.data.schema --data data/processed/geocoded_msa_data.csv
+"""
+
+import argparse
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.config import PROCESSED_DATA_PATH
+from src.utils.memory import format_bytes
+
+CATEGORICAL_COLUMNS = ["RegionName", "StateName", "RegionType"]
+INTEGER_COLUMNS = ["RegionID", "SizeRank"]
+COORDINATE_COLUMNS = ["latitude", "longitude"]
+
+# float32 holds every whole number up to 2**24 exactly, so metrics whose
+# magnitude stays below it keep dollar-level precision and counts stay exact.
+# Counts are not stored as nullable integers because plotly cannot serialize
+# pd.NA, and every count column has missing months.
+FLOAT32_LIMIT = 2 ** 24
+
+
+def metric_columns(frame: pd.DataFrame) -> list:
+    """Return the Metro_* metric columns of a panel frame."""
+    return [col for col in frame.columns if col.startswith("Metro_")]
+
+
+def _largest_magnitude(values: pd.Series) -> float:
+    """Largest absolute value in a numeric column, ignoring missing values."""
+    array = values.to_numpy(dtype="float64", na_value=np.nan)
+    return float(np.nanmax(np.abs(array))) if np.isfinite(array).any() else 0.0
+
+
+def compact_metric(values: pd.Series) -> pd.Series:
+    """Store a metric as float32 unless its magnitude would lose precision."""
+    if values.dtype == "float32" or not pd.api.types.is_float_dtype(values.dtype):
+        return values
+    if _largest_magnitude(values) < FLOAT32_LIMIT:
+        return values.astype("float32")
+    return values
+
+
+def apply_schema(frame: pd.DataFrame) -> pd.DataFrame:
+    """Return the frame with the compact column layout applied.
+
+    Region strings become categoricals, ``Date`` is parsed to datetime64 once,
+    IDs become 32-bit integers, and metrics (counts included) are stored as
+    float32 unless their magnitude would lose precision. Already compact
+    columns are left untouched, so the function is safe to re-apply.
+    """
+    columns = {}
+    for col in CATEGORICAL_COLUMNS:
+        if col in frame and not isinstance(frame[col].dtype, pd.CategoricalDtype):
+            columns[col] = frame[col].astype("category")
+    for col in INTEGER_COLUMNS:
+        if col in frame and frame[col].notna().all() and frame[col].dtype != "int32":
+            columns[col] = frame[col].astype("int32")
+    for col in COORDINATE_COLUMNS:
+        if col in frame and frame[col].dtype != "float32":
+            columns[col] = frame[col].astype("float32")
+    if "Date" in frame and not pd.api.types.is_datetime64_any_dtype(frame["Date"]):
+        columns["Date"] = pd.to_datetime(frame["Date"])
+    for col in metric_columns(frame):
+        columns[col] = compact_metric(frame[col])
+    return frame.assign(**columns) if columns else frame
+
+
+def memory_report(frame: pd.DataFrame) -> pd.DataFrame:
+    """Per-column dtype and memory usage, largest first, with a total row."""
+    usage = frame.memory_usage(index=True, deep=True)
+    report = pd.DataFrame({
+        "column": usage.index,
+        "dtype": [str(frame[col].dtype) if col in frame else "index" for col in usage.index],
+        "bytes": usage.to_numpy(),
+    }).sort_values("bytes", ascending=False, ignore_index=True)
+    total = pd.DataFrame({"column": ["total"], "dtype": [""], "bytes": [usage.sum()]})
+    return pd.concat([report, total], ignore_index=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Print the memory of a processed CSV before and after compaction."""
+    parser = argparse.ArgumentParser(description="Per-column memory of the panel.")
+    parser.add_argument("--data", default=PROCESSED_DATA_PATH,
+                        help="Processed panel CSV to inspect.")
+    args = parser.parse_args(argv)
+
+    raw = pd.read_csv(args.data)
+    before = memory_report(raw).set_index("column")
+    after = memory_report(apply_schema(raw)).set_index("column")
+    report = before.join(after, lsuffix="_before", rsuffix="_after")
+    for col in ("bytes_before", "bytes_after"):
+        report[col] = report[col].map(format_bytes)
+    print(report.to_string())
+
+
+if __name__ == "__main__":
+    main()
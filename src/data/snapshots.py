@@ -0,0 +1,143 @@
+"""Point-in-time cross-sections of every region in the panel."""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config import SNAPSHOT_CACHE_SIZE
+from src.data.region_index import RegionIndex
+from src.data.schema import metric_columns
+from src.utils.lru import LRUCache
+
+STATIC_COLUMNS = [
+    "RegionID", "SizeRank", "RegionName", "RegionType", "StateName", "latitude", "longitude",
+]
+
+
+class SnapshotEngine:
+    """Build the cross-section of all regions as of any date.
+
+    Each metric takes its most recent non-null value on or before the date,
+    so a region whose latest month lacks one metric still reports the value
+    from the month before. Recent snapshots are kept in an LRU cache.
+    """
+
+    def __init__(self, frame: pd.DataFrame, region_index: RegionIndex,
+                 cache_size: int = SNAPSHOT_CACHE_SIZE):
+        """Prepare as-of lookups over a frame indexed by ``region_index``."""
+        self.frame = frame
+        self.region_index = region_index
+        self.metrics: List[str] = metric_columns(frame)
+        self.cache = LRUCache(cache_size)
+        self._static_columns = [col for col in STATIC_COLUMNS if col in frame]
+        self._valid_rows: Dict[str, np.ndarray] = {}
+        self._matrix_rows: Optional[np.ndarray] = None
+        self._matrices: Dict[str, np.ndarray] = {}
+
+        dates = frame["Date"].to_numpy().astype("datetime64[D]").astype("int64")
+        self.dates = np.unique(dates).astype("datetime64[D]")
+        # One sort key per row: region position, then days before the newest
+        # date, which ascends within each region because rows are newest first
+        self._span = int(dates.max() - dates.min()) + 1 if len(dates) else 1
+        self._newest = int(dates.max()) if len(dates) else 0
+        region_positions = np.repeat(
+            np.arange(len(region_index)), region_index.stops - region_index.starts
+        )
+        self._row_keys = region_positions * self._span + (self._newest - dates)
+        self._region_positions = region_positions
+
+    def effective_date(self, date) -> Optional[pd.Timestamp]:
+        """The latest panel date on or before ``date``, or None if there is none."""
+        day = np.datetime64(pd.Timestamp(date).normalize().date(), "D")
+        position = np.searchsorted(self.dates, day, side="right") - 1
+        return pd.Timestamp(self.dates[position]) if position >= 0 else None
+
+    def as_of_rows(self, date) -> np.ndarray:
+        """Row of each region's latest observation on or before ``date``; -1 if none."""
+        day = int(np.datetime64(pd.Timestamp(date).normalize().date(), "D").astype("int64"))
+        offset = self._newest - day
+        if offset < 0:
+            offset = 0
+        if offset >= self._span:
+            return np.full(len(self.region_index), -1)
+        targets = np.arange(len(self.region_index)) * self._span + offset
+        rows = np.searchsorted(self._row_keys, targets, side="left")
+        found = rows < self.region_index.stops
+        return np.where(found, rows, -1)
+
+    def date_position(self, date) -> int:
+        """Position in ``dates`` of the latest panel date on or before ``date``; -1 if none."""
+        day = np.datetime64(pd.Timestamp(date).normalize().date(), "D")
+        return int(np.searchsorted(self.dates, day, side="right") - 1)
+
+    def matrix_rows(self) -> np.ndarray:
+        """``as_of_rows`` of every panel date, one row of the result per date."""
+        if self._matrix_rows is None:
+            offsets = self._newest - self.dates.astype("int64")
+            regions = np.arange(len(self.region_index))
+            targets = regions[None, :] * self._span + offsets[:, None]
+            rows = np.searchsorted(self._row_keys, targets.ravel(), side="left").reshape(targets.shape)
+            found = rows < self.region_index.stops[None, :]
+            self._matrix_rows = np.where(found, rows, -1).astype(np.int32)
+        return self._matrix_rows
+
+    def metric_matrix(self, metric: str) -> np.ndarray:
+        """As-of values of ``metric`` for every panel date (rows) and region (columns).
+
+        Columns follow the region index. Each matrix is computed once and
+        kept, so reading any date is a single row lookup.
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric: {metric}")
+        if metric not in self._matrices:
+            self._matrices[metric] = self.metric_as_of(metric, self.matrix_rows())
+        return self._matrices[metric]
+
+    def valid_rows(self, metric: str) -> np.ndarray:
+        """For each row, the first row at or after it in the same region with a value.
+
+        Rows are newest first, so this is the row holding the most recent
+        non-null value as of that row's date; -1 marks regions with none left.
+        """
+        if metric not in self._valid_rows:
+            values = self.frame[metric].to_numpy()
+            count = len(values)
+            candidates = np.where(np.isnan(values), count, np.arange(count))
+            following = np.minimum.accumulate(candidates[::-1])[::-1]
+            stops = self.region_index.stops[self._region_positions]
+            self._valid_rows[metric] = np.where(following < stops, following, -1).astype(np.int32)
+        return self._valid_rows[metric]
+
+    def metric_as_of(self, metric: str, rows: np.ndarray) -> np.ndarray:
+        """Most recent non-null value of ``metric`` as of the given rows."""
+        values = self.frame[metric].to_numpy()
+        source = np.where(rows >= 0, self.valid_rows(metric)[np.maximum(rows, 0)], -1)
+        return np.where(source >= 0, values[np.maximum(source, 0)], np.nan).astype(values.dtype)
+
+    def snapshot(self, date) -> pd.DataFrame:
+        """Cross-section of every region with data on or before ``date``."""
+        # Callers get their own frame so they cannot alter the cached one
+        return self.lookup(date)[1].copy(deep=False)
+
+    def lookup(self, date) -> Tuple[Optional[pd.Timestamp], pd.DataFrame]:
+        """The effective date and shared cached cross-section for ``date``.
+
+        The returned frame is the cached object itself and must not be
+        modified; use ``snapshot`` for a frame of your own.
+        """
+        effective = self.effective_date(date)
+        if effective is None:
+            return None, self.frame.iloc[0:0][self._static_columns + ["Date"] + self.metrics]
+        return effective, self.cache.get_or_create(effective, lambda: self._build(effective))
+
+    def _build(self, date: pd.Timestamp) -> pd.DataFrame:
+        """Assemble the cross-section for an exact panel date."""
+        rows = self.as_of_rows(date)
+        rows = rows[rows >= 0]
+        static = self.frame.iloc[rows][self._static_columns].reset_index(drop=True)
+        columns = {col: static[col] for col in self._static_columns}
+        columns["Date"] = np.full(len(rows), date.to_datetime64(), dtype=self.frame["Date"].dtype)
+        for metric in self.metrics:
+            columns[metric] = self.metric_as_of(metric, rows)
+        return pd.DataFrame(columns)
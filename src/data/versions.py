@@ -0,0 +1,187 @@
+"""Versioned handle on the loaded data, swapped without downtime.
+
+A watcher thread fingerprints the processed data; when the fingerprint
+changes and then holds still for one poll, the new version is built in full
+off the request path and swapped in under a lock. Requests and jobs lease
+the version they started with and keep using it after a swap; a replaced
+version is retired once its last lease is released.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from src.config import DATA_RELOAD_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class _Version:
+    """One built version and the number of leases held on it."""
+
+    def __init__(self, key: str, value: Any):
+        self.key = key
+        self.value = value
+        self.leases = 0
+        self.replaced = False
+
+
+class Lease:
+    """A hold on one version; release it, or use it as a context manager."""
+
+    def __init__(self, handle: "DatasetHandle", version: _Version):
+        self._handle = handle
+        self._version = version
+        self._released = False
+
+    @property
+    def key(self) -> str:
+        """Fingerprint of the leased version."""
+        return self._version.key
+
+    @property
+    def value(self) -> Any:
+        """What ``build`` returned for the leased version."""
+        return self._version.value
+
+    def release(self) -> None:
+        """Give the version up; releasing twice is harmless."""
+        if not self._released:
+            self._released = True
+            self._handle._release(self._version)
+
+    def __enter__(self) -> Any:
+        return self.value
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class DatasetHandle:
+    """The current data version, replaced atomically when the data changes.
+
+    ``fingerprint`` identifies the data on disk and ``build`` turns a
+    fingerprint into a ready-to-serve version, given the version it replaces
+    (None for the first) so it can reuse what did not change; ``retire`` is
+    called with a version once it has been replaced and every lease on it
+    released.
+    """
+
+    def __init__(self, build: Callable[[str, Optional[Any]], Any], fingerprint: Callable[[], str],
+                 retire: Optional[Callable[[Any], None]] = None):
+        """Build the first version now, in the calling thread."""
+        self._build = build
+        self._fingerprint = fingerprint
+        self._retire = retire
+        self._lock = threading.Lock()
+        key = fingerprint()
+        self._current = _Version(key, build(key, None))
+        self._live: List[_Version] = [self._current]
+        self._pending: Optional[str] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Process and monotonic time of the last watcher check
+        self._checked = (0, float("-inf"))
+
+    @property
+    def current(self) -> Any:
+        """The latest version, without a lease; for one-off reads."""
+        return self._current.value
+
+    @property
+    def key(self) -> str:
+        """Fingerprint of the latest version."""
+        return self._current.key
+
+    def live_versions(self) -> List[str]:
+        """Fingerprints of the current version and those still leased."""
+        with self._lock:
+            return [version.key for version in self._live]
+
+    def acquire(self) -> Lease:
+        """Lease the current version until ``release`` is called."""
+        with self._lock:
+            version = self._current
+            version.leases += 1
+        return Lease(self, version)
+
+    def _release(self, version: _Version) -> None:
+        """Drop one lease, retiring a replaced version when it was the last."""
+        with self._lock:
+            version.leases -= 1
+            retire = version.replaced and version.leases == 0
+            if retire:
+                self._live.remove(version)
+        if retire and self._retire is not None:
+            self._retire(version.value)
+
+    def swap(self, key: str, value: Any) -> None:
+        """Make a built version current and retire the old one once unused."""
+        with self._lock:
+            previous, self._current = self._current, _Version(key, value)
+            self._live.append(self._current)
+            previous.replaced = True
+            retire = previous.leases == 0
+            if retire:
+                self._live.remove(previous)
+        if retire and self._retire is not None:
+            self._retire(previous.value)
+
+    def reload(self) -> bool:
+        """Build and swap in the data on disk if it changed; True when swapped.
+
+        A new fingerprint is only built once a later call sees it again, so
+        a file still being written is not loaded half-way through.
+        """
+        key = self._fingerprint()
+        if key == self._current.key:
+            self._pending = None
+            return False
+        if key != self._pending:
+            self._pending = key
+            return False
+        self._pending = None
+        self.swap(key, self._build(key, self._current.value))
+        return True
+
+    def _watch(self, interval: float) -> None:
+        """Poll for new data until stopped; failures keep the current version."""
+        while not self._stop.wait(interval):
+            try:
+                if self.reload():
+                    logger.info("Loaded data version %s", self.key)
+            except Exception:
+                logger.exception("Could not load new data version")
+
+    def watch(self, interval: float = DATA_RELOAD_INTERVAL_SECONDS) -> None:
+        """Start the watcher thread of this process, if it is not running.
+
+        Safe to call on every request: the thread is checked at most once
+        per ``interval`` in a process, and after a fork the parent's watcher
+        is gone, so the first call in the child starts a new one.
+        """
+        if interval <= 0:
+            return
+        pid, now = os.getpid(), time.monotonic()
+        checked_pid, checked_at = self._checked
+        if pid == checked_pid and now - checked_at < interval:
+            return
+        self._checked = (pid, now)
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                             name="data-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the watcher thread."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout)
+
@@ -0,0 +1,66 @@
+"""Per-request views of the loaded panel that share its memory."""
+
+import copy
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+
+def enable_copy_on_write() -> None:
+    """Switch pandas to copy-on-write, so writes to a view never reach its frame.
+
+    The views below rely on it. It is the default from pandas 3; on earlier
+    versions it changes pandas semantics for the whole process, so the app
+    turns it on once at startup instead of on import.
+    """
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+
+
+def frame_view(frame: pd.DataFrame) -> pd.DataFrame:
+    """A frame sharing ``frame``'s columns; writes to it copy only what they touch."""
+    return frame.copy(deep=False)
+
+
+def loader_view(data_loader, data: Optional[pd.DataFrame] = None,
+                second_latest_data: Optional[pd.DataFrame] = None):
+    """A copy of a DataLoader whose frames are views of the original's.
+
+    Indexes and caches are shared with the original, which only reads them.
+    ``data`` and ``second_latest_data`` replace the frames, e.g. with
+    views that carry derived columns.
+    """
+    view = copy.copy(data_loader)
+    view.data = data if data is not None else frame_view(data_loader.data)
+    view.second_latest_data = (second_latest_data if second_latest_data is not None
+                               else frame_view(data_loader.second_latest_data))
+    return view
+
+
+def request_namespace(data: pd.DataFrame, second_latest_data: pd.DataFrame,
+                      data_loader=None, code: str = "") -> Dict[str, Any]:
+    """Globals for one run of generated code, isolated from every other run.
+
+    Derived columns of the loader that ``code`` mentions, such as
+    ``Metro_zhvi_yoy``, are added to the loader's own frames.
+    """
+    if data_loader is None:
+        return {
+            "data": frame_view(data),
+            "second_latest_data": frame_view(second_latest_data),
+            "data_loader": None,
+        }
+    # Derived columns line up with the loader's own frames only
+    names = data_loader.derived.referenced(code) if code else []
+    data_view, second_latest_view = frame_view(data), frame_view(second_latest_data)
+    if names and data is data_loader.data:
+        data_view = data_loader.derived.attach(data_view, names)
+    if names and second_latest_data is data_loader.second_latest_data:
+        second_latest_view = data_loader.derived.attach(
+            second_latest_view, names, data_loader.region_index.nth_rows(1)
+        )
+    return {
+        "data": data_view,
+        "second_latest_data": second_latest_view,
+        "data_loader": loader_view(data_loader, data_view, second_latest_view),
+    }
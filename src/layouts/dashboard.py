@@ -1,13 +1,17 @@
 # src/layouts/dashboard.py
 
 from dash import html, dcc, dash_table
-from src.components.map import create_map_visualization
+from src.components.map import create_map_tab
 from src.components.search import create_search_tab
 from src.components.nlp import create_nlp_tab  # Import our NLP tab
 from src.config import METRIC_DEFINITIONS
 
-def create_dashboard_layout(data):
-    """Create the main dashboard layout."""
+def create_dashboard_layout(data, map_url, dates, forecast_dates=()):
+    """Create the main dashboard layout.
+
+    The map figure is loaded from ``map_url`` and can be scrubbed through
+    ``dates``, the months of the panel, then through ``forecast_dates``.
+    """
     
     # Create data dictionary table
     data_dictionary_table = html.Table(
@@ -29,10 +33,12 @@ def create_dashboard_layout(data):
         # Tabs for different functionalities
         dcc.Tabs([
             # Tab for Map Visualization
-            dcc.Tab(label='Map Visualization', children=[
-                html.H2("Map Visualization", style={'textAlign': 'center'}),
-                dcc.Graph(figure=create_map_visualization(data), id='main-map')
-            ]),
+            create_map_tab(
+                map_url,
+                [col for col in data.columns if col.startswith('Metro_')],
+                dates,
+                forecast_dates
+            ),
 
             # Tab for Searching Historical Data
             dcc.Tab(label='Search Historical Data', children=[
@@ -49,12 +55,21 @@ def create_dashboard_layout(data):
                     n_clicks=0,
                     style={'margin': '10px'}
                 ),
+                # Paging, sorting and filtering run server-side so only the
+                # visible page is sent to the browser
                 dash_table.DataTable(
                     id='search-results',
                     columns=[{"name": col, "id": col} for col in data.columns],
                     style_table={'overflowX': 'auto'},
                     style_cell={'textAlign': 'left', 'whiteSpace': 'normal'},
-                    page_size=10
+                    page_current=0,
+                    page_size=10,
+                    page_action='custom',
+                    sort_action='custom',
+                    sort_mode='multi',
+                    sort_by=[],
+                    filter_action='custom',
+                    filter_query=''
                 )
             ]),
 
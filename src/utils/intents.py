@@ -0,0 +1,641 @@
+"""Answer common questions from the loader, without calling the model.
+
+``route`` parses a query locally and, when it understands every word of it,
+draws the answer from loader lookups in milliseconds:
+
+- rankings: "hottest markets right now", "top 5 metros by rent in Texas",
+  "cities with the highest price growth rate", "most expensive cities"
+- trends of named metros: "compare home prices in Boston over the last 5
+  years", "forecast housing prices in San Francisco", "home values in New York"
+- the largest metros side by side: "inventory levels across major cities"
+
+Metric words come from ``METRIC_SYNONYMS`` and metro names from the loader's
+name index. Anything else returns None and goes to the model, as does a
+question about a month the metric has no data for, such as "hottest markets
+in 2015" when market temperature starts in 2018.
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from src.config import FORECAST_METRICS, METRIC_DEFINITIONS, METRIC_SYNONYMS
+from src.data.rankings import region_states
+
+logger = logging.getLogger(__name__)
+
+# Metros in a ranking or a comparison of major cities unless the query says
+DEFAULT_COUNT = 10
+
+# Most metros a query may ask for
+MAX_COUNT = 50
+
+# Most metros named in one trend chart
+MAX_PLACES = 6
+
+# Years of history shown before a forecast when the query gives no window
+FORECAST_HISTORY_YEARS = 5
+
+# Metrics in dollars, and ratios shown as percentages
+DOLLAR_METRICS = {"Metro_zhvi", "Metro_zori", "Metro_median_sale_price", "Metro_mlp",
+                  "Metro_new_con_median_sale_price", "Metro_total_transaction_value"}
+SHARE_METRICS = {"Metro_pct_sold_above_list", "Metro_perc_listings_price_cut"}
+
+# State names in queries, and their codes in the panel's StateName
+STATE_NAMES = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA",
+    "colorado": "CO", "connecticut": "CT", "delaware": "DE", "district of columbia": "DC",
+    "florida": "FL", "georgia": "GA", "hawaii": "HI", "idaho": "ID", "illinois": "IL",
+    "indiana": "IN", "iowa": "IA", "kansas": "KS", "kentucky": "KY", "louisiana": "LA",
+    "maine": "ME", "maryland": "MD", "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK", "oregon": "OR",
+    "pennsylvania": "PA", "rhode island": "RI", "south carolina": "SC", "south dakota": "SD",
+    "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA",
+    "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+STATE_CODES = set(STATE_NAMES.values())
+
+# Spelled-out numbers in time windows ("the past two years")
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20, "a": 1}
+
+# Ranking words, and whether they sort lowest first
+RANK_WORDS = {
+    "highest": False, "top": False, "most": False, "best": False, "largest": False,
+    "biggest": False, "greatest": False, "strongest": False, "fastest": False,
+    "hottest": False, "hot": False, "priciest": False, "expensive": False,
+    "lowest": True, "bottom": True, "least": True, "cheapest": True, "affordable": True,
+    "smallest": True,
+    "weakest": True, "slowest": True, "coldest": True, "cold": True, "worst": True,
+}
+# Words that mean the market temperature, or home values, when no other
+# metric is named, and words that turn a metric into its growth, its decline
+# or its forecast
+HEAT_WORDS = {"hottest", "hot", "coldest", "cold"}
+PRICE_WORDS = {"expensive", "priciest", "cheapest", "affordable"}
+GROWTH_WORDS = {"growth", "growing", "grow", "grew", "grown", "appreciation", "appreciating",
+                "increase", "increases", "increased", "increasing", "rising", "rise", "rose",
+                "gain", "gains", "change", "changes", "changed", "changing"}
+DECLINE_WORDS = {"decline", "declines", "declined", "declining", "falling", "fall", "fell",
+                 "drop", "drops", "dropped", "dropping", "decrease", "decreases", "decreased",
+                 "decreasing", "depreciation"}
+FORECAST_WORDS = {"forecast", "forecasts", "forecasted", "forecasting", "predict", "predicted",
+                  "prediction", "predictions", "projection", "projections", "projected",
+                  "outlook", "future", "expected", "next"}
+# Words that carry no content in these questions; any other word must be a
+# metro name or the query goes to the model
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "for", "to", "by", "with", "and", "or", "vs",
+    "vs.", "versus", "between", "across", "over", "from", "during", "within", "among",
+    "amongst", "than", "as", "is", "are", "was", "were", "be", "been", "has", "have", "had",
+    "do", "does", "did", "will", "what", "which", "where", "who", "how", "show", "showing",
+    "me", "us", "give", "list", "plot", "chart", "graph", "visualize", "visualise", "display",
+    "draw", "compare", "comparing", "comparison", "see", "tell", "find", "get", "i", "want",
+    "would", "like", "please", "can", "could", "you", "time", "trend", "trends", "history",
+    "historical", "level", "levels", "rate", "rates", "data", "real", "estate", "housing",
+    "home", "homes", "house", "houses", "property", "market", "markets", "metro", "metros",
+    "area", "areas", "city", "cities", "region", "regions", "right", "now", "currently",
+    "current", "today", "latest", "recent", "recently", "this", "these", "those", "there",
+    "their", "its", "it", "all", "each", "every", "per", "month", "months", "monthly",
+    "year", "years", "annual", "annually", "yearly", "percent", "percentage", "index",
+    "value", "values", "number", "count", "total", "average", "median", "mean", "seen",
+    "having", "that", "them", "then", "up", "down", "so", "far", "since", "going", "look",
+    "looking", "overview", "terms", "based",
+}
+
+_SEPARATORS = {",", "and", "&", "/", "vs", "vs.", "versus", "or", "with"}
+_NUMBER = r"(\d{1,2}|%s)" % "|".join(NUMBER_WORDS)
+_WINDOW = re.compile(
+    r"\b(?:(?:in|over|during|for|within)\s+)?(?:the\s+)?(?:last|past|previous)\s+"
+    r"(?:%s\s+)?(years?|months?|decades?)\b" % _NUMBER
+)
+_SPAN = re.compile(r"\b%s[- ](years?|months?)(?:[- ](?:period|span|window))?\b" % _NUMBER)
+_SINCE = re.compile(r"\bsince\s+((?:19|20)\d{2})\b")
+_BETWEEN = re.compile(r"\b(?:from|between)\s+((?:19|20)\d{2})\s+(?:to|and|-|through|until)\s+"
+                      r"((?:19|20)\d{2})\b")
+_YEAR = re.compile(r"\b(?:in|for|during|of|as of)\s+((?:19|20)\d{2})\b")
+_YEAR_OVER_YEAR = re.compile(r"\b(?:year[- ]over[- ]year|yoy|annual(?:ized)?\s+growth)\b")
+_MONTH_OVER_MONTH = re.compile(r"\b(?:month[- ]over[- ]month|mom|monthly\s+(?:growth|change))\b")
+# Only the number is claimed; "top" stays behind as a ranking word
+_COUNT = re.compile(r"(?:(?<=\btop )|(?<=\bbottom )|(?<=\bfirst ))(\d{1,2})\b|\b(\d{1,2})\s+(?=(?:[a-z-]+\s+){0,3}"
+                    r"(?:cities|metros|markets|metro areas|areas|regions)\b)")
+_MAJOR = re.compile(r"\b(?:(?:the|most)\s+)?(?:major|largest|biggest|big|populous)\s+"
+                    r"(?:(?:us|u\.s\.|american)\s+)?(?:cities|metros|metro areas|markets)\b")
+_NATION = re.compile(r"\b(?:in|across|throughout)\s+(?:the\s+)?(?:country|nation|united states|"
+                     r"u\.s\.a?\.?|us|usa)(?![\w.])")
+_REGION_NAMES = {"northeast": "Northeast", "northeastern": "Northeast", "south": "South",
+                 "southern": "South", "midwest": "Midwest", "midwestern": "Midwest",
+                 "west": "West", "western": "West"}
+_REGION = re.compile(r"\b(?:in\s+)?(?:the\s+)?(%s)(?:\s+(?:us|u\.s\.))?(?:\s+(?:states|region))?\b"
+                     % "|".join(_REGION_NAMES))
+_STATE = re.compile(r"\b(%s)\b" % "|".join(
+    sorted(map(re.escape, STATE_NAMES), key=len, reverse=True)))
+_STATE_CODE = re.compile(r"\b([A-Z]{2})\b")
+
+
+def _metric_patterns() -> List[Tuple[str, re.Pattern]]:
+    """Phrase patterns of every metric, longest phrase first."""
+    phrases = []
+    for metric, synonyms in METRIC_SYNONYMS.items():
+        names = synonyms + [metric.lower(), metric[len("Metro_"):].lower()]
+        for phrase in names:
+            words = [re.escape(word) for word in re.split(r"[\s-]+", phrase.lower())]
+            pattern = r"(?<![\w-])" + r"[\s-]+".join(words) + r"s?(?![\w-])"
+            phrases.append((len(phrase), metric, re.compile(pattern)))
+    phrases.sort(key=lambda item: -item[0])
+    return [(metric, pattern) for _, metric, pattern in phrases]
+
+
+_METRIC_PATTERNS = _metric_patterns()
+
+
+class _Text:
+    """A lower-cased query whose recognized spans are blanked out as they are parsed."""
+
+    def __init__(self, query: str):
+        self.original = query
+        self.text = query.lower()
+        if len(self.text) != len(query):
+            self.text = self.original = query.casefold()
+        self._free = [True] * len(self.text)
+
+    def free(self, start: int, end: int) -> bool:
+        """Whether no part of the span has been claimed yet."""
+        return all(self._free[start:end])
+
+    def claim(self, start: int, end: int) -> None:
+        """Mark a span as understood."""
+        self._free[start:end] = [False] * (end - start)
+
+    def take(self, pattern: re.Pattern) -> List[re.Match]:
+        """Claim and return every unclaimed match of ``pattern``."""
+        matches = []
+        for match in pattern.finditer(self.text):
+            if self.free(*match.span()):
+                self.claim(*match.span())
+                matches.append(match)
+        return matches
+
+    def rest(self) -> List[str]:
+        """Words and separators of the unclaimed text, breaks marked by "|"."""
+        text = "".join(char if free else "|" for char, free in zip(self.text, self._free))
+        return re.findall(r"[a-z0-9][a-z0-9.'-]*|[,&/|]", text)
+
+
+def _number(token: str) -> int:
+    """A digit string or number word as an int."""
+    return int(token) if token.isdigit() else NUMBER_WORDS[token]
+
+
+def _months(count: Optional[str], unit: str) -> int:
+    """Length of a "last N years" window in months."""
+    n = _number(count) if count else 1
+    return n * {"y": 12, "m": 1, "d": 120}[unit[0]]
+
+
+def _parse(query: str, data_loader) -> Optional[Dict[str, Any]]:
+    """The intent of a query, or None unless every word of it is understood."""
+    text = _Text(" ".join(query.strip().rstrip("?!.").split()))
+    intent: Dict[str, Any] = {"metric": None, "months": None, "start": None, "end": None,
+                              "count": None, "growth": None, "states": None, "region": None}
+
+    # Time windows first, so "last 5 years" is not read as a count
+    for match in text.take(_WINDOW):
+        intent["months"] = _months(match.group(1), match.group(2))
+    for match in text.take(_SPAN):
+        intent["months"] = _months(match.group(1), match.group(2))
+    for match in text.take(_BETWEEN):
+        intent["start"], intent["end"] = f"{match.group(1)}-01-01", f"{match.group(2)}-12-31"
+    for match in text.take(_SINCE):
+        intent["start"] = f"{match.group(1)}-01-01"
+    for match in text.take(_YEAR):
+        intent["start"], intent["end"] = f"{match.group(1)}-01-01", f"{match.group(1)}-12-31"
+    if text.take(_YEAR_OVER_YEAR):
+        intent["growth"] = "yoy"
+    if text.take(_MONTH_OVER_MONTH):
+        intent["growth"] = "mom"
+
+    found = set()
+    for metric, pattern in _METRIC_PATTERNS:
+        if text.take(pattern):
+            found.add(metric)
+    if len(found) > 1:
+        return None
+    intent["metric"] = found.pop() if found else None
+
+    major = bool(text.take(_MAJOR))
+    for match in text.take(_COUNT):
+        intent["count"] = min(int(match.group(1) or match.group(2)), MAX_COUNT)
+
+    words = [word for word in text.rest() if word != "|"]
+    ranked = [word for word in words if word in RANK_WORDS]
+    forecast = any(word in FORECAST_WORDS for word in words)
+    heat = any(word in HEAT_WORDS for word in words)
+    pricey = any(word in PRICE_WORDS for word in words)
+    growth = any(word in GROWTH_WORDS for word in words)
+    decline = any(word in DECLINE_WORDS for word in words)
+    if (growth or decline) and intent["growth"] is None:
+        intent["growth"] = "window" if intent["months"] or intent["start"] else "yoy"
+    intent["decline"] = decline
+    intent["forecast"] = forecast
+
+    if ranked or major:
+        # Scope words only make sense for cross-sections; for a trend they
+        # could be part of a metro name ("West Palm Beach")
+        text.take(_NATION)
+        # States first, so "South Carolina" is not read as the South
+        states = _states(text)
+        for match in text.take(_REGION):
+            intent["region"] = _REGION_NAMES[match.group(1)]
+        if states and intent["region"] is not None:
+            return None
+        intent["states"] = sorted(set(states)) or None
+        if _unknown(text.rest()):
+            return None
+        if heat and intent["metric"] is None:
+            intent["metric"] = "Metro_market_temp_index"
+        if pricey and intent["metric"] is None:
+            intent["metric"] = "Metro_zhvi"
+        if intent["metric"] is None or forecast:
+            return None
+        intent["kind"] = "major" if major else "ranking"
+        intent["ascending"] = any(RANK_WORDS[word] for word in ranked)
+        if decline and intent["growth"]:
+            intent["ascending"] = not intent["ascending"]
+        return intent
+
+    places = _places(text.rest(), data_loader)
+    if not places or len(places) > MAX_PLACES:
+        return None
+    if intent["metric"] is None:
+        if not forecast:
+            return None
+        intent["metric"] = "Metro_zhvi"
+    intent["kind"] = "trend"
+    intent["places"] = places
+    return intent
+
+
+def _states(text: _Text) -> List[str]:
+    """Claim the state names and upper-case state codes of a query.
+
+    A state name followed by a word that is not part of the grammar is left
+    alone, since it is more likely a metro ("Kansas City", "Washington DC").
+    """
+    states = []
+    for match in _STATE.finditer(text.text):
+        following = re.match(r"\s+([a-z0-9][a-z0-9.'-]*)", text.text[match.end():])
+        if not text.free(*match.span()) or (following and not _known(following.group(1))):
+            continue
+        text.claim(*match.span())
+        states.append(STATE_NAMES[match.group(1)])
+    for match in _STATE_CODE.finditer(text.original):
+        if match.group(1) in STATE_CODES and text.free(*match.span()):
+            text.claim(*match.span())
+            states.append(match.group(1))
+    return states
+
+
+def _known(word: str) -> bool:
+    """Whether a leftover word is part of the query's grammar rather than content."""
+    return (word in STOPWORDS or word in RANK_WORDS or word in GROWTH_WORDS
+            or word in DECLINE_WORDS or word in FORECAST_WORDS or word in _SEPARATORS
+            or word == "|")
+
+
+def _unknown(words: Sequence[str]) -> List[str]:
+    """Leftover words the parser did not understand."""
+    return [word for word in words if not _known(word)]
+
+
+def _places(words: Sequence[str], data_loader) -> Optional[List[int]]:
+    """RegionIDs of the metro names left in a query, or None unless each names one metro.
+
+    Runs of unknown words are names; a comma followed by a state code stays
+    with its name, as in "Portland, ME".
+    """
+    words = [re.sub(r"'s$", "", word) for word in words]
+    phrases: List[List[str]] = [[]]
+    for i, word in enumerate(words):
+        state_follows = i + 1 < len(words) and words[i + 1].upper() in STATE_CODES
+        after_comma = i > 0 and words[i - 1] == ","
+        if word == "," and state_follows and phrases[-1]:
+            continue
+        if after_comma and word.upper() in STATE_CODES and phrases[-1]:
+            phrases[-1][-1] += f", {word.upper()}"
+            phrases.append([])
+        elif _known(word):
+            if phrases[-1]:
+                phrases.append([])
+        else:
+            phrases[-1].append(word)
+
+    region_ids = []
+    for phrase in filter(None, phrases):
+        region_id = _place(" ".join(phrase), data_loader)
+        if region_id is None:
+            return None
+        if region_id not in region_ids:
+            region_ids.append(region_id)
+    return region_ids
+
+
+def _place(name: str, data_loader) -> Optional[int]:
+    """The one metro a name refers to, or None when it names none or several.
+
+    Regions and states are scopes, not metros ("the West" is not Key West),
+    unless a metro has exactly that name ("New York, NY"), and a name shared
+    by metros in several states needs its state code.
+    """
+    city = name.split(",")[0]
+    if len(city) < 3 or city in _REGION_NAMES:
+        return None
+    region_ids = data_loader.name_index.search(name)
+    positions = data_loader.region_index.positions(region_ids)
+    names = data_loader.data["RegionName"].iloc[data_loader.region_index.starts[positions]]
+    # A name must start a word of the metro's name, so stray words that
+    # happen to occur inside one ("end" in "Bend, OR") do not match
+    starts_word = re.compile(r"(?<!\w)" + re.escape(city))
+    matches = [region_id for region_id, found in zip(region_ids, names)
+               if starts_word.search(str(found).casefold())]
+    if city in STATE_NAMES:
+        matches = [region_id for region_id, found in zip(region_ids, names)
+                   if str(found).casefold().split(",")[0] == city]
+    return int(matches[0]) if len(matches) == 1 else None
+
+
+def _label(metric: str) -> str:
+    """Display name of a metric or derived column."""
+    base = re.sub(r"_(yoy|mom|change)$", "", metric)
+    name = METRIC_SYNONYMS.get(base, [base])[0]
+    suffix = {"_yoy": "year-over-year change", "_mom": "month-over-month change",
+              "_change": "percent change"}
+    for ending, text in suffix.items():
+        if metric.endswith(ending):
+            return f"{name}, {text}"
+    return name
+
+
+def _capitalized(text: str) -> str:
+    """``text`` with its first letter upper-cased and the rest untouched."""
+    return text[:1].upper() + text[1:]
+
+
+def _format_value(metric: str, value: float) -> str:
+    """A metric value as it reads in an explanation."""
+    if pd.isna(value):
+        return "n/a"
+    if re.search(r"_(yoy|mom|change)$", metric):
+        return f"{value:+.1f}%"
+    if metric in DOLLAR_METRICS:
+        return f"${value:,.0f}"
+    if metric in SHARE_METRICS:
+        return f"{value:.1%}" if abs(value) <= 1 else f"{value:.1f}%"
+    if metric == "Metro_mean_sale_to_list":
+        return f"{value:.3f}"
+    return f"{value:,.0f}" if abs(value) >= 100 else f"{value:,.1f}"
+
+
+def _month(date) -> str:
+    """A date as "Mar 2024"."""
+    return pd.Timestamp(date).strftime("%b %Y")
+
+
+def _without_country(frame: pd.DataFrame) -> pd.DataFrame:
+    """Rows of metros, without the national aggregate."""
+    if "RegionType" not in frame:
+        return frame
+    return frame[frame["RegionType"].astype(str) != "country"]
+
+
+def _change_frame(data_loader, metric: str, months: Optional[int], start,
+                  end) -> Tuple[pd.DataFrame, pd.Timestamp, pd.Timestamp]:
+    """Percent change of ``metric`` per metro over a window, and the window's ends.
+
+    The change is in column ``<metric>_change``.
+    """
+    dates = data_loader.available_dates
+    last = pd.Timestamp(end) if end is not None else dates[-2] if len(dates) > 1 else dates[-1]
+    first = pd.Timestamp(start) if start is not None else last - pd.DateOffset(months=months or 12)
+    now = data_loader.get_snapshot(last)
+    then = data_loader.get_snapshot(first).set_index("RegionID")[metric]
+    previous = then.reindex(now["RegionID"]).to_numpy(dtype="float64", na_value=np.nan)
+    current = now[metric].to_numpy(dtype="float64", na_value=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(previous > 0, (current / previous - 1) * 100, np.nan)
+    column = f"{metric}_change"
+    return now.assign(**{column: change}), first, last
+
+
+def _cross_section(data_loader, intent: Dict[str, Any], n: int) -> Tuple[pd.DataFrame, str, str, str]:
+    """Metros ranked by the intent's metric: the frame, value column, period and code."""
+    metric, growth, ascending = intent["metric"], intent["growth"], intent["ascending"]
+    date = intent["end"]
+    if growth == "window":
+        frame, first, last = _change_frame(data_loader, metric, intent["months"],
+                                           intent["start"], intent["end"])
+        column = f"{metric}_change"
+        frame = _without_country(frame.dropna(subset=[column]))
+        states = region_states(intent["region"], intent["states"])
+        if states is not None:
+            frame = frame[frame["StateName"].isin(states)]
+        frame = frame.sort_values(column, ascending=ascending, kind="stable").head(n)
+        code = (f"now = data_loader.get_snapshot({_iso(last)})\n"
+                f"then = data_loader.get_snapshot({_iso(first)}).set_index('RegionID')[{metric!r}]\n"
+                f"now[{column!r}] = (now[{metric!r}] / then.reindex(now['RegionID']).to_numpy() - 1) * 100\n"
+                f"top = now.dropna(subset=[{column!r}]).sort_values({column!r}, ascending={ascending})")
+        return frame, column, f"{_month(first)} to {_month(last)}", code
+
+    column = f"{metric}_{growth}" if growth else metric
+    if column not in data_loader.data and column not in data_loader.derived.names:
+        raise KeyError(column)
+    # One extra row in case the national aggregate ranks among them
+    top = data_loader.rank_markets(column, n=n + 1, date=date, region=intent["region"],
+                                   states=intent["states"], ascending=ascending)
+    frame = _without_country(top).head(n)
+    when = _month(frame["Date"].max()) if len(frame) else "the latest month"
+    args = [repr(column), f"n={n}"]
+    if date is not None:
+        args.append(f"date={date!r}")
+    if intent["region"] is not None:
+        args.append(f"region={intent['region']!r}")
+    if intent["states"] is not None:
+        args.append(f"states={intent['states']!r}")
+    if ascending:
+        args.append("ascending=True")
+    code = f"top = data_loader.rank_markets({', '.join(args)})"
+    return frame, column, f"as of {when}", code
+
+
+def _scope(intent: Dict[str, Any]) -> str:
+    """Where a cross-section is drawn from, for titles."""
+    if intent["region"] is not None:
+        return f" in the {intent['region']}"
+    if intent["states"] is not None:
+        return f" in {', '.join(intent['states'])}"
+    return ""
+
+
+def _bar(frame: pd.DataFrame, column: str, title: str) -> go.Figure:
+    """Horizontal bars of ``column`` by metro, first row on top."""
+    fig = go.Figure(go.Bar(
+        x=frame[column], y=frame["RegionName"].astype(str), orientation="h",
+        marker=dict(color=frame[column], colorscale="Viridis"),
+        hovertemplate="%{y}: %{x:,.2f}<extra></extra>",
+    ))
+    fig.update_layout(title=title, xaxis_title=_label(column), yaxis=dict(autorange="reversed"),
+                      height=max(400, 28 * len(frame) + 150))
+    return fig
+
+
+def _ranking(data_loader, intent: Dict[str, Any]) -> Optional[Tuple[go.Figure, str, str]]:
+    """Top or bottom metros by a metric or its growth."""
+    n = intent["count"] or DEFAULT_COUNT
+    frame, column, period, code = _cross_section(data_loader, intent, n)
+    if frame.empty:
+        return None
+    which = "Bottom" if intent["ascending"] else "Top"
+    title = f"{which} {len(frame)} metros{_scope(intent)} by {_label(column)}, {period}"
+    code += (f"\nfig = go.Figure(go.Bar(x=top[{column!r}], y=top['RegionName'], orientation='h'))"
+             f"\nfig.update_layout(title={title!r}, yaxis=dict(autorange='reversed'))")
+    first, last = frame.iloc[0], frame.iloc[-1]
+    explanation = (
+        f"{title}. {first['RegionName']} ranks first at {_format_value(column, first[column])}"
+        f"; number {len(frame)} is {last['RegionName']} at {_format_value(column, last[column])}. "
+        f"{_context(intent, column)}"
+    )
+    return _bar(frame, column, title), code, explanation.strip()
+
+
+def _major(data_loader, intent: Dict[str, Any]) -> Optional[Tuple[go.Figure, str, str]]:
+    """A metric across the largest metros by SizeRank."""
+    n = intent["count"] or DEFAULT_COUNT
+    frame, column, period, code = _cross_section(data_loader, intent, len(data_loader.region_index))
+    frame = frame.nsmallest(n, "SizeRank").sort_values(column, ascending=False, kind="stable")
+    if frame.empty:
+        return None
+    title = f"{_capitalized(_label(column))} across the {len(frame)} largest metros{_scope(intent)}, {period}"
+    code = code.replace(f"n={len(data_loader.region_index)}", "n=len(data_loader.region_index)")
+    code += (f"\ntop = top.nsmallest({n}, 'SizeRank').sort_values({column!r}, ascending=False)"
+             f"\nfig = go.Figure(go.Bar(x=top[{column!r}], y=top['RegionName'], orientation='h'))"
+             f"\nfig.update_layout(title={title!r}, yaxis=dict(autorange='reversed'))")
+    high, low = frame.iloc[0], frame.iloc[-1]
+    explanation = (
+        f"{title}. {high['RegionName']} is highest at {_format_value(column, high[column])} "
+        f"and {low['RegionName']} lowest at {_format_value(column, low[column])}; the median "
+        f"across these metros is {_format_value(column, frame[column].median())}. "
+        f"{_context(intent, column)}"
+    )
+    return _bar(frame, column, title), code, explanation.strip()
+
+
+def _context(intent: Dict[str, Any], column: str) -> str:
+    """What the metric means, from the data dictionary."""
+    definition = METRIC_DEFINITIONS.get(intent["metric"], "")
+    if column != intent["metric"]:
+        definition += " Growth is the percent change of that value."
+    return definition
+
+
+def _trend(data_loader, intent: Dict[str, Any]) -> Optional[Tuple[go.Figure, str, str]]:
+    """History of a metric for named metros, with the forecast when asked for."""
+    metric, forecast = intent["metric"], intent["forecast"]
+    if forecast and metric not in FORECAST_METRICS:
+        return None
+    dates = data_loader.available_dates
+    end = pd.Timestamp(intent["end"]) if intent["end"] else None
+    start = pd.Timestamp(intent["start"]) if intent["start"] else None
+    months = intent["months"] or (FORECAST_HISTORY_YEARS * 12 if forecast and start is None else None)
+    if months and len(dates):
+        start = (end or dates[-1]) - pd.DateOffset(months=months)
+
+    fig = go.Figure()
+    names, lines, sentences = [], [], []
+    for region_id in intent["places"]:
+        rows = data_loader.history(region_id, start, end)
+        rows = rows[rows[metric].notna()].iloc[::-1]
+        if rows.empty:
+            continue
+        name = str(rows["RegionName"].iloc[-1])
+        names.append(name)
+        fig.add_trace(go.Scatter(x=rows["Date"], y=rows[metric], mode="lines", name=name))
+        first, last = rows.iloc[0], rows.iloc[-1]
+        change = (last[metric] / first[metric] - 1) * 100 if first[metric] else np.nan
+        sentence = (f"{name}: {_format_value(metric, first[metric])} in {_month(first['Date'])} to "
+                    f"{_format_value(metric, last[metric])} in {_month(last['Date'])}"
+                    f" ({_format_value(metric + '_change', change)}).")
+        lines.append(f"rows = data_loader.history({region_id}, start={_iso(start)}, end={_iso(end)})")
+        if forecast:
+            ahead = data_loader.forecast(region_id, metric)
+            if ahead.empty:
+                return None
+            fig.add_trace(go.Scatter(x=ahead["Date"], y=ahead["upper"], mode="lines",
+                                     line=dict(width=0), showlegend=False, hoverinfo="skip"))
+            fig.add_trace(go.Scatter(x=ahead["Date"], y=ahead["lower"], mode="lines",
+                                     line=dict(width=0), fill="tonexty", name=f"{name} interval",
+                                     fillcolor="rgba(99, 110, 250, 0.2)"))
+            fig.add_trace(go.Scatter(x=ahead["Date"], y=ahead["forecast"], mode="lines",
+                                     line=dict(dash="dash"), name=f"{name} forecast"))
+            final = ahead.iloc[-1]
+            sentence += (f" The forecast reaches {_format_value(metric, final['forecast'])} by "
+                         f"{_month(final['Date'])}, within {_format_value(metric, final['lower'])}"
+                         f" to {_format_value(metric, final['upper'])}.")
+            lines.append(f"ahead = data_loader.forecast({region_id}, {metric!r})")
+        sentences.append(sentence)
+    if not sentences:
+        return None
+
+    what = "forecast" if forecast else "history"
+    title = f"{_capitalized(_label(metric))} {what}: {', '.join(names)}"
+    fig.update_layout(title=title, xaxis_title="Date", yaxis_title=_label(metric),
+                      hovermode="x unified")
+    code = "\n".join(["fig = go.Figure()"] + [
+        line + (f"\nfig.add_trace(go.Scatter(x=rows['Date'], y=rows[{metric!r}], mode='lines'))"
+                if line.startswith("rows") else
+                "\nfig.add_trace(go.Scatter(x=ahead['Date'], y=ahead['forecast'], line=dict(dash='dash')))")
+        for line in lines
+    ] + [f"fig.update_layout(title={title!r})"])
+    explanation = f"{title}. " + " ".join(sentences) + f" {_context(intent, metric)}"
+    return fig, code, explanation.strip()
+
+
+def _iso(date) -> str:
+    """A date literal for generated code, or None."""
+    return "None" if date is None else repr(pd.Timestamp(date).strftime("%Y-%m-%d"))
+
+
+_ANSWERS = {"ranking": _ranking, "major": _major, "trend": _trend}
+
+
+def route(query: str, data_loader) -> Optional[Tuple[go.Figure, str, str]]:
+    """``(fig, code, explanation)`` for a recognized question, else None.
+
+    ``code`` is the equivalent loader calls, shown in place of generated
+    code. Any failure to answer falls through to the model.
+    """
+    if data_loader is None or not query or not query.strip():
+        return None
+    try:
+        intent = _parse(query, data_loader)
+        if intent is None or intent["metric"] not in data_loader.snapshots.metrics:
+            return None
+        return _ANSWERS[intent["kind"]](data_loader, intent)
+    except (KeyError, ValueError, IndexError) as e:
+        logger.warning("Fast path could not answer %r: %s", query, e)
+        return None
+
+
+def warm() -> None:
+    """Import the chart classes answers are drawn with, which plotly loads on first use.
+
+    They cost about half a second; call it in a process about to fork, such
+    as a preloading gunicorn master, so no request pays for it.
+    """
+    go.Figure([go.Bar(), go.Scatter()]).update_layout(
+        title="", xaxis_title="", yaxis=dict(autorange="reversed"), hovermode="x unified")
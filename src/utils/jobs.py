@@ -0,0 +1,175 @@
+"""Background jobs with a disk-backed status store."""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from src.config import JOB_DIR, JOB_RETENTION_SECONDS, JOB_WORKERS
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+logger = logging.getLogger(__name__)
+
+
+def _process_alive(pid: int) -> bool:
+    """Whether a process with this id exists on this machine."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Job status and results as JSON files, readable by every web worker.
+
+    The status file stays small so it can be polled cheaply; the result of a
+    finished job is written to its own file. Jobs run in the web worker that
+    created them and record its process id; when that process is gone, for
+    example after gunicorn recycled it, an unfinished job is reported as
+    failed instead of running forever.
+    """
+
+    def __init__(self, directory: str = JOB_DIR):
+        """Keep job files under ``directory``."""
+        self.directory = directory
+
+    def _path(self, job_id: str, suffix: str = "") -> str:
+        """File of a job; ids are validated so they cannot escape the directory."""
+        if not JOB_ID_PATTERN.match(job_id or ""):
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        return os.path.join(self.directory, f"{job_id}{suffix}.json")
+
+    def _write(self, path: str, content: Dict[str, Any]) -> None:
+        """Write a JSON file atomically."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as handle:
+            json.dump(content, handle)
+        os.replace(tmp_path, path)
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        """Read a JSON file, or None when it does not exist."""
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def create(self, kind: str) -> Dict[str, Any]:
+        """Record a new queued job."""
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "stage": "queued",
+            "stages": [],
+            "error": None,
+            "owner": os.getpid(),
+            "created": now,
+            "updated": now,
+        }
+        self._write(self._path(job["id"]), job)
+        return job
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current status of a job, or None if it is unknown."""
+        try:
+            job = self._read(self._path(job_id))
+        except ValueError:
+            return None
+        if (job is not None and job["status"] in ("queued", "running")
+                and not _process_alive(job.get("owner", os.getpid()))):
+            self.finish(job, error="The worker running this job stopped; please try again")
+        return job
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Result of a finished job, or None."""
+        try:
+            return self._read(self._path(job_id, ".result"))
+        except ValueError:
+            return None
+
+    def update(self, job: Dict[str, Any], **fields) -> None:
+        """Change fields of a job owned by the calling thread and save it."""
+        job.update(fields, updated=time.time())
+        self._write(self._path(job["id"]), job)
+
+    def start_stage(self, job: Dict[str, Any], stage: str) -> None:
+        """Close the running stage, if any, and start ``stage``."""
+        now = time.time()
+        if job["stages"] and job["stages"][-1]["finished"] is None:
+            job["stages"][-1]["finished"] = now
+        job["stages"].append({"name": stage, "started": now, "finished": None})
+        self.update(job, status="running", stage=stage)
+
+    def finish(self, job: Dict[str, Any], result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None) -> None:
+        """Store the result and mark the job done, or failed with ``error``."""
+        if job["stages"] and job["stages"][-1]["finished"] is None:
+            job["stages"][-1]["finished"] = time.time()
+        if result is not None:
+            self._write(self._path(job["id"], ".result"), result)
+        status = "error" if error else "done"
+        self.update(job, status=status, stage=status, error=error)
+
+    def purge(self, max_age: float = JOB_RETENTION_SECONDS) -> None:
+        """Delete job files older than ``max_age`` seconds."""
+        if not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class JobQueue:
+    """Run jobs on a local thread pool and record their progress.
+
+    Submitting returns immediately with a job id, so the request that started
+    a job never waits for it. Jobs report stages through the ``progress``
+    keyword argument they are called with.
+    """
+
+    def __init__(self, store: Optional[JobStore] = None, max_workers: int = JOB_WORKERS):
+        """Create a queue running at most ``max_workers`` jobs at a time."""
+        self.store = store or JobStore()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(self, kind: str, func: Callable[..., Dict[str, Any]], *args, **kwargs) -> str:
+        """Queue ``func(*args, progress=..., **kwargs)`` and return the job id.
+
+        ``func`` must return a JSON-serializable result dict.
+        """
+        self.store.purge()
+        job = self.store.create(kind)
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job["id"]
+
+    def _run(self, job: Dict[str, Any], func: Callable[..., Dict[str, Any]],
+             args: tuple, kwargs: Dict[str, Any]) -> None:
+        """Execute a job and record its outcome."""
+        try:
+            result = func(*args, progress=lambda stage: self.store.start_stage(job, stage), **kwargs)
+        except Exception as e:
+            logger.exception("Job %s failed: %s", job["id"], e)
+            self.store.finish(job, error=str(e))
+            return
+        self.store.finish(job, result=result)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting jobs, optionally waiting for running ones."""
+        self._executor.shutdown(wait=wait)
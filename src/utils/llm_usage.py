@@ -0,0 +1,139 @@
+"""Token counts and latency of model calls.
+
+Every call and every visualization request is appended to a JSON lines log,
+which is rotated once it grows past ``LLM_USAGE_LOG_MAX_BYTES``. Summarize it
+with::
+
+    python -m src.utils.llm_usage
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.config import LLM_USAGE_LOG, LLM_USAGE_LOG_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+def response_tokens(response) -> Dict[str, Optional[int]]:
+    """Prompt and completion token counts reported with a chat completion."""
+    usage = getattr(response, "usage", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+
+
+class UsageLog:
+    """Append-only log of model calls and the requests they served.
+
+    Once the file reaches ``max_bytes`` it is renamed to ``<path>.1``,
+    replacing the previous one, and a new file is started, so the log never
+    takes more than about twice that.
+    """
+
+    def __init__(self, path: str = LLM_USAGE_LOG, max_bytes: int = LLM_USAGE_LOG_MAX_BYTES):
+        """Append entries to ``path``."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def previous_path(self) -> str:
+        """Where the log is moved when it is rotated."""
+        return self.path + ".1"
+
+    def record(self, kind: str, entry: Dict[str, Any]) -> None:
+        """Append an entry; failures are logged, never raised."""
+        line = json.dumps(dict(entry, kind=kind, time=time.time()))
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as handle:
+                    handle.write(line + "\n")
+                    full = handle.tell() >= self.max_bytes
+                if full:
+                    os.replace(self.path, self.previous_path)
+        except OSError as e:
+            logger.warning("Could not record model usage: %s", e)
+
+    def read(self) -> List[Dict[str, Any]]:
+        """Every recorded entry, oldest first, including the rotated file."""
+        entries = []
+        for path in (self.previous_path, self.path):
+            try:
+                with open(path) as handle:
+                    for line in handle:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            continue
+            except OSError:
+                pass
+        return entries
+
+
+def summarize(entries: List[Dict[str, Any]]) -> str:
+    """Per-stage token and latency averages, and end-to-end request times."""
+    import pandas as pd
+
+    frame = pd.DataFrame(entries)
+    if frame.empty:
+        return "No model usage recorded."
+    lines = []
+    calls = frame[frame["kind"] == "call"]
+    if len(calls):
+        stages = calls.groupby("stage").agg(
+            calls=("seconds", "size"),
+            prompt_tokens=("prompt_tokens", "mean"),
+            completion_tokens=("completion_tokens", "mean"),
+            prompt_chars=("prompt_chars", "mean"),
+            p50_seconds=("seconds", "median"),
+            p95_seconds=("seconds", lambda seconds: seconds.quantile(0.95)),
+        )
+        lines += ["Model calls (means per call):", stages.round(1).to_string(), ""]
+    requests = frame[frame["kind"] == "request"]
+    if len(requests):
+        tokens = requests["prompt_tokens"].fillna(0) + requests["completion_tokens"].fillna(0)
+        # Requests logged before the fast path existed have no fast_path field
+        fast = requests.get("fast_path", pd.Series(False, index=requests.index))
+        fast = fast.fillna(False).astype(bool)
+        uncached = requests[~requests["cached"].astype(bool) & ~fast]
+        lines += [
+            "Visualization requests:",
+            f"  requests           {len(requests):,}",
+            f"  cache hits         {requests['cached'].astype(bool).mean():.1%}",
+            f"  fast path          {fast.mean():.1%}",
+            f"  errors             {(~requests['ok'].astype(bool)).mean():.1%}",
+            f"  tokens / request   {tokens.mean():,.0f}",
+            f"  p50 / p95 seconds  {requests['seconds'].median():.2f} / "
+            f"{requests['seconds'].quantile(0.95):.2f}",
+        ]
+        if len(uncached):
+            lines.append(f"  uncached p50 / p95 {uncached['seconds'].median():.2f} / "
+                         f"{uncached['seconds'].quantile(0.95):.2f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point printing the usage summary."""
+    parser = argparse.ArgumentParser(description="Summarize model token usage and latency.")
+    parser.add_argument("--log", default=LLM_USAGE_LOG, help="Usage log to read.")
+    parser.add_argument("--since", type=float, default=None,
+                        help="Only entries from the last N hours.")
+    args = parser.parse_args(argv)
+
+    entries = UsageLog(args.log).read()
+    if args.since is not None:
+        cutoff = time.time() - args.since * 3600
+        entries = [entry for entry in entries if entry.get("time", 0) >= cutoff]
+    print(summarize(entries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Pre-serialized main map figure served with HTTP caching headers."""
+
+import gzip
+import hashlib
+
+import pandas as pd
+import plotly.io as pio
+from flask import Request, Response
+
+from src.utils.visualization import create_map_visualization
+
+# Bump when the figure layout changes so browsers drop cached copies
+MAP_PAYLOAD_FORMAT = 2
+
+
+class MapPayload:
+    """The map figure of one data version as JSON bytes, plain and gzipped.
+
+    The version is part of the figure URL, so responses can be cached by
+    the browser indefinitely; a new data version gets a new URL.
+    """
+
+    def __init__(self, data: pd.DataFrame, data_version: str):
+        """Build and serialize the map figure for ``data``."""
+        self.version = hashlib.sha1(
+            f"{data_version}:{MAP_PAYLOAD_FORMAT}".encode()
+        ).hexdigest()[:16]
+        self.etag = f'"{self.version}"'
+        self.body = pio.to_json(create_map_visualization(data), validate=False).encode()
+        self.gzipped = gzip.compress(self.body, compresslevel=6)
+
+    def response(self, request: Request) -> Response:
+        """Serve the figure, honouring If-None-Match and Accept-Encoding."""
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "Vary": "Accept-Encoding",
+        }
+        if self.etag in request.headers.get("If-None-Match", ""):
+            return Response(status=304, headers=headers)
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzipped, mimetype="application/json", headers=headers)
+        return Response(self.body, mimetype="application/json", headers=headers)
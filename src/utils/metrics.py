@@ -0,0 +1,243 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+Counters and histograms live in one registry per process and are served
+by the app's ``/metrics`` route. When ``METRICS_ENABLED`` is off, ``timed``
+returns functions undecorated and every other recording call is a no-op, so
+instrumented code runs as it would without it. Each gunicorn worker keeps
+its own counts.
+"""
+
+import bisect
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from src.config import METRICS_ENABLED
+
+# Upper bounds of latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Upper bounds of size buckets, in bytes
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """``{a="x",b="y"}``, or an empty string without labels."""
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    """A sample value as Prometheus writes it."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """A named family of samples with a fixed set of label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        """Label values in declaration order."""
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        """Exposition lines of the family, header included."""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A value that only goes up, per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Add ``amount`` to the counter of ``labels``."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Current value for ``labels``."""
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label combination: bucket counts (the last is +Inf), sum
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation for ``labels``."""
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][position] += 1
+            series[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        """Number of observations for ``labels``."""
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        lines = super().render()
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metric families of a process, plus collectors read at scrape time."""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        """Create an empty registry; a disabled one records nothing."""
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        """Return the existing family of that name, or register ``metric``."""
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        """A counter family, created on first request."""
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """A histogram family, created on first request."""
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, name: str, documentation: str, kind: str,
+                  collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> None:
+        """Read ``(labels, value)`` pairs from ``collect`` at each scrape.
+
+        For values the code already counts, such as cache hits, so nothing
+        is added to the code that counts them.
+        """
+        self._collectors.append((name, documentation, kind, collect))
+
+    def render(self) -> str:
+        """Every family in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        for name, documentation, kind, collect in self._collectors:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+            for labels, value in collect():
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} "
+                             f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Families shared by the app, the loader and the visualization pipeline
+request_seconds = registry.histogram(
+    "http_request_seconds", "Latency of Flask requests, by endpoint and Dash callback.",
+    ["endpoint", "callback"])
+response_bytes = registry.histogram(
+    "http_response_bytes", "Size of Flask response bodies, by endpoint and Dash callback.",
+    ["endpoint", "callback"], SIZE_BUCKETS)
+loader_seconds = registry.histogram(
+    "loader_call_seconds", "Latency of DataLoader methods.", ["method"])
+stage_seconds = registry.histogram(
+    "visualization_stage_seconds", "Duration of each visualization pipeline stage.", ["stage"])
+exec_seconds = registry.histogram(
+    "code_exec_seconds", "Duration of running generated code, by where it ran and outcome.",
+    ["mode", "outcome"])
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Tokens sent to and received from the model, by stage.", ["stage", "kind"])
+visualization_requests = registry.counter(
+    "visualization_requests_total", "Visualization requests, by outcome.", ["outcome"])
+
+
+def timed(histogram: Histogram, **labels: str) -> Callable[[Callable], Callable]:
+    """Decorator observing each call's duration; returns the function as-is when disabled."""
+    def decorate(func: Callable) -> Callable:
+        if not registry.enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def timer(histogram: Histogram, **labels: str) -> Iterator[None]:
+    """Observe the duration of the enclosed block."""
+    if not registry.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def observe(histogram: Histogram, value: float, **labels: str) -> None:
+    """Record a value when metrics are enabled."""
+    if registry.enabled:
+        histogram.observe(value, **labels)
+
+
+def inc(counter: Counter, amount: Optional[float] = 1, **labels: str) -> None:
+    """Increase a counter when metrics are enabled; None amounts are skipped."""
+    if registry.enabled and amount is not None:
+        counter.inc(amount, **labels)
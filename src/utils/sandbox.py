@@ -0,0 +1,355 @@
+"""Isolated execution of generated visualization code."""
+
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from functools import lru_cache
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from src.config import SANDBOX_MEMORY_LIMIT_MB, SANDBOX_POOL_SIZE, SANDBOX_TIMEOUT_SECONDS
+from src.utils.memory import virtual_memory_bytes
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+@lru_cache(maxsize=None)
+def _libraries() -> Dict[str, Any]:
+    """Modules and names available to generated code, imported once."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+    import sklearn
+    from prophet import Prophet
+    from sklearn.linear_model import LinearRegression
+    from sklearn.metrics import mean_squared_error
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import PolynomialFeatures
+
+    return {
+        "pd": pd,
+        "px": px,
+        "go": go,
+        "Prophet": Prophet,
+        "LinearRegression": LinearRegression,
+        "train_test_split": train_test_split,
+        "mean_squared_error": mean_squared_error,
+        "sklearn": sklearn,
+        "make_pipeline": make_pipeline,
+        "PolynomialFeatures": PolynomialFeatures,
+        "np": np,
+    }
+
+
+def run_code(code: str, namespace: Dict[str, Any]):
+    """Execute generated code with ``namespace`` as globals and return its ``fig``."""
+    globals_dict = dict(_libraries())
+    globals_dict.update(namespace)
+    locals_dict = {}
+    exec(code, globals_dict, locals_dict)
+    if "fig" not in locals_dict:
+        raise ValueError("Code did not generate a figure. Make sure your code creates a 'fig' variable.")
+    return locals_dict["fig"]
+
+
+def _worker_main(conn, namespace_factory: Callable[[str], Dict[str, Any]], memory_limit: int) -> None:
+    """Serve code from ``conn`` until the pipe closes."""
+    import plotly.io as pio
+
+    _libraries()
+    if resource is not None and memory_limit:
+        # The forked address space already holds the spawner's heap and
+        # libraries, so the cap is headroom on top of it
+        limit = virtual_memory_bytes() + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            code = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            fig = run_code(code, namespace_factory(code))
+            conn.send(("ok", pio.to_json(fig, validate=False)))
+        except MemoryError:
+            conn.send(("error", f"Code exceeded the {memory_limit // 2 ** 20} MB memory limit"))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+def _spawner_main(conn, factories: Dict[Hashable, Callable[[str], Dict[str, Any]]]) -> None:
+    """Fork workers on request until the pipe closes; runs with a single thread."""
+    # Workers are reaped as they exit, since the web process kills them by pid
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    _libraries()
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        kind, key = message[0], message[1]
+        try:
+            if kind == "load":
+                loader, args = message[2]
+                factories[key] = loader(*args)
+                conn.send(("ok", None))
+            elif kind == "forget":
+                factories.pop(key, None)
+                conn.send(("ok", None))
+            elif kind == "spawn":
+                namespace_factory = factories[key]
+                parent_conn, child_conn = multiprocessing.Pipe()
+                pid = os.fork()
+                if pid == 0:
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    conn.close()
+                    parent_conn.close()
+                    try:
+                        _worker_main(child_conn, namespace_factory, message[2])
+                    finally:
+                        os._exit(0)
+                child_conn.close()
+                conn.send(("ok", pid))
+                reduction.send_handle(conn, parent_conn.fileno(), os.getppid())
+                parent_conn.close()
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """One sandbox process and the web process's end of its pipe."""
+
+    def __init__(self, conn, pid: int):
+        self.conn = conn
+        self.pid = pid
+        self.ready = False
+
+    def wait_ready(self) -> None:
+        """Block until the worker has finished starting."""
+        if not self.ready:
+            self.conn.recv()
+            self.ready = True
+
+    def kill(self) -> None:
+        """Terminate the process and release the pipe."""
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.conn.close()
+
+
+class Spawner:
+    """A single-threaded process that forks sandbox workers on request.
+
+    A child forked from a process with running threads can inherit locks held
+    by threads that do not exist in it, and deadlock. The web process forks
+    its spawner once, while it still has one thread, and from then on only
+    asks it for workers over a pipe. Workers fork from the spawner, so they
+    share the pages of the data it inherited and of the analytics libraries
+    it imports. ``factories`` maps keys to the namespace factories it
+    inherits; ``load`` builds one in the spawner later.
+    """
+
+    def __init__(self, factories: Dict[Hashable, Callable[[str], Dict[str, Any]]]):
+        """Fork the spawner process."""
+        context = multiprocessing.get_context("fork")
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_spawner_main, args=(child_conn, dict(factories)), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.owner = os.getpid()
+        self._lock = threading.Lock()
+
+    def _call(self, *message) -> Any:
+        """Send one request and return its reply; handles follow their reply."""
+        with self._lock:
+            self._conn.send(message)
+            status, payload = self._conn.recv()
+            if status != "ok":
+                raise RuntimeError(payload)
+            if message[0] == "spawn":
+                return _Worker(Connection(reduction.recv_handle(self._conn)), payload)
+            return payload
+
+    def spawn(self, key: Hashable, memory_limit: int) -> _Worker:
+        """Fork a worker over the namespace factory stored under ``key``."""
+        return self._call("spawn", key, memory_limit)
+
+    def load(self, key: Hashable, loader: Callable[..., Callable[[str], Dict[str, Any]]],
+             args: Tuple = ()) -> None:
+        """Have the spawner store ``loader(*args)`` under ``key``.
+
+        ``loader`` and ``args`` are pickled, so ``loader`` must be a module-level function.
+        """
+        self._call("load", key, (loader, args))
+
+    def forget(self, key: Hashable) -> None:
+        """Drop the namespace factory stored under ``key``."""
+        self._call("forget", key)
+
+    def close(self) -> None:
+        """Stop the spawner; workers it forked keep running until killed."""
+        with self._lock:
+            self._conn.close()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+# Namespace factories by key, inherited by this process's spawner when it forks
+_factories: Dict[Hashable, Callable[[str], Dict[str, Any]]] = {}
+_spawner: Optional[Spawner] = None
+_spawner_lock = threading.Lock()
+
+
+def get_spawner() -> Optional[Spawner]:
+    """This process's spawner, forked on first use.
+
+    None if it is not running and the process already has other threads,
+    since forking it then is what the spawner exists to avoid.
+    """
+    global _spawner
+    with _spawner_lock:
+        # A spawner inherited through a fork belongs to the parent
+        if _spawner is None or _spawner.owner != os.getpid():
+            if threading.active_count() > 1:
+                return None
+            _spawner = Spawner(_factories)
+        return _spawner
+
+
+def add_namespace(key: Hashable, namespace_factory: Callable[[str], Dict[str, Any]]) -> bool:
+    """Make a namespace factory available to workers forked under ``key``.
+
+    Only possible before the spawner forks, which then inherits it; returns
+    False once it is running.
+    """
+    with _spawner_lock:
+        if _spawner is not None and _spawner.owner == os.getpid():
+            return False
+        _factories[key] = namespace_factory
+        return True
+
+
+def remove_namespace(key: Hashable) -> None:
+    """Forget the namespace factory stored under ``key``."""
+    with _spawner_lock:
+        _factories.pop(key, None)
+        running = _spawner if _spawner is not None and _spawner.owner == os.getpid() else None
+    if running is not None:
+        try:
+            running.forget(key)
+        except (EOFError, OSError, RuntimeError):
+            pass
+
+
+def stop_spawner() -> None:
+    """Stop this process's spawner; the next ``get_spawner`` forks a new one."""
+    global _spawner
+    with _spawner_lock:
+        running = _spawner if _spawner is not None and _spawner.owner == os.getpid() else None
+        _spawner = None
+    if running is not None:
+        running.close()
+
+
+class SandboxPool:
+    """Pre-forked processes that run generated code with time and memory limits.
+
+    Workers are forked by the spawner after the data is loaded, so they
+    share its pages copy-on-write instead of reloading them, and import
+    the analytics libraries before the first request. The namespace factory
+    stored under ``key`` runs in the worker for each job, is given its code
+    and returns the globals the code sees; anything the code changes stays in
+    that worker process. A run that exceeds the timeout, or whose worker
+    dies, kills the worker; its replacement is forked when the slot is next
+    used.
+    """
+
+    def __init__(self, key: Hashable, size: int = SANDBOX_POOL_SIZE,
+                 timeout: float = SANDBOX_TIMEOUT_SECONDS,
+                 memory_limit_mb: int = SANDBOX_MEMORY_LIMIT_MB,
+                 spawner: Optional[Spawner] = None):
+        """Fork ``size`` workers through ``spawner``, or this process's spawner."""
+        self.key = key
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit = memory_limit_mb * 2 ** 20
+        self._spawner = spawner or get_spawner()
+        if self._spawner is None:
+            raise RuntimeError("The sandbox spawner must be started before other threads")
+        # Idle slots; None marks a slot whose worker was killed
+        self._idle: "queue.Queue[Optional[_Worker]]" = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    @staticmethod
+    def supported() -> bool:
+        """Whether this platform can fork workers."""
+        return "fork" in multiprocessing.get_all_start_methods()
+
+    def _spawn(self) -> _Worker:
+        """Have the spawner fork a new worker."""
+        worker = self._spawner.spawn(self.key, self.memory_limit)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker: _Worker) -> None:
+        """Kill a worker that timed out or died."""
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+
+    def run(self, code: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Run code in an idle worker; return (figure dict, None) or (None, error)."""
+        worker = self._idle.get()
+        try:
+            if worker is None:
+                if self._closed:
+                    return None, "Code execution is shutting down"
+                worker = self._spawn()
+            # Start-up time of a fresh worker does not count against the timeout
+            worker.wait_ready()
+            worker.conn.send(code)
+            if not worker.conn.poll(self.timeout):
+                self._retire(worker)
+                worker = None
+                return None, f"Code took longer than {self.timeout:g} seconds and was stopped"
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError, RuntimeError):
+            if worker is not None:
+                self._retire(worker)
+                worker = None
+            return None, "Code execution process exited unexpectedly"
+        finally:
+            self._idle.put(worker)
+        if status == "ok":
+            return json.loads(payload), None
+        return None, payload
+
+    def close(self) -> None:
+        """Stop every worker."""
+        self._closed = True
+        with self._lock:
+            workers, self._workers = list(self._workers), set()
+        for worker in workers:
+            worker.kill()
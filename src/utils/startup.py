@@ -0,0 +1,99 @@
+"""Startup profile of the dashboard: import times and time to first response."""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.config import STARTUP_BUDGET_SECONDS
+from src.data.cache import PROJECT_ROOT
+
+_RESPONSE_SCRIPT = """
+import json, time
+import src.app
+imported = time.time()
+client = src.app.app.server.test_client()
+statuses = [client.get(path).status_code for path in ("/", "/_dash-layout", "/_dash-dependencies")]
+print(json.dumps({"imported": imported, "responded": time.time(), "statuses": statuses}))
+"""
+
+
+def import_times() -> List[Tuple[str, float, float]]:
+    """(module, self seconds, cumulative seconds) of every import made by the app.
+
+    The sandbox pool is disabled for this run, since forked workers would
+    report their own imports on the same stream.
+    """
+    env = dict(os.environ, SANDBOX_POOL_SIZE="0")
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.app"],
+        check=True, capture_output=True, text=True, cwd=PROJECT_ROOT, env=env,
+    ).stderr
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, module = line[len("import time:"):].split("|")
+        times.append((module.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+    return times
+
+
+def package_times(times: List[Tuple[str, float, float]]) -> Dict[str, float]:
+    """Total own import time of each top-level package, slowest first."""
+    totals: Dict[str, float] = defaultdict(float)
+    for module, own, _ in times:
+        totals[module.split(".")[0]] += own
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def first_response() -> Dict[str, float]:
+    """Start the app in a fresh interpreter and time its first responses."""
+    start = time.time()
+    output = subprocess.run(
+        [sys.executable, "-c", _RESPONSE_SCRIPT],
+        check=True, capture_output=True, text=True, cwd=PROJECT_ROOT,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return {
+        "import_seconds": result["imported"] - start,
+        "first_response_seconds": result["responded"] - start,
+        "statuses": result["statuses"],
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point; exits non-zero when the budget is exceeded."""
+    parser = argparse.ArgumentParser(description="Profile dashboard startup.")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_SECONDS,
+                        help="Maximum seconds from interpreter start to first response.")
+    parser.add_argument("--top", type=int, default=15,
+                        help="Number of packages and modules to list.")
+    args = parser.parse_args(argv)
+
+    times = import_times()
+    print(f"{'package':<40} {'import time':>12}")
+    for package, seconds in list(package_times(times).items())[:args.top]:
+        print(f"{package:<40} {seconds * 1000:>9.1f} ms")
+    print()
+    print(f"{'module (cumulative)':<40} {'import time':>12}")
+    for module, _, cumulative in sorted(times, key=lambda item: item[2], reverse=True)[:args.top]:
+        print(f"{module:<40} {cumulative * 1000:>9.1f} ms")
+    print()
+
+    result = first_response()
+    print(f"App import (data load and layout): {result['import_seconds'] * 1000:.1f} ms")
+    print(f"Time to first response:            {result['first_response_seconds'] * 1000:.1f} ms "
+          f"(budget {args.budget * 1000:.0f} ms)")
+    if any(status != 200 for status in result["statuses"]):
+        sys.exit(f"Startup requests failed with statuses {result['statuses']}")
+    if result["first_response_seconds"] > args.budget:
+        sys.exit(f"Startup budget exceeded by "
+                 f"{(result['first_response_seconds'] - args.budget) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Server-side filtering, sorting and paging for Dash DataTables."""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+FILTER_OPERATORS = [
+    ["ge ", ">="],
+    ["le ", "<="],
+    ["lt ", "<"],
+    ["gt ", ">"],
+    ["ne ", "!="],
+    ["eq ", "="],
+    ["contains "],
+    ["datestartswith "],
+]
+
+
+def split_filter_part(filter_part: str) -> Tuple[Optional[str], Optional[str], Any]:
+    """Split one ``{column} op value`` clause of a DataTable filter query."""
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find("{") + 1:name_part.rfind("}")]
+                value_part = value_part.strip()
+                if not value_part:
+                    return None, None, None
+                quote = value_part[0]
+                if quote == value_part[-1] and quote in ("'", '"', "`"):
+                    value = value_part[1:-1].replace("\\" + quote, quote)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+                return name, operator_type[0].strip(), value
+    return None, None, None
+
+
+def _clause_mask(column: pd.Series, operator: str, value: Any) -> pd.Series:
+    """Boolean mask of the rows of one column satisfying a filter clause."""
+    if operator == "contains":
+        return column.astype(str).str.contains(str(value), case=False, regex=False)
+    if operator == "datestartswith":
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.strftime("%Y-%m-%d")
+        return column.astype(str).str.startswith(str(value))
+
+    if pd.api.types.is_datetime64_any_dtype(column):
+        value = pd.Timestamp(str(value))
+    elif isinstance(column.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(column):
+        column, value = column.astype(str), str(value)
+    comparisons = {
+        "eq": column.__eq__, "ne": column.__ne__, "lt": column.__lt__,
+        "le": column.__le__, "gt": column.__gt__, "ge": column.__ge__,
+    }
+    return comparisons[operator](value)
+
+
+def filter_frame(frame: pd.DataFrame, filter_query: Optional[str]) -> pd.DataFrame:
+    """Apply a DataTable ``filter_query``; unparseable clauses are ignored."""
+    if not filter_query:
+        return frame
+    mask = np.ones(len(frame), dtype=bool)
+    for part in filter_query.split(" && "):
+        name, operator, value = split_filter_part(part)
+        if name not in frame or operator is None:
+            continue
+        try:
+            mask &= _clause_mask(frame[name], operator, value).fillna(False).to_numpy(dtype=bool)
+        except (TypeError, ValueError):
+            continue
+    return frame[mask]
+
+
+def sort_frame(frame: pd.DataFrame, sort_by: Optional[Sequence[Dict[str, str]]]) -> pd.DataFrame:
+    """Apply a DataTable ``sort_by`` list; unknown columns are ignored."""
+    sort_by = [col for col in (sort_by or []) if col.get("column_id") in frame]
+    if not sort_by:
+        return frame
+    return frame.sort_values(
+        [col["column_id"] for col in sort_by],
+        ascending=[col["direction"] == "asc" for col in sort_by],
+        kind="stable",
+        na_position="last",
+    )
+
+
+def page_frame(frame: pd.DataFrame, page_current: int, page_size: int) -> Tuple[pd.DataFrame, int]:
+    """Rows of one page and the total page count."""
+    page_size = max(int(page_size or 1), 1)
+    page_count = max(math.ceil(len(frame) / page_size), 1)
+    start = min(max(int(page_current or 0), 0), page_count - 1) * page_size
+    return frame.iloc[start:start + page_size], page_count
+
+
+def table_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataTable records with dates shown as YYYY-MM-DD.
+
+    float32 columns are widened through their shortest decimal form, so a
+    stored 673519.06 is sent as that rather than as 673519.0625.
+    """
+    formatted = {}
+    for col in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[col]):
+            formatted[col] = frame[col].dt.strftime("%Y-%m-%d")
+        elif frame[col].dtype == "float32":
+            formatted[col] = frame[col].to_numpy().astype(str).astype("float64")
+    return frame.assign(**formatted).to_dict("records")
+
+
+def table_columns(frame: pd.DataFrame) -> List[Dict[str, str]]:
+    """DataTable column definitions typed so filters compare correctly."""
+    columns = []
+    for col in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[col]):
+            kind = "datetime"
+        elif pd.api.types.is_numeric_dtype(frame[col]):
+            kind = "numeric"
+        else:
+            kind = "text"
+        columns.append({"name": col, "id": col, "type": kind})
+    return columns
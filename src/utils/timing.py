@@ -0,0 +1,38 @@
+"""Timing helpers for pipeline stages."""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class StageTimer:
+    """Record wall-clock durations for named pipeline stages."""
+
+    def __init__(self):
+        """Initialize an empty timer."""
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and add it to the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    @property
+    def total(self) -> float:
+        """Total time recorded across all stages."""
+        return sum(self.timings.values())
+
+    def report(self) -> str:
+        """Format the recorded stages as an aligned text table."""
+        width = max([len(name) for name in self.timings] + [len("total")])
+        lines = [
+            f"{name:<{width}}  {seconds * 1000:10.1f} ms"
+            for name, seconds in self.timings.items()
+        ]
+        lines.append(f"{'total':<{width}}  {self.total * 1000:10.1f} ms")
+        return "\n".join(lines)
@@ -1,68 +1,224 @@
 """Visualization utilities for the dashboard."""
 
 import ast
+import logging
 import plotly.express as px
-from openai import OpenAI
 import plotly.graph_objects as go
-from typing import Optional, Tuple, Union
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error
-from prophet import Prophet 
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import threading
+import time
+import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use("Agg")
 from src.config import (
     OPENAI_API_KEY,
     OPENAI_MODEL,
     MAP_STYLE,
     DEFAULT_MAP_CENTER,
     DEFAULT_MAP_ZOOM,
+    FORECAST_HORIZON,
+    FORECAST_METRICS,
+    SANDBOX_POOL_SIZE,
+    DATA_LEVELS,
 )
-
-client = OpenAI(api_key=OPENAI_API_KEY)
+from src.data.views import request_namespace
+from src.utils import intents, metrics, sandbox
+from src.utils.llm_usage import UsageLog, response_tokens
+from src.utils.sandbox import SandboxPool, run_code
+from src.utils.viz_cache import VisualizationCache
+
+logger = logging.getLogger(__name__)
+
+viz_cache = VisualizationCache()
+usage_log = UsageLog()
+
+# Worker pools by the panel frame their workers see, one per loaded data
+# version; the frames are kept with each pool so their ids stay unique
+_sandboxes: Dict[int, Tuple[pd.DataFrame, pd.DataFrame, SandboxPool]] = {}
+_sandbox_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _get_client():
+    """OpenAI client, imported and created on first use."""
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY)
+
+
+def _loaded_namespace(data_path: str, cache_dir: Optional[str], data_version: str):
+    """Namespace factory over the data on disk, built in the spawner for a reloaded version."""
+    from src.data.data_loader import DataLoader
+
+    loader = DataLoader(data_path, cache_dir)
+    loader.load_data()
+    if loader.data_version != data_version:
+        raise ValueError(f"The data changed again while loading version {data_version}")
+    # Built once here instead of in each worker forked from the spawner
+    loader.warm(derived=False)
+    return lambda code: request_namespace(loader.data, loader.second_latest_data, loader, code)
+
+
+def get_sandbox(data: pd.DataFrame, second_latest_data: pd.DataFrame,
+                data_loader=None) -> Optional[SandboxPool]:
+    """Worker pool over the given frames, or None to run code in-process.
+
+    Each data version gets its own pool, so jobs still running on a version
+    that was replaced keep their workers until ``close_sandbox`` retires it.
+    Workers fork from the spawner, which inherits the frames of versions
+    loaded before it started; call this at startup, before any request
+    threads exist. For a version loaded later, such as a reload, the
+    spawner loads ``data_loader``'s data from disk itself; without a loader
+    such a version runs its code in-process.
+    """
+    if SANDBOX_POOL_SIZE <= 0 or not SandboxPool.supported():
+        return None
+    with _sandbox_lock:
+        entry = _sandboxes.get(id(data))
+        if entry is not None and entry[0] is data and entry[1] is second_latest_data:
+            return entry[2]
+        if entry is not None:
+            # A frame with a recycled id; its version was retired
+            _sandboxes.pop(id(data))[2].close()
+
+    # Built outside the lock: loading a reloaded version in the spawner takes
+    # seconds, and jobs on the current version must not wait for it
+    try:
+        if not sandbox.add_namespace(
+                id(data), lambda code: request_namespace(data, second_latest_data, data_loader, code)):
+            if data_loader is None:
+                return None
+            sandbox.get_spawner().load(
+                id(data), _loaded_namespace,
+                (data_loader.data_path, data_loader.cache_dir, data_loader.data_version))
+        pool = SandboxPool(id(data))
+    except (RuntimeError, EOFError, OSError) as e:
+        logger.warning("Running generated code in-process: %s", e)
+        return None
+    with _sandbox_lock:
+        entry = _sandboxes.get(id(data))
+        if entry is None or entry[0] is not data:
+            entry = _sandboxes[id(data)] = (data, second_latest_data, pool)
+            pool = None
+    if pool is not None:
+        # Another thread built this version's pool first
+        pool.close()
+    return entry[2]
+
+
+def close_sandbox(data: Optional[pd.DataFrame] = None) -> None:
+    """Stop the worker pool over ``data``, or every pool and the spawner.
+
+    For a retired data version, or in a gunicorn master whose workers start
+    their own spawners.
+    """
+    with _sandbox_lock:
+        if data is None:
+            entries = list(_sandboxes.values())
+            _sandboxes.clear()
+        else:
+            entry = _sandboxes.get(id(data))
+            entries = [_sandboxes.pop(id(data))] if entry is not None and entry[0] is data else []
+    for entry in entries:
+        entry[2].close()
+        sandbox.remove_namespace(id(entry[0]))
+    if data is None:
+        sandbox.stop_spawner()
+
+
+# Hover fields of the main map and the precision they are shown with
+MAP_HOVER_FIELDS = [
+    ("Metro_market_temp_index", 2),
+    ("Metro_invt_fs", 2),
+    ("Metro_mean_doz_pending", 2),
+    ("Metro_mean_sale_to_list", 2),
+    ("Metro_median_sale_price", 2),
+    ("Metro_mlp", 2),
+    ("Metro_new_con_median_sale_price", 2),
+    ("Metro_new_con_sales_count_raw", 0),
+    ("Metro_new_listings", 0),
+    ("Metro_pct_sold_above_list", 2),
+    ("Metro_perc_listings_price_cut", 2),
+    ("Metro_sales_count_now", 0),
+    ("Metro_total_transaction_value", 2),
+    ("Metro_zhvi", 2),
+    ("Metro_zordi", 2),
+    ("Metro_zori", 2),
+]
+
+
+def map_customdata(data) -> np.ndarray:
+    """Hover values of the main map, one rounded column per hover field.
+
+    ``data`` is a DataFrame or a dict of arrays. The result is a plain float
+    array, which serializes far faster than one holding Python objects.
+    """
+    columns = [
+        np.round(np.asarray(data[col], dtype="float64"), digits)
+        for col, digits in MAP_HOVER_FIELDS if col in data
+    ]
+    return np.column_stack(columns) if columns else np.empty((0, 0))
 
 
 def create_map_visualization(
     data: pd.DataFrame,
-) -> Union[px.scatter_mapbox, px.scatter]:
-    """Create the main map visualization."""
-    return px.scatter_mapbox(
-        data,
-        lat="latitude",
-        lon="longitude",
-        hover_name="RegionName",
-        hover_data={
-            "StateName": True,
-            "Metro_market_temp_index": ":.2f",
-            "Metro_invt_fs": ":.2f",
-            "Metro_mean_doz_pending": ":.2f",
-            "Metro_mean_sale_to_list": ":.2f",
-            "Metro_median_sale_price": ":.2f",
-            "Metro_mlp": ":.2f",
-            "Metro_new_con_median_sale_price": ":.2f",
-            "Metro_new_con_sales_count_raw": ":.0f",
-            "Metro_new_listings": ":.0f",
-            "Metro_pct_sold_above_list": ":.2f",
-            "Metro_perc_listings_price_cut": ":.2f",
-            "Metro_sales_count_now": ":.0f",
-            "Metro_total_transaction_value": ":.2f",
-            "Metro_zhvi": ":.2f",
-            "Metro_zordi": ":.2f",
-            "Metro_zori": ":.2f",
-        },
-        color="Metro_market_temp_index",
-        color_continuous_scale="Viridis",
+    metric: str = "Metro_market_temp_index",
+) -> go.Figure:
+    """Create the main map visualization, colored by ``metric``.
+
+    Hover values are rounded to the precision they are shown with and packed
+    into one ``customdata`` array read by a single hover template, which
+    keeps the serialized figure small. StateName is carried in ``text`` so
+    ``customdata`` stays numeric.
+    """
+    fields = [(col, digits) for col, digits in MAP_HOVER_FIELDS if col in data]
+    hovertemplate = "<b>%{hovertext}</b><br><br>StateName=%{text}"
+    for position, (col, digits) in enumerate(fields):
+        hovertemplate += f"<br>{col}=%{{customdata[{position}]:.{digits}f}}"
+
+    fig = go.Figure(go.Scattermapbox(
+        lat=data["latitude"].astype("float64").round(4),
+        lon=data["longitude"].astype("float64").round(4),
+        mode="markers",
+        hovertext=data["RegionName"].astype(object),
+        text=data["StateName"].astype(object),
+        customdata=map_customdata(data),
+        hovertemplate=hovertemplate + "<extra></extra>",
+        marker=dict(
+            color=data[metric].astype("float64").round(4),
+            coloraxis="coloraxis",
+        ),
+    ))
+    fig.update_layout(
         title="Interactive Map of Metro Metrics",
-        mapbox_style=MAP_STYLE,
-        zoom=DEFAULT_MAP_ZOOM,
-        center=DEFAULT_MAP_CENTER,
+        coloraxis=dict(
+            colorscale="Viridis",
+            colorbar=dict(title=dict(text=metric)),
+        ),
+        mapbox=dict(style=MAP_STYLE, zoom=DEFAULT_MAP_ZOOM, center=DEFAULT_MAP_CENTER),
+        margin=dict(t=60),
     )
+    return fig
+
+
+def _get_derived_context() -> str:
+    """Describe the derived columns generated code can use."""
+    return """
+    DERIVED METRICS (precomputed; use these instead of groupby, pct_change or rolling):
+        For every Metro_* column, e.g. Metro_zhvi, these columns can be used in
+        `data` and `second_latest_data` by name; they are added when your code mentions them:
+        - Metro_zhvi_mom: Percent change from the previous month (2.5 = 2.5%)
+        - Metro_zhvi_yoy: Percent change from the same month a year earlier
+        - Metro_zhvi_roll3: Mean of the last 3 months
+        - Metro_zhvi_roll12: Mean of the last 12 months
+        - Metro_zhvi_yoy_accel: Change in the yoy percent change from the previous month
+          (percentage points; positive means growth is speeding up)
+        They are computed per metro on calendar months and are NaN where a month is missing.
+    """
 
 
 def _get_data_context() -> str:
     """Generate the common data context for both agents."""
-    return """
+    return f"""
     Dataset Structure and Column Names:
     1. Location Identifiers:
         - RegionName: Metro area name (use for city filtering)
@@ -94,8 +250,9 @@ def _get_data_context() -> str:
         - Metro_zori: Zillow Observed Rent Index
 
     5. Time Information:
-        - Date: Time period of data (YYYY-MM-DD format)
+        - Date: Month-end date of the data point (datetime64)
 
+    {_get_derived_context()}
     Data Characteristics:
         - Monthly frequency
         - Monetary values in USD
@@ -104,8 +261,45 @@ def _get_data_context() -> str:
     """
 
 
-def _generate_visualization_prompt(query: str) -> str:
-    """Generate the prompt for the code generation agent."""
+def _get_loader_api_context() -> str:
+    """Describe the DataLoader lookups available to generated code."""
+    return f"""
+    FAST LOOKUPS (prefer these over filtering and sorting `data`):
+       `data_loader` is available. `region` may be a RegionID or a metro name such as 'Boston, MA'.
+       - data_loader.resolve_region(region): RegionID of the best matching metro, or None
+       - data_loader.latest(region) / data_loader.second_latest(region): most recent rows as a Series
+       - data_loader.as_of(region, '2022-06-30'): most recent row on or before a date
+       - data_loader.history(region, start='2019-01-01', end=None): rows in a date range, newest first
+       - data_loader.get_snapshot(date): one row per metro with each metric's latest value as of the date
+       - data_loader.rank_markets(metric, n=10, date=None, region='South', states=['TX'], ascending=False):
+         top n metros by any metric, including derived ones such as 'Metro_zhvi_yoy';
+         region is Northeast, South, Midwest or West
+       - data_loader.forecast(region, metric='Metro_zhvi'): precomputed {FORECAST_HORIZON}-month forecast with
+         columns Date, forecast, lower, upper (oldest first) for {', '.join(FORECAST_METRICS)};
+         empty when no forecast exists
+    {_get_store_context()}"""
+
+
+def _get_store_context() -> str:
+    """Describe the partitioned geography levels available to generated code, if any."""
+    if not DATA_LEVELS:
+        return ""
+    return f"""
+    OTHER GEOGRAPHIES:
+       data_loader.stores maps each of {', '.join(repr(level) for level in DATA_LEVELS)} to a store of that
+       level's regions (RegionName is the county or ZIP), with the same methods and signatures:
+       search_metro(query), resolve_region(region), latest(region), history(region, start, end),
+       get_snapshot(date, states=['TX']), rank_markets(metric, n, date, region, states, ascending).
+       Metric columns use the Metro_* names at every level. Pass states when you can: each call reads
+       only the states it needs. A level is missing from the dict when its data was not built.
+    """
+
+
+def _generate_visualization_prompt(query: str, profile: str = "") -> str:
+    """Generate the prompt for the code generation agent.
+
+    ``profile`` is the data loader's summary of the loaded panel.
+    """
     return f"""
     You are a data visualization expert with creative freedom to make beautiful, informative visualizations.
     Your goal is to tell the best possible data story while maintaining precise Python syntax. NO comments, NO explanations, NO fig.show(), and NO additional text of any kind.
@@ -122,17 +316,13 @@ def _generate_visualization_prompt(query: str) -> str:
        - if two cities have the same name, use the region name to differentiate them. For exampmple: Query contains Fayeteville. See if the query contains the state name as well to differentiate between the two cities.
     
     2. For Metrics:
-       - 'Metro_market_temp_index' for market temperature
-       - 'Metro_median_sale_price' for prices
-       - 'Metro_invt_fs' for inventory
-       - 'Metro_mean_doz_pending' for days pending
+       - Use the Metro_* names listed in DATA PROFILE below, e.g. 'Metro_median_sale_price' for prices
        
     3. Time Data:
        - Use 'Date' for time series
        - Example: data.sort_values('Date')
-       -REQUIRED CODE STRUCTURE:
-        -ALWAYS start with date conversion:
-        - data['Date'] = pd.to_datetime(data['Date'])
+       - 'Date' is already datetime64; NEVER call pd.to_datetime on it
+       - RegionName, StateName and RegionType are categorical; pass observed=True when grouping by them
        
     4. For State Level:
        - Use 'StateName' for state filtering
@@ -145,27 +335,24 @@ def _generate_visualization_prompt(query: str) -> str:
 
     Remember: ALWAYS use these exact column names - the code will fail if using 'Market', 'City', or other variations.
 
+    DATA PROFILE:
+    {profile}
+    {_get_derived_context()}
+    {_get_loader_api_context()}
+
     The dataset is already loaded into a DataFrame called `data`.
 
     If no date is specified, assume the latest date that has data available.
-
-    only use these packages: pandas, plotly.express (as px), and plotly.graph_objects (as go), sklearn (as )
     
     IMPORTANT PROPHET GUIDELINES:
+    For forecasts of {', '.join(FORECAST_METRICS)}, use data_loader.forecast(region, metric) and plot it
+    with the region's history; only fit a model when it returns an empty frame.
     When using Prophet for forecasting:
     1. NEVER use model.plot() - it creates matplotlib figures which are not compatible
     2. Instead, create Plotly figures from Prophet predictions like this. Remember to disregard latest dates from all sklearn and prophet models, the latest date should be the second latest date.
     3. ensure that all data that is necessary is present before running the model.
     4. Ensure that the data is sorted by date before running the model but remember the latest date should be the second latest date.
 
-    ALWAYS verify the data that will be used for the analysis. Here are few ideas for doing so: 
-    - Checking the first few rows: data.head()
-    - Checking the data types: data.info()
-    - Checking for missing values: data.isnull().sum()
-      # Get unique dates and verify
-        available_dates = sorted(data['Date'].unique())
-        print(f"Available dates: available_dates[-5:]")  
-    
     DATA VALIDATION RULES (Required) (*code* is placeholder for actual code):
     1. Always check if filtered data exists:
         city_data = data[data['RegionName'] == 'Boston']
@@ -177,19 +364,13 @@ def _generate_visualization_prompt(query: str) -> str:
             max_price = city_data['Metro_median_sale_price'].max()
             max_price_date = city_data.loc[city_data['Metro_median_sale_price'] == max_price, 'Date'].iloc[0]
     
-    3. Print data checks (for debugging):
-        print(f"Total records: *code*")
-        print(f"Filtered records: *code*")
-        print(f"Available cities: *code*)
-    
-    4. Safe data access example:
+    3. Safe data access example:
         city_data = data[data['RegionName'].str.contains('Boston', case=False)]
         if len(city_data) > 0:
             # proceed with visualization
         else:
             fig = go.Figure()
             fig.add_annotation(text="No data available", xref="paper", yref="paper", x=0.5, y=0.5)")
-        print(f"Available cities: *code*")
 
 
     If it is cross-sectional, be sure there are no duplicate RegionName's. 
@@ -200,54 +381,9 @@ def _generate_visualization_prompt(query: str) -> str:
 
     When I say constructing the most homes, use Metro_new_con_sales_count_raw
 
-    CREATIVE OPTIONS (All Available):
-    1. Visual Elements:
-        - Any figure dimensions
-        - Custom color schemes
-        - Multiple traces/lines
-        - Statistical overlays (moving averages, trends)
-        - Annotations and reference lines
-        - Subplots and secondary axes
-        - Customized hover information
-        - Interactive range selectors
-    
-    2. Data Analysis:
-        - Rolling averages
-        - Growth rates
-        - Seasonality
-        - Year-over-year comparisons
-        - Price acceleration
-        - Market cycle indicators
-        - Correlations and regressions
-        - Outlier detection and analysis
-
-    3. Geographic Visualization:
-        - Choropleth maps
-        - Bubble maps
-        - Heatmaps
-        - Custom map markers
-        - Mapbox customization
-        - Geographic overlays
-
-    4. Chart Types:
-        - Line charts
-        - Bar charts
-        - Scatter plots
-        - Area charts
-        - Histograms
-        - Box plots
-        - Pie charts
-        - Radar charts
-        - Sankey diagrams
-
-    5. Advanced Techniques:
-        - Dimensionality reduction
-        - Clustering and segmentation
-        - Time series decomposition
-        - Forecasting and prediction
-        - Machine learning integration
-        - Custom visual encoding
-        - Storytelling and narrative flow
+    CREATIVE OPTIONS: any Plotly chart type (lines, bars, scatter, area, histograms, box plots,
+    choropleth and bubble maps, subplots, secondary axes), annotations and reference lines, custom
+    hover and colors, statistical overlays, correlations, clustering, decomposition and forecasting.
     
     Syntax Reminder:
     - Use 'px' as the Plotly Express alias
@@ -261,8 +397,13 @@ def _generate_visualization_prompt(query: str) -> str:
     Be creative while maintaining exact syntax. The visualization should reveal key insights about the data. ONLY return valid, executable Python code.
     """
 
-def _verify_and_execute_code(code: str, data: pd.DataFrame, second_latest_data: pd.DataFrame) -> Tuple[Optional[go.Figure], str]:
-    """Verify and execute the visualization code."""
+def _verify_and_execute_code(code: str, data: pd.DataFrame, second_latest_data: pd.DataFrame,
+                             data_loader=None) -> Tuple[Optional[go.Figure], str]:
+    """Verify and execute the visualization code.
+
+    Code runs in the sandbox pool when one is available, which returns the
+    figure as a dict, and in this process otherwise.
+    """
     try:
         # Convert triple backticks if present
         if "```python" in code:
@@ -275,91 +416,167 @@ def _verify_and_execute_code(code: str, data: pd.DataFrame, second_latest_data:
                                if not line.strip().startswith('import') 
                                and not line.strip().startswith('from'))
         
-        # Create the globals dict with required imports
-        globals_dict = {
-            "pd": pd,
-            "px": px,
-            "go": go,
-            "Prophet": Prophet,
-            "LinearRegression": LinearRegression,
-            "train_test_split": train_test_split,
-            "mean_squared_error": mean_squared_error,
-            "sklearn": __import__('sklearn'),
-            "make_pipeline": __import__('sklearn.pipeline').pipeline.make_pipeline,
-            "PolynomialFeatures": __import__('sklearn.preprocessing').preprocessing.PolynomialFeatures,
-            "np": __import__('numpy'),
-            "data": data,  # Make data available in global scope
-            "second_latest_data": second_latest_data
-        }
-        
-        # Execute in a clean locals dict
-        locals_dict = {}
-        exec(cleaned_code, globals_dict, locals_dict)
-        
-        if "fig" not in locals_dict:
-            raise ValueError("Code did not generate a figure. Make sure your code creates a 'fig' variable.")
-            
-        return locals_dict["fig"], None
+        pool = get_sandbox(data, second_latest_data, data_loader)
+        start = time.perf_counter()
+        if pool is not None:
+            fig, error = pool.run(cleaned_code)
+            metrics.observe(metrics.exec_seconds, time.perf_counter() - start,
+                            mode="sandbox", outcome="error" if error else "ok")
+            return fig, f"Error executing code: {error}" if error else None
+
+        # Views of the shared frames: writes by the code stay in this run
+        outcome = "error"
+        try:
+            fig = run_code(cleaned_code, request_namespace(data, second_latest_data, data_loader, cleaned_code))
+            outcome = "ok"
+        finally:
+            metrics.observe(metrics.exec_seconds, time.perf_counter() - start,
+                            mode="in_process", outcome=outcome)
+        return fig, None
         
     except Exception as e:
         return None, f"Error executing code: {str(e)}"
 
+def _complete(stage: str, system: str, prompt: str, temperature: float,
+              calls: List[Dict[str, Any]]) -> str:
+    """One chat completion, with its token counts and latency appended to ``calls`` and the usage log."""
+    start = time.perf_counter()
+    response = _get_client().chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=temperature
+    )
+    call = {
+        "stage": stage,
+        "model": OPENAI_MODEL,
+        "prompt_chars": len(prompt),
+        **response_tokens(response),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    calls.append(call)
+    usage_log.record("call", call)
+    metrics.observe(metrics.stage_seconds, call["seconds"], stage=stage)
+    metrics.inc(metrics.llm_tokens, call["prompt_tokens"], stage=stage, kind="prompt")
+    metrics.inc(metrics.llm_tokens, call["completion_tokens"], stage=stage, kind="completion")
+    return response.choices[0].message.content.strip()
+
+
+def _record_request(start: float, calls: List[Dict[str, Any]], cached: bool, ok: bool,
+                    fast_path: bool = False) -> None:
+    """Log the end-to-end time and total tokens of one visualization request."""
+    metrics.observe(metrics.stage_seconds, time.perf_counter() - start, stage="total")
+    metrics.inc(metrics.visualization_requests,
+                outcome="fast_path" if fast_path else "cached" if cached else "ok" if ok else "error")
+    usage_log.record("request", {
+        "cached": cached,
+        "fast_path": fast_path,
+        "ok": ok,
+        "calls": len(calls),
+        "prompt_tokens": sum(call["prompt_tokens"] or 0 for call in calls),
+        "completion_tokens": sum(call["completion_tokens"] or 0 for call in calls),
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+
+
+def answer_directly(query: str, data_loader) -> Optional[Tuple[go.Figure, str, str]]:
+    """Answer a common question from the loader without the model, or None.
+
+    Rankings, metro trends and forecasts, and comparisons of the largest
+    metros are parsed locally and drawn in milliseconds; see
+    ``src.utils.intents``.
+    """
+    start = time.perf_counter()
+    with metrics.timer(metrics.stage_seconds, stage="route"):
+        answer = intents.route(query, data_loader)
+    if answer is not None:
+        _record_request(start, [], cached=False, ok=True, fast_path=True)
+    return answer
+
+
 def generate_custom_visualization(
-    query: str, data: pd.DataFrame, second_latest_data: pd.DataFrame
+    query: str, data: pd.DataFrame, second_latest_data: pd.DataFrame, data_loader=None,
+    progress: Optional[Callable[[str], None]] = None,
+    usage: Optional[List[Dict[str, Any]]] = None, fast_path: bool = True
 ) -> Tuple[Optional[Union[px.scatter_mapbox, px.scatter]], str, str]:
-    """Generate visualization using OpenAI's code generation and explanation."""
+    """Generate visualization using OpenAI's code generation and explanation.
+
+    Common questions are answered by ``answer_directly`` first, unless
+    ``fast_path`` is off because the caller already tried it. Successful
+    results are cached on disk per query, model and data version, so repeat
+    questions skip both model calls until new data is loaded. ``progress``
+    is called with each stage name as it starts, and the token counts and
+    latency of each model call are appended to ``usage``.
+    """
+    if fast_path and data_loader is not None:
+        answer = answer_directly(query, data_loader)
+        if answer is not None:
+            return answer
+    start = time.perf_counter()
+    progress = progress or (lambda stage: None)
+    calls = usage if usage is not None else []
+    data_version = getattr(data_loader, "data_version", None)
+    if data_version:
+        cached = viz_cache.get(query, OPENAI_MODEL, data_version)
+        if cached is not None:
+            _record_request(start, calls, cached=True, ok=True)
+            return cached
+
+    profile = data_loader.profile if data_loader is not None else ""
     try:
         # Get code from OpenAI
-        code_response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a data visualization expert."},
-                {"role": "user", "content": _generate_visualization_prompt(query)}
-            ],
-            temperature=0.1
+        progress("generating_code")
+        code = _complete(
+            "generate_code", "You are a data visualization expert.",
+            _generate_visualization_prompt(query, profile), 0.1, calls
         )
         
-        # Get the generated code
-        code = code_response.choices[0].message.content.strip()
-        
         # Execute the code
-        fig, error = _verify_and_execute_code(code, data, second_latest_data)
+        progress("executing")
+        fig, error = _verify_and_execute_code(code, data, second_latest_data, data_loader)
         if error:
+            _record_request(start, calls, cached=False, ok=False)
             return None, code, f"Error: {error}"
             
         # Get explanation
-        explanation_response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a real estate market analyst."},
-                {"role": "user", "content": _generate_explanation_prompt(
-                    query, code, data.head().to_string()
-                )}
-            ],
-            temperature=0.7
+        progress("explaining")
+        explanation = _complete(
+            "explain", "You are a real estate market analyst.",
+            _generate_explanation_prompt(query, code, profile), 0.7, calls
         )
         
-        return fig, code, explanation_response.choices[0].message.content.strip()
+        if data_version and fig is not None:
+            try:
+                viz_cache.put(query, OPENAI_MODEL, data_version, fig, code, explanation)
+            except OSError as e:
+                logger.warning("Could not cache visualization: %s", e)
+        _record_request(start, calls, cached=False, ok=True)
+        return fig, code, explanation
         
     except Exception as e:
         error_msg = str(e)
-        print(f"\nError in visualization generation: {error_msg}")
+        logger.exception("Error in visualization generation")
+        _record_request(start, calls, cached=False, ok=False)
         return None, code if 'code' in locals() else "", f"Error: {error_msg}"
 
-def _generate_explanation_prompt(query: str, code: str, data_preview: str) -> str:
-    """Generate the prompt for the explanation agent."""
+def _generate_explanation_prompt(query: str, code: str, profile: str) -> str:
+    """Generate the prompt for the explanation agent.
+
+    ``profile`` describes the loaded panel; the static column reference is
+    only sent when there is none.
+    """
     return f"""
     You are a real estate market analyst. Explain this visualization in business terms.
 
-    {_get_data_context()}
-
     Original Query: {query}
 
     Refined Visualization Code:
     {code}
 
-    Data Preview:
-    {data_preview}
+    Data Profile:
+    {profile or _get_data_context()}
 
     Provide an explanation that includes:
     1. What the visualization shows (metrics, timeframe, geographic scope)
@@ -0,0 +1,158 @@
+"""Persistent cache of AI-generated visualizations."""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from src.config import VIZ_CACHE_DIR, VIZ_CACHE_MAX_BYTES, VIZ_CACHE_TTL_SECONDS
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold a query and collapse whitespace and trailing punctuation."""
+    return re.sub(r"[\s?.!]+$", "", " ".join(query.casefold().split()))
+
+
+class VisualizationCache:
+    """Store generated code, figure JSON and explanation on disk.
+
+    Entries are keyed by the normalized query, the model and the data
+    version, and live in files prefixed with that version. The first time a
+    data version is seen, entries of versions this process does not serve
+    are deleted; a version replaced by a reload keeps its entries until
+    ``retire`` is called for it, so requests still running on it during a
+    swap do not delete the new version's entries or lose their own. Entries
+    expire after ``ttl_seconds``, and the least recently used ones are
+    evicted once the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory: str = VIZ_CACHE_DIR, max_bytes: int = VIZ_CACHE_MAX_BYTES,
+                 ttl_seconds: float = VIZ_CACHE_TTL_SECONDS):
+        """Create a cache rooted at ``directory``; nothing is written until ``put``."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._live_versions: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _path(self, query: str, model: str, data_version: str) -> str:
+        """File holding the entry for a query, model and data version."""
+        digest = hashlib.sha256(
+            json.dumps([normalize_query(query), model]).encode()
+        ).hexdigest()[:32]
+        return os.path.join(self.directory, f"{data_version}-{digest}.json")
+
+    def _observe_version(self, data_version: str) -> None:
+        """Drop entries of versions not served here when a new one shows up."""
+        with self._lock:
+            if data_version in self._live_versions:
+                return
+            self._live_versions.add(data_version)
+            live = set(self._live_versions)
+        self.invalidate(keep_versions=live)
+
+    def retire(self, data_version: str) -> None:
+        """Forget a replaced data version and delete its entries."""
+        with self._lock:
+            self._live_versions.discard(data_version)
+            live = set(self._live_versions)
+        self.invalidate(keep_versions=live)
+
+    def get(self, query: str, model: str,
+            data_version: str) -> Optional[Tuple[Dict[str, Any], str, str]]:
+        """Return (figure, code, explanation) for a cached query, or None.
+
+        The figure is the plain dict ``dcc.Graph`` accepts; rebuilding a
+        ``go.Figure`` would re-validate every trace and cost far more than
+        reading the file.
+        """
+        self._observe_version(data_version)
+        path = self._path(query, model, data_version)
+        try:
+            with open(path) as handle:
+                entry = json.load(handle)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if time.time() - entry["created"] > self.ttl_seconds:
+            self._remove(path)
+            self.misses += 1
+            return None
+        # Refresh the modification time so eviction is least recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry["figure"], entry["code"], entry["explanation"]
+
+    def put(self, query: str, model: str, data_version: str,
+            fig: go.Figure, code: str, explanation: str) -> None:
+        """Store a generated visualization, then enforce the size limit."""
+        self._observe_version(data_version)
+        entry = {
+            "query": query,
+            "model": model,
+            "data_version": data_version,
+            "created": time.time(),
+            "code": code,
+            "explanation": explanation,
+            "figure": json.loads(pio.to_json(fig, validate=False)),
+        }
+        path = self._path(query, model, data_version)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as handle:
+            json.dump(entry, handle)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self) -> Dict[str, os.stat_result]:
+        """Stat every cache file."""
+        entries = {}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                entries[path] = os.stat(path)
+            except OSError:
+                pass
+        return entries
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        """Delete a cache file, ignoring files already removed by another worker."""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """Remove expired entries, then the least recently used over the size limit."""
+        with self._lock:
+            now = time.time()
+            entries = self._entries()
+            for path, stat in list(entries.items()):
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path)
+                    del entries[path]
+            total = sum(stat.st_size for stat in entries.values())
+            for path, stat in sorted(entries.items(), key=lambda item: item[1].st_mtime):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= stat.st_size
+
+    def invalidate(self, keep_versions: Iterable[str] = ()) -> None:
+        """Delete every entry not built from one of ``keep_versions``."""
+        prefixes = tuple(f"{version}-" for version in keep_versions)
+        for path in self._entries():
+            if not os.path.basename(path).startswith(prefixes):
+                self._remove(path)
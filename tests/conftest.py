@@ -0,0 +1,20 @@
+"""Shared test setup and fixtures."""
+
+import pytest
+
+from benchmarks import synthetic
+from src.data import ingest, views
+from src.data.data_loader import DataLoader
+
+# As at app startup: views handed to generated code copy on write
+views.enable_copy_on_write()
+
+
+@pytest.fixture
+def loader(tmp_path):
+    """A DataLoader over a small synthetic panel."""
+    path = synthetic.panel_path(str(tmp_path))
+    ingest.write_panel(synthetic.make_panel(40, years=3), path)
+    data_loader = DataLoader(path, cache_dir=None)
+    data_loader.load_data()
+    return data_loader
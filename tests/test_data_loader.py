@@ -0,0 +1,342 @@
+"""Tests for ingesting and loading the panel."""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from src.data import cache, data_loader, forecast, ingest
+from src.data.data_loader import DataLoader
+from src.data.name_index import NameIndex
+from src.data.partitioned import PartitionedStore, write_level
+from src.data.versions import DatasetHandle
+from src.utils.table import filter_frame, page_frame, sort_frame, table_records
+
+
+def test_ingest_matches_synthetic_panel(tmp_path, caplog):
+    synthetic.write_wide_files(str(tmp_path), "metro", 25, years=2)
+    panel = ingest.build_panel(str(tmp_path), None)
+    # Without a coordinates source the map would be empty, so it is logged
+    assert "25 of 25 regions have no coordinates" in caplog.text
+    expected = synthetic.make_panel(25, years=2)
+    metrics = [col for col in expected.columns if col.startswith("Metro_")]
+    assert len(panel) == len(expected)
+    np.testing.assert_allclose(panel[metrics].to_numpy(dtype="float64"),
+                               expected[metrics].to_numpy(dtype="float64"), rtol=1e-9)
+
+
+def test_incremental_ingest_keeps_coordinates_without_coordinates_file(tmp_path):
+    source, output = str(tmp_path / "zillow"), str(tmp_path / "panel.csv")
+    manifest, coordinates = str(tmp_path / "manifest.json"), str(tmp_path / "coordinates.csv")
+    synthetic.write_wide_files(source, "metro", 20, years=1)
+    synthetic.make_coordinates(synthetic.make_regions("metro", 20)).to_csv(coordinates)
+    ingest.refresh_panel(source, output, manifest, coordinates)
+
+    # A later release adds months, and the coordinates file is gone
+    synthetic.write_wide_files(source, "metro", 20, years=2)
+    rows = ingest.refresh_panel(source, output, manifest, str(tmp_path / "missing.csv"))
+    assert len(rows) and rows["latitude"].notna().all() and rows["longitude"].notna().all()
+
+
+def test_incremental_ingest_merges_and_appends_months(tmp_path):
+    source, output = str(tmp_path / "zillow"), str(tmp_path / "panel.csv")
+    manifest = str(tmp_path / "manifest.json")
+    paths = synthetic.write_wide_files(source, "metro", 20, years=1)
+    wide = {metric: pd.read_csv(path) for metric, path in paths.items()}
+    lagging = sorted(wide)[0]
+
+    def release(months_missing, lagging_missing):
+        """Write the source files as a release missing its last months; return its dates."""
+        for metric, frame in wide.items():
+            drop = lagging_missing if metric == lagging else months_missing
+            frame.iloc[:, :frame.shape[1] - drop].to_csv(paths[metric], index=False)
+        dates = list(wide[lagging].columns[len(ingest.ID_COLUMNS):])
+        return dates[:len(dates) - months_missing]
+
+    def check(loader, dates):
+        stored = pd.read_csv(output).sort_values(ingest.KEY_COLUMNS).reset_index(drop=True)
+        expected = ingest.build_panel(source, None).sort_values(ingest.KEY_COLUMNS).reset_index(drop=True)
+        metrics = [col for col in expected.columns if col.startswith("Metro_")]
+        assert list(stored["Date"]) == list(expected["Date"].astype(str))
+        np.testing.assert_allclose(stored[metrics].to_numpy(dtype="float64"),
+                                   expected[metrics].to_numpy(dtype="float64"), rtol=1e-6)
+        assert ingest.load_manifest(manifest)["dates"] == dates
+
+        # The loaded version catches up from the update alone, as a reload would
+        updated = DataLoader(output, cache_dir=None)
+        assert updated.load_update(loader, manifest)
+        full = DataLoader(output, cache_dir=None)
+        full.load_data()
+        for got, want in [(updated.data, full.data),
+                          (updated.second_latest_data, full.second_latest_data)]:
+            pd.testing.assert_frame_equal(got.drop(columns="index", errors="ignore").reset_index(drop=True),
+                                          want.drop(columns="index", errors="ignore").reset_index(drop=True),
+                                          check_categorical=False)
+        return full
+
+    release(2, 3)
+    ingest.refresh_panel(source, output, manifest, None)
+    loader = DataLoader(output, cache_dir=None)
+    loader.load_data()
+
+    # The lagging file catches up on a stored month, so the store is merged
+    dates = release(1, 1)
+    assert ingest.refresh_panel(source, output, manifest, None)["Date"].nunique() == 2
+    loader = check(loader, dates)
+
+    # Every file gains a month the store has never seen, so rows are appended
+    dates = release(0, 0)
+    assert ingest.refresh_panel(source, output, manifest, None)["Date"].nunique() == 1
+    loader = check(loader, dates)
+
+    # The recorded update starts from an older version than the loaded one
+    assert ingest.refresh_panel(source, output, manifest, None).empty
+    assert not DataLoader(output, cache_dir=None).load_update(loader, manifest)
+
+
+def test_schema_survives_snapshot_round_trip(tmp_path, monkeypatch):
+    path = synthetic.panel_path(str(tmp_path))
+    ingest.write_panel(synthetic.make_panel(40, years=3), path)
+    parsed = DataLoader(path, cache_dir=str(tmp_path / "cache"))
+    parsed.load_data()
+    dtypes = parsed.data.dtypes
+    assert all(isinstance(dtypes[col], pd.CategoricalDtype) for col in ("RegionName", "StateName", "RegionType"))
+    assert (dtypes["RegionID"], dtypes["SizeRank"]) == ("int32", "int32")
+    assert pd.api.types.is_datetime64_any_dtype(dtypes["Date"])
+    assert dtypes["latitude"] == "float32" and dtypes["Metro_zhvi"] == "float32"
+    # Totals past float32's exact range keep float64
+    assert dtypes["Metro_total_transaction_value"] == "float64"
+
+    def no_csv(*args, **kwargs):
+        raise AssertionError("the snapshot should have been used")
+
+    monkeypatch.setattr(pd, "read_csv", no_csv)
+    mapped = DataLoader(path, cache_dir=str(tmp_path / "cache"))
+    mapped.load_data()
+    pd.testing.assert_frame_equal(mapped.data, parsed.data)
+    pd.testing.assert_frame_equal(mapped.second_latest_data, parsed.second_latest_data)
+
+    record = table_records(mapped.data.head(1))[0]
+    value = mapped.data["Metro_median_sale_price"].iloc[0]
+    assert record["Metro_median_sale_price"] == float(str(value)) != float(value)
+    assert record["Date"] == mapped.data["Date"].iloc[0].strftime("%Y-%m-%d")
+
+
+def test_snapshots_follow_the_source_file(tmp_path, caplog):
+    path = synthetic.panel_path(str(tmp_path))
+    ingest.write_panel(synthetic.make_panel(20, years=3), path)
+    cache_dir = str(tmp_path / "cache")
+    first = DataLoader(path, cache_dir=cache_dir)
+    first.load_data()
+    old_paths = list(first._snapshot_paths().values())
+
+    # A new modification time alone is a new version
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    touched = cache.fingerprint([path])
+    assert touched != first.data_version
+    # So is a new size, even with the modification time put back
+    with open(path, "a") as handle:
+        handle.write("\n")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.fingerprint([path]) not in (touched, first.data_version)
+
+    second = DataLoader(path, cache_dir=cache_dir)
+    second.load_data()
+    new_paths = list(second._snapshot_paths().values())
+    # Writing the new version's snapshot removes the old one
+    assert all(os.path.exists(p) for p in new_paths)
+    assert not any(os.path.exists(p) for p in old_paths)
+
+    # A damaged snapshot is ignored and rebuilt from the CSV
+    with open(new_paths[0], "r+b") as handle:
+        handle.truncate(64)
+    with caplog.at_level("WARNING", logger="src.data.cache"):
+        third = DataLoader(path, cache_dir=cache_dir)
+        third.load_data()
+    assert "unreadable snapshot" in caplog.text
+    pd.testing.assert_frame_equal(third.data, second.data)
+    assert cache.read_snapshot(third._snapshot_paths()) is not None
+
+
+def test_snapshot_holds_latest_value_as_of_date(loader):
+    date = loader.available_dates[len(loader.available_dates) // 2]
+    snapshot = loader.get_snapshot(date).set_index("RegionID")["Metro_zhvi"]
+    past = loader.data[loader.data["Date"] <= date].dropna(subset=["Metro_zhvi"])
+    expected = past.sort_values("Date").groupby("RegionID")["Metro_zhvi"].last()
+    pd.testing.assert_series_equal(snapshot.dropna().sort_index(), expected.sort_index(),
+                                   check_names=False, check_index_type=False)
+
+
+def test_rank_markets_orders_by_metric(loader):
+    top = loader.rank_markets("Metro_zhvi", n=5)
+    values = loader.second_latest_data["Metro_zhvi"].dropna().sort_values(ascending=False)
+    np.testing.assert_array_equal(top["Metro_zhvi"].to_numpy(), values.head(5).to_numpy())
+
+
+def test_partitioned_store_matches_loader(loader, tmp_path):
+    write_level(loader.data, str(tmp_path / "dataset"), "metro")
+    store = PartitionedStore(str(tmp_path / "dataset"), "metro")
+    date = loader.available_dates[-6]
+    expected = loader.get_snapshot(date).set_index("RegionID").sort_index()
+    snapshot = store.get_snapshot(date).set_index("RegionID").sort_index()
+    pd.testing.assert_frame_equal(snapshot[store.metrics], expected[store.metrics],
+                                  check_index_type=False)
+
+    top = store.rank_markets("Metro_zhvi", n=5, date=date, region="South")
+    expected_top = loader.rank_markets("Metro_zhvi", n=5, date=date, region="South")
+    assert list(top["RegionID"]) == list(expected_top["RegionID"])
+
+    query = str(loader.latest(loader.region_index.region_ids[3])["RegionName"])
+    assert list(store.search_metro(query)["Date"]) == list(loader.search_metro(query)["Date"])
+
+
+def test_partitioned_snapshot_only_scans_recent_months(loader, tmp_path):
+    date = loader.available_dates[-1]
+    stale, recent = loader.region_index.region_ids[:2]
+    panel = loader.data.copy()
+    # One region last reported just outside the window, another just inside
+    old = panel["Date"] > date - pd.DateOffset(months=13)
+    panel.loc[old & (panel["RegionID"] == stale), "Metro_zhvi"] = np.nan
+    panel.loc[(panel["Date"] > date - pd.DateOffset(months=11)) & (panel["RegionID"] == recent),
+              "Metro_zhvi"] = np.nan
+    write_level(panel, str(tmp_path / "dataset"), "metro")
+    store = PartitionedStore(str(tmp_path / "dataset"), "metro")
+
+    snapshot = store.get_snapshot(date, columns=["Metro_zhvi"]).set_index("RegionID")["Metro_zhvi"]
+    assert np.isnan(snapshot.get(stale, np.nan))
+    expected = panel[(panel["RegionID"] == recent) & panel["Metro_zhvi"].notna()]["Metro_zhvi"].iloc[0]
+    assert snapshot[recent] == expected
+
+
+def test_loader_opens_configured_store_levels(loader, tmp_path, monkeypatch):
+    write_level(loader.data, str(tmp_path / "dataset"), "metro")
+    monkeypatch.setattr(data_loader, "PARTITIONED_DATA_DIR", str(tmp_path / "dataset"))
+    monkeypatch.setattr(data_loader, "DATA_LEVELS", ["metro", "zip"])
+    # The ZIP level was never written, so only the metro store is offered
+    assert list(loader.stores) == ["metro"]
+    region_id = int(loader.region_index.region_ids[0])
+    assert loader.stores["metro"].latest(region_id)["Date"] == loader.latest(region_id)["Date"]
+
+
+def test_dataset_handle_retires_replaced_version_after_last_lease():
+    disk = {"key": "v1"}
+    retired = []
+    handle = DatasetHandle(lambda key, previous: {"version": key, "previous": previous},
+                           lambda: disk["key"], retired.append)
+    lease = handle.acquire()
+
+    disk["key"] = "v2"
+    assert not handle.reload()  # a new fingerprint must be seen twice
+    assert handle.reload()
+    assert handle.current == {"version": "v2", "previous": lease.value}
+    assert lease.value == {"version": "v1", "previous": None}
+    assert retired == []
+
+    lease.release()
+    assert retired == [{"version": "v1", "previous": None}]
+    assert handle.live_versions() == ["v2"]
+
+
+def test_linear_forecast_spaces_months_by_date():
+    dates = pd.date_range("2020-01-31", periods=30, freq=pd.offsets.MonthEnd()).to_numpy()
+    values = 1000.0 + 10.0 * np.arange(30)
+    # Six months missing mid-series must not shorten the time axis
+    keep = np.r_[0:12, 18:30]
+    predicted, lower, upper = forecast.fit_linear(dates[keep], values[keep], 3, 0.8)
+    np.testing.assert_allclose(predicted, [1300.0, 1310.0, 1320.0])
+    assert np.all(lower <= predicted) and np.all(predicted <= upper)
+
+
+def test_build_forecasts_trains_up_to_second_latest_month(loader):
+    table = forecast.build_forecasts(loader.data, loader.region_index, ["Metro_zhvi"],
+                                     model="linear", horizon=3, workers=1)
+    dates = loader.available_dates
+    # The latest month is left out of training, so no forecast reaches past
+    # the second latest month plus the horizon
+    assert table["Date"].max() == dates[-2] + pd.offsets.MonthEnd(3)
+    assert table.groupby("RegionID")["Date"].min().mode()[0] == dates[-1]
+
+    forecasts = forecast.ForecastTable(table)
+    region_ids = [int(region_id) for region_id in loader.region_index.region_ids[:3]]
+    metric, region_id, series_dates, values = forecast.training_series(
+        loader.data, loader.region_index, ["Metro_zhvi"], dates[-2])[0]
+    expected = forecast.fit_linear(series_dates, values, 3, forecast.FORECAST_INTERVAL_WIDTH)[0]
+    np.testing.assert_allclose(forecasts.lookup(metric, region_id)["forecast"], expected)
+
+    matrix = forecasts.matrix("Metro_zhvi", region_ids + [-1])
+    assert matrix.shape == (len(forecasts.dates), 4) and np.isnan(matrix[:, -1]).all()
+    for column, region_id in enumerate(region_ids):
+        rows = forecasts.lookup("Metro_zhvi", region_id)
+        np.testing.assert_allclose(matrix[forecasts.dates.get_indexer(rows["Date"]), column], rows["forecast"])
+        assert np.isnan(matrix[:, column]).sum() == len(forecasts.dates) - len(rows)
+    assert forecasts.lookup("Metro_zhvi", -1).empty
+
+
+def test_dataset_watcher_is_checked_once_per_interval():
+    handle = DatasetHandle(lambda key, previous: key, lambda: "v1")
+    handle.watch(60)
+    first = handle._watcher
+    handle.stop()
+    assert not first.is_alive()
+
+    # Requests within the interval skip the check entirely
+    handle.watch(60)
+    assert handle._watcher is first
+    pid, checked_at = handle._checked
+    handle._checked = (pid, checked_at - 61)
+    handle.watch(60)
+    assert handle._watcher is not first and handle._watcher.is_alive()
+    handle.stop()
+
+
+def test_table_filter_grammar_and_paging():
+    frame = pd.DataFrame({
+        "RegionName": ["Austin, TX", "Boston, MA", "Dallas, TX", "Denver, CO", "El Paso, TX"],
+        "StateName": pd.Categorical(["TX", "MA", "TX", "CO", "TX"]),
+        "Date": pd.to_datetime(["2024-01-31", "2024-02-29", "2023-12-31", "2024-01-31", "2024-02-29"]),
+        "Metro_zhvi": [450000.0, 650000.0, np.nan, 550000.0, 250000.0],
+    })
+
+    def names(result):
+        return list(result["RegionName"])
+
+    assert names(filter_frame(frame, "{Metro_zhvi} ge 450000")) == ["Austin, TX", "Boston, MA", "Denver, CO"]
+    assert names(filter_frame(frame, "{Metro_zhvi} < 450000")) == ["El Paso, TX"]
+    assert names(filter_frame(frame, "{RegionName} contains 'paso'")) == ["El Paso, TX"]
+    assert names(filter_frame(frame, "{StateName} = TX && {Metro_zhvi} gt 300000")) == ["Austin, TX"]
+    assert names(filter_frame(frame, "{Date} datestartswith '2024-02'")) == ["Boston, MA", "El Paso, TX"]
+    assert names(filter_frame(frame, "{Date} lt 2024-01-31")) == ["Dallas, TX"]
+    assert names(filter_frame(frame, '{RegionName} eq "Boston, MA"')) == ["Boston, MA"]
+    # Unknown columns and clauses that do not parse are ignored
+    assert len(filter_frame(frame, "{Missing} eq 1 && {Metro_zhvi} ge")) == len(frame)
+
+    ordered = sort_frame(frame, [{"column_id": "Metro_zhvi", "direction": "desc"}])
+    assert names(ordered)[0] == "Boston, MA" and names(ordered)[-1] == "Dallas, TX"
+
+    page, page_count = page_frame(frame, 1, 2)
+    assert page_count == 3 and names(page) == ["Dallas, TX", "Denver, CO"]
+    # Pages past either end show the nearest page
+    assert names(page_frame(frame, 9, 2)[0]) == ["El Paso, TX"]
+    assert names(page_frame(frame, -1, 2)[0]) == ["Austin, TX", "Boston, MA"]
+    assert page_frame(frame.iloc[:0], 0, 2)[1] == 1
+
+
+def test_name_index_search_and_state_disambiguation():
+    index = NameIndex(
+        [1, 2, 3, 4, 5],
+        ["Fayetteville, AR", "Fayetteville, NC", "Portland, OR", "Portland, ME", "New York, NY"],
+        ["AR", "NC", "OR", "ME", "NY"],
+    )
+    assert list(index.search("fayetteville")) == [1, 2]
+    assert list(index.search("  PORTLAND,   me ")) == [4]
+    # A state code without the comma narrows to that state
+    assert list(index.search("Fayetteville NC")) == [2]
+    assert list(index.search("Portland TX")) == []
+    assert list(index.search("york")) == [5]
+    assert list(index.search("")) == []
+
+    assert index.complete("port") == ["Portland, ME", "Portland, OR"]
+    assert index.complete("y") == ["New York, NY"]
+    assert index.complete("fay", limit=1) == ["Fayetteville, AR"]
@@ -0,0 +1,470 @@
+"""Tests for running generated visualization code."""
+
+import copy
+import gzip
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from benchmarks import synthetic
+from src.data import ingest
+from src.data.data_loader import DataLoader
+from src.data.views import request_namespace
+from src.utils.intents import route
+from src.utils import visualization
+from src.utils.jobs import JobQueue, JobStore
+from src.utils.llm_usage import UsageLog
+from src.utils.map_payload import MapPayload
+from src.utils.metrics import Registry
+from src.utils.sandbox import SandboxPool, Spawner, run_code
+from src.utils.viz_cache import VisualizationCache
+
+# Generated code in the style the model tends to write, including the
+# in-place conversions and edits that used to corrupt the shared frame
+MUTATING_CODE = """
+data['Date'] = pd.to_datetime(data['Date']).dt.year
+data['Metro_zhvi'] = data['Metro_zhvi'] * 2
+data.loc[data.index[0], 'Metro_market_temp_index'] = -1
+data.drop(columns=['SizeRank'], inplace=True)
+second_latest_data.sort_values('Metro_zhvi', inplace=True)
+second_latest_data['Metro_zhvi'] += 1
+data_loader.data['RegionName'] = 'overwritten'
+snapshot = data_loader.get_snapshot()
+snapshot['Metro_zhvi'] = 0
+fig = px.scatter(title=str(data['Metro_zhvi'].sum() + second_latest_data['Metro_zhvi'].iloc[0]))
+"""
+
+
+def test_views_share_memory(loader):
+    namespace = request_namespace(loader.data, loader.second_latest_data, loader)
+    for col in loader.data.columns:
+        view, shared = namespace["data"][col], loader.data[col]
+        if isinstance(shared.dtype, pd.CategoricalDtype):
+            view, shared = view.array.codes, shared.array.codes
+        assert np.shares_memory(np.asarray(view), np.asarray(shared))
+    assert namespace["data_loader"].data is not loader.data
+
+
+def test_concurrent_runs_are_isolated(loader):
+    original = loader.data.copy(deep=True)
+    original_second = loader.second_latest_data.copy(deep=True)
+
+    def run(_):
+        namespace = request_namespace(loader.data, loader.second_latest_data, loader)
+        return run_code(MUTATING_CODE, namespace).layout.title.text
+
+    # The answer of a run on private deep copies of the data
+    private = copy.copy(loader)
+    private.data, private.second_latest_data = original.copy(), original_second.copy()
+    expected = run_code(MUTATING_CODE, {
+        "data": original.copy(),
+        "second_latest_data": original_second.copy(),
+        "data_loader": private,
+    }).layout.title.text
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        titles = list(executor.map(run, range(200)))
+
+    # Every run saw only its own writes, so all agree with the private run
+    assert set(titles) == {expected}
+
+    # And none of them reached the shared frames
+    pd.testing.assert_frame_equal(loader.data, original)
+    pd.testing.assert_frame_equal(loader.second_latest_data, original_second)
+    pd.testing.assert_frame_equal(loader.get_snapshot(), original_second)
+
+
+def test_derived_columns_match_groupby(loader):
+    code = "fig = px.line(data, x='Date', y='Metro_zhvi_mom')"
+    namespace = request_namespace(loader.data, loader.second_latest_data, loader, code)
+    assert "Metro_zhvi_mom" in namespace["data"] and "Metro_zhvi_roll3" not in namespace["data"]
+    assert "Metro_zhvi_mom" not in loader.data
+
+    oldest_first = loader.data.sort_values(["RegionID", "Date"]).astype({"Metro_zhvi": "float64"})
+    grouped = oldest_first.groupby("RegionID")["Metro_zhvi"]
+    expected = pd.DataFrame({
+        "Metro_zhvi_mom": grouped.pct_change() * 100,
+        "Metro_zhvi_roll3": grouped.rolling(3).mean().reset_index(level=0, drop=True),
+    }).reindex(loader.data.index)
+    for name in expected:
+        np.testing.assert_allclose(loader.derived.column(name), expected[name], rtol=1e-5)
+    run_code(code, namespace)
+
+
+def test_common_questions_are_answered_without_the_model(tmp_path):
+    path = synthetic.panel_path(str(tmp_path))
+    ingest.write_panel(synthetic.make_panel(40, years=3), path)
+    loader = DataLoader(path, cache_dir=None)
+    loader.load_data()
+
+    fig, code, explanation = route("Show me the 5 hottest real estate markets right now", loader)
+    expected = loader.get_hottest_markets(6)
+    expected = expected[expected["RegionType"] != "country"].head(5)
+    assert list(fig.data[0].y) == list(expected["RegionName"])
+    assert "rank_markets('Metro_market_temp_index', n=5)" in code
+
+    fig, _, _ = route("most expensive cities", loader)
+    expected = loader.rank_markets("Metro_zhvi", n=11)
+    assert list(fig.data[0].y) == list(expected[expected["RegionType"] != "country"].head(10)["RegionName"])
+    assert "ascending=True" in route("most affordable metros", loader)[1]
+
+    growth = route("Which cities have the highest price growth rate?", loader)[0]
+    top = loader.rank_markets("Metro_zhvi_yoy", n=1)
+    assert growth.data[0].y[0] == top["RegionName"].iloc[0]
+
+    name = str(loader.latest(loader.region_index.region_ids[3])["RegionName"])
+    fig, _, _ = route(f"Compare home prices in {name.split(',')[0]} over the last 2 years", loader)
+    history = loader.history(name, start=loader.available_dates[-1] - pd.DateOffset(years=2))
+    np.testing.assert_allclose(fig.data[0].y, history["Metro_zhvi"].dropna().to_numpy()[::-1])
+
+    # Anything not fully understood goes to the model
+    assert route("Plot rent against inventory colored by region", loader) is None
+    assert route("Home prices in Atlantis over the last 2 years", loader) is None
+    # So do months before the data starts
+    assert route(f"hottest markets in {loader.available_dates[0].year - 1}", loader) is None
+
+
+@pytest.fixture
+
+
+def named_loader(tmp_path):
+    """A DataLoader over metros whose names collide across states."""
+    names = ["Portland, OR", "Portland, ME", "Key West, FL", "Springfield, IL",
+             "Springfield, MO", "Boston, MA", "New York, NY"]
+    dates = pd.date_range("2023-01-31", periods=12, freq=pd.offsets.MonthEnd())
+    rows = [{
+        "RegionID": region_id,
+        "SizeRank": region_id,
+        "RegionName": name,
+        "RegionType": "msa",
+        "StateName": name[-2:],
+        "Date": date.strftime("%Y-%m-%d"),
+        "Metro_zhvi": 100000.0 * region_id + i,
+    } for region_id, name in enumerate(names, start=1) for i, date in enumerate(dates)]
+    path = tmp_path / "panel.csv"
+    pd.DataFrame(rows).to_csv(path, index=False)
+    data_loader = DataLoader(str(path), cache_dir=None)
+    data_loader.load_data()
+    return data_loader
+
+
+def test_state_codes_pick_between_metros_sharing_a_name(named_loader):
+    fig, _, _ = route("Show home prices in Portland, ME", named_loader)
+    assert [trace.name for trace in fig.data] == ["Portland, ME"]
+    assert fig.data[0].y[-1] == named_loader.latest("Portland, ME")["Metro_zhvi"]
+
+    fig, _, _ = route("Compare home prices in Portland, OR and Portland, ME", named_loader)
+    assert [trace.name for trace in fig.data] == ["Portland, OR", "Portland, ME"]
+
+    fig, _, _ = route("home prices in Springfield, MO since 2023", named_loader)
+    assert [trace.name for trace in fig.data] == ["Springfield, MO"]
+
+
+def test_ambiguous_places_go_to_the_model(named_loader):
+    # Several metros share the name and no state says which
+    assert route("Show home prices in Portland", named_loader) is None
+    assert route("Show home prices in Springfield", named_loader) is None
+    # Regions and states are not metros, however their names match
+    assert route("Show me home prices in the West", named_loader) is None
+    assert route("Compare home prices in Boston and the South", named_loader) is None
+    assert route("Show home prices in Oregon", named_loader) is None
+    assert [trace.name for trace in route("home prices in Key West", named_loader)[0].data] == ["Key West, FL"]
+    # A state name that is also exactly a metro's name is that metro
+    assert [trace.name for trace in route("home values in New York", named_loader)[0].data] == ["New York, NY"]
+
+
+def test_visualization_cache_keeps_both_versions_during_a_swap(tmp_path):
+    cache = VisualizationCache(str(tmp_path))
+    fig = {"data": [], "layout": {}}
+    cache.put("hottest markets", "model", "v1", fig, "code v1", "old")
+    cache.put("hottest markets", "model", "v2", fig, "code v2", "new")
+    # Jobs on the old version and requests on the new one interleave
+    for _ in range(3):
+        assert cache.get("hottest markets", "model", "v1")[1] == "code v1"
+        assert cache.get("Hottest markets?", "model", "v2")[1] == "code v2"
+
+    cache.retire("v1")
+    assert cache.get("hottest markets", "model", "v1") is None
+    assert cache.get("hottest markets", "model", "v2")[1] == "code v2"
+
+
+def test_visualization_cache_keys_expiry_and_eviction(tmp_path, monkeypatch):
+    cache = VisualizationCache(str(tmp_path), ttl_seconds=60)
+    fig = {"data": [], "layout": {"title": {"text": "x" * 1000}}}
+    cache.put("Top metros by rent", "model", "v1", fig, "code", "why")
+    assert cache.get("  top METROS by   rent?! ", "model", "v1")[1] == "code"
+    assert cache.get("top metros by rent", "other model", "v1") is None
+    assert cache.get("top metros by rent", "model", "v2") is None
+
+    # Entries expire by the time they were created
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("top metros by rent", "model", "v2") is None
+    assert cache.get("top metros by rent", "model", "v1") is None
+    assert not os.listdir(tmp_path)
+    monkeypatch.undo()
+
+    # Past the size limit the least recently used entries go first
+    cache = VisualizationCache(str(tmp_path / "small"))
+    for age, query in enumerate(["a", "b", "c"]):
+        cache.put(query, "model", "v1", fig, query, "")
+        path = cache._path(query, "model", "v1")
+        os.utime(path, (now - 100 + age, now - 100 + age))
+    cache.get("a", "model", "v1")
+    cache.max_bytes = 2 * os.path.getsize(path) + 10
+    cache.evict()
+    assert [cache.get(query, "model", "v1") is not None for query in "abc"] == [True, False, True]
+
+
+def test_prompts_carry_the_profile_and_requests_are_recorded(loader, tmp_path, monkeypatch):
+    profile = loader.profile
+    dates = loader.available_dates
+    assert profile.splitlines()[0] == (
+        f"{len(loader.data):,} monthly rows for {len(loader.region_index)} metros, "
+        f"{dates[0]:%Y-%m} to {dates[-1]:%Y-%m}; second latest month (use for analysis): {dates[-2]:%Y-%m-%d}")
+    present = loader.data.dropna(subset=["Metro_zhvi"])
+    low, median, high = np.percentile(present["Metro_zhvi"].astype("float64"), [0, 50, 100])
+    assert (f"- Metro_zhvi: {present['Date'].min():%Y-%m} to {present['Date'].max():%Y-%m} | "
+            f"{present['RegionID'].nunique()} metros | {low:,.0f} / {median:,.0f} / {high:,.0f}") in profile
+    states = sorted(loader.data["StateName"].dropna().unique())
+    assert profile.endswith(f"States ({len(states)}): {', '.join(states)}")
+
+    prompts = []
+    replies = iter(["```python\nfig = px.bar(x=['a'], y=[1])\n```", "An explanation."])
+
+    def create(model, messages, temperature):
+        prompts.append(messages[1]["content"])
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=10),
+                               choices=[SimpleNamespace(message=SimpleNamespace(content=next(replies)))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(visualization, "_get_client", lambda: client)
+    monkeypatch.setattr(visualization, "get_sandbox", lambda *args: None)
+    monkeypatch.setattr(visualization, "viz_cache", VisualizationCache(str(tmp_path / "viz")))
+    log = UsageLog(str(tmp_path / "usage.jsonl"))
+    monkeypatch.setattr(visualization, "usage_log", log)
+
+    for _ in range(2):
+        fig, _, explanation = visualization.generate_custom_visualization(
+            "Plot something unusual", loader.data, loader.second_latest_data, loader, fast_path=False)
+        assert explanation == "An explanation."
+    code_prompt, explain_prompt = prompts
+    assert profile in code_prompt and "print(" not in code_prompt
+    assert profile in explain_prompt and "Dataset Structure" not in explain_prompt
+
+    entries = log.read()
+    assert [(entry["kind"], entry.get("stage")) for entry in entries] == [
+        ("call", "generate_code"), ("call", "explain"), ("request", None), ("request", None)]
+    first, repeat = entries[2:]
+    assert (first["calls"], first["prompt_tokens"], first["completion_tokens"], first["cached"]) == (2, 200, 20, False)
+    assert (repeat["calls"], repeat["prompt_tokens"], repeat["cached"]) == (0, 0, True)
+
+
+def test_usage_log_rotates_at_its_size_cap(tmp_path):
+    log = UsageLog(str(tmp_path / "usage.jsonl"), max_bytes=200)
+    for i in range(20):
+        log.record("call", {"stage": "explain", "index": i})
+    assert os.path.getsize(log.path) < 200 and os.path.getsize(log.previous_path) < 300
+    indexes = [entry["index"] for entry in log.read()]
+    # Only the newest entries are kept, in order
+    assert indexes == list(range(20 - len(indexes), 20)) and len(indexes) < 20
+
+
+def test_map_payload_is_versioned_and_revalidated():
+    latest = synthetic.make_panel(30, years=1).groupby("RegionID").head(1)
+    payload = MapPayload(latest, "v1")
+    assert MapPayload(latest, "v2").version != payload.version
+
+    def serve(**headers):
+        return payload.response(Request(EnvironBuilder(headers=headers).get_environ()))
+
+    plain = serve()
+    assert plain.status_code == 200 and plain.headers["ETag"] == payload.etag
+    assert json.loads(plain.get_data())["data"]
+    zipped = serve(**{"Accept-Encoding": "gzip, br"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    assert serve(**{"If-None-Match": payload.etag}).status_code == 304
+
+
+def test_job_store_validates_ids_and_purges_old_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs"))
+    for job_id in ["../../etc/passwd", "ABC", "", None, "0" * 31]:
+        assert store.status(job_id) is None and store.result(job_id) is None
+    with pytest.raises(ValueError):
+        store._path("../" + "0" * 32)
+
+    def job(value, progress):
+        progress("work")
+        return {"value": value}
+
+    job_id = JobQueue(store, max_workers=1).submit("test", job, 3)
+    for _ in range(100):
+        if store.status(job_id)["status"] == "done":
+            break
+        time.sleep(0.01)
+    assert [stage["name"] for stage in store.status(job_id)["stages"]] == ["work"]
+    assert store.result(job_id) == {"value": 3}
+
+    fresh = store.create("test")
+    old = time.time() - 120
+    for name in os.listdir(store.directory):
+        if name.startswith(job_id):
+            os.utime(os.path.join(store.directory, name), (old, old))
+    store.purge(max_age=60)
+    assert store.status(job_id) is None and store.result(job_id) is None
+    assert store.status(fresh["id"])["status"] == "queued"
+
+    # A job whose worker process is gone is reported as failed, not running
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    orphan = store.create("test")
+    store.update(orphan, status="running", owner=process.pid)
+    assert store.status(orphan["id"])["status"] == "error"
+    assert store.status(orphan["id"])["error"].startswith("The worker running this job stopped")
+
+
+def _run_app_script(tmp_path, script: str, **env):
+    """Run ``script`` in a fresh interpreter over a synthetic panel; return its JSON output.
+
+    The app loads its data when imported, so it runs with ``tmp_path`` as the
+    working directory, where its caches are written. ``env`` overrides the
+    environment, which by default turns off the sandbox and the reload watcher.
+    """
+    path = synthetic.panel_path(str(tmp_path))
+    ingest.write_panel(synthetic.make_panel(40, years=3), path)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, PROCESSED_DATA_PATH=path,
+               **dict({"SANDBOX_POOL_SIZE": "0", "DATA_RELOAD_INTERVAL_SECONDS": "0"}, **env))
+    result = subprocess.run([sys.executable, "-c", script], cwd=str(tmp_path), env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_importing_the_app_leaves_analytics_libraries_unloaded(tmp_path):
+    loaded = _run_app_script(tmp_path, """
+import json, sys
+import src.app
+print(json.dumps(sorted(name for name in ("prophet", "sklearn", "matplotlib", "openai")
+                        if name in sys.modules)))
+""")
+    assert loaded == []
+
+
+def test_gunicorn_hooks_share_the_preloaded_data(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    state = _run_app_script(tmp_path, f"""
+import gc, json, runpy
+from types import SimpleNamespace
+import src.app as dashboard
+from src.utils import sandbox, visualization
+
+hooks = runpy.run_path({os.path.join(root, "gunicorn.conf.py")!r})
+server = SimpleNamespace(log=None)
+loader = dashboard.dataset.current.loader
+hooks["when_ready"](server)
+state = {{"frozen": gc.get_freeze_count(), "master_pools": len(visualization._sandboxes),
+          "master_spawner": sandbox._spawner is not None,
+          "warm": loader.derived is not None and loader._profile is not None}}
+# The master's spawner was stopped, so a worker forks its own over the shared data
+hooks["post_fork"](server, SimpleNamespace(pid=0))
+pool = visualization._sandboxes[id(loader.data)][2]
+state["worker_result"] = pool.run("fig = px.scatter(title=str(len(data)))")
+state["rows"] = len(loader.data)
+visualization.close_sandbox()
+print(json.dumps(state))
+""", SANDBOX_POOL_SIZE="1")
+    assert state["frozen"] > 0 and state["warm"]
+    assert state["master_pools"] == 0 and not state["master_spawner"]
+    figure, error = state["worker_result"]
+    assert error is None and figure["layout"]["title"]["text"] == str(state["rows"])
+
+
+def test_map_callback_patches_only_what_changed(tmp_path):
+    responses = _run_app_script(tmp_path, """
+import json
+import src.app as dashboard
+from benchmarks.app_callbacks import _payload
+client = dashboard.app.server.test_client()
+inputs = {("map-metric", "value"): "Metro_zhvi", ("map-date", "value"): 10}
+responses = {}
+for changed in ("map-metric", "map-date"):
+    body = _payload(dashboard.app, "update_map", inputs, {}, (changed, "value"))
+    responses[changed] = client.post("/_dash-update-component", json=body).get_json()["response"]
+print(json.dumps(responses))
+""")
+    for changed, locations in [
+        ("map-metric", [["data", 0, "marker", "color"]]),
+        ("map-date", [["data", 0, "marker", "color"], ["data", 0, "customdata"]]),
+    ]:
+        figure = responses[changed]["main-map"]["figure"]
+        assert "__dash_patch_update" in figure
+        assigned = [op["location"] for op in figure["operations"] if op["location"][0] == "data"]
+        assert assigned == locations
+    assert responses["map-metric"]["map-date-label"] == responses["map-date"]["map-date-label"]
+
+
+def test_metrics_exposition_format():
+    registry = Registry(enabled=True)
+    requests = registry.counter("requests_total", "Requests.", ["path"])
+    requests.inc(path='/a"b\\c')
+    requests.inc(2, path='/a"b\\c')
+    latency = registry.histogram("latency_seconds", "Latency.", ["stage"], buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, stage="run")
+    registry.collector("cache_hits_total", "Hits.", "counter", lambda: [({"cache": "viz"}, 4)])
+    assert registry.counter("requests_total", "Again.") is requests
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{path="/a\\"b\\\\c"} 3',
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="run",le="0.1"} 2',
+        'latency_seconds_bucket{stage="run",le="1"} 3',
+        'latency_seconds_bucket{stage="run",le="+Inf"} 4',
+        'latency_seconds_sum{stage="run"} 3.65',
+        'latency_seconds_count{stage="run"} 4',
+        "# HELP cache_hits_total Hits.",
+        "# TYPE cache_hits_total counter",
+        'cache_hits_total{cache="viz"} 4',
+    ]
+
+
+def test_timed_out_run_is_killed_and_the_pool_keeps_serving():
+    spawner = Spawner({"test": lambda code: {"title": "served"}})
+    pool = SandboxPool("test", size=1, timeout=1, memory_limit_mb=0, spawner=spawner)
+    try:
+        fig, error = pool.run("fig = px.scatter(title=title)")
+        assert error is None and fig["layout"]["title"]["text"] == "served"
+        (stuck,) = pool._workers
+
+        fig, error = pool.run("while True:\n    pass")
+        assert fig is None and "longer than 1 seconds" in error
+        assert stuck not in pool._workers
+        for _ in range(50):
+            try:
+                os.kill(stuck.pid, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.1)
+        else:
+            pytest.fail("timed-out worker is still running")
+
+        fig, error = pool.run("fig = px.scatter(title=title)")
+        assert error is None and fig["layout"]["title"]["text"] == "served"
+    finally:
+        pool.close()
+        spawner.close()